@@ -1,5 +1,7 @@
 #include <stdint.h>
 #include <stdio.h>
+#include <string.h>
+#include <time.h>
 
 #include "octv.h"
 
@@ -20,12 +22,138 @@ static const OctvMoment octv_moment = { OCTV_MOMENT_TYPE, { 0, 0, 0 }, 0 };
 static const OctvTick octv_tick = { OCTV_TICK_TYPE, 0 };
 
 
+// tracing, see octv.h, without OCTV_TRACE the trace points compile to nothing
+static OctvTraceEvent octv_trace_ring[OCTV_TRACE_RING_SIZE];
+static uint64_t octv_trace_sequence = 0;
+static int octv_trace_level = OCTV_TRACE_DEBUG;
+
+#ifdef OCTV_TRACE
+static
+void octv_trace_event(int level, const char * name, uint64_t arg0, uint64_t arg1) {
+  if( level < octv_trace_level ) return;
+  const uint64_t sequence = __atomic_fetch_add(&octv_trace_sequence, 1, __ATOMIC_RELAXED);
+  OctvTraceEvent * event = &octv_trace_ring[sequence % OCTV_TRACE_RING_SIZE];
+  event->sequence = sequence;
+  event->name = name;
+  event->arg0 = arg0;
+  event->arg1 = arg1;
+  event->level = level;
+}
+#define OCTV_TRACE_EVENT(level, name, arg0, arg1)  octv_trace_event((level), (name), (uint64_t)(uintptr_t)(arg0), (uint64_t)(uintptr_t)(arg1))
+#else
+#define OCTV_TRACE_EVENT(level, name, arg0, arg1)  ((void)0)
+#endif
+
+int octv_trace_compiled(void) {
+#ifdef OCTV_TRACE
+  return 1;
+#else
+  return 0;
+#endif
+}
+
+int octv_trace_set_level(int level) {
+  const int previous = octv_trace_level;
+  octv_trace_level = level;
+  return previous;
+}
+
+uint64_t octv_trace_next_sequence(void) {
+  return __atomic_load_n(&octv_trace_sequence, __ATOMIC_RELAXED);
+}
+
+// events recorded while reading may be torn, read between parse calls
+size_t octv_trace_read(uint64_t sequence, OctvTraceEvent * events, size_t max_events) {
+  const uint64_t next = octv_trace_next_sequence();
+  // older events have been overwritten
+  if( next > OCTV_TRACE_RING_SIZE && sequence < next - OCTV_TRACE_RING_SIZE ) sequence = next - OCTV_TRACE_RING_SIZE;
+
+  size_t num_events = 0;
+  for( ; sequence < next && num_events < max_events; ++sequence, ++num_events ) {
+    events[num_events] = octv_trace_ring[sequence % OCTV_TRACE_RING_SIZE];
+  }
+  return num_events;
+}
+
+
+// parse statistics, see octv.h, attached per thread
+static _Thread_local OctvParseStats * octv_parse_stats = NULL;
+
+OctvParseStats * octv_parse_stats_attach(OctvParseStats * stats) {
+  OctvParseStats * const previous = octv_parse_stats;
+  octv_parse_stats = stats;
+  return previous;
+}
+
+static inline
+uint64_t octv_stats_now_ns(void) {
+  struct timespec now;
+  clock_gettime(CLOCK_MONOTONIC, &now);
+  return (uint64_t)now.tv_sec * 1000000000 + now.tv_nsec;
+}
+
+// count the payloads that were read
+static inline
+void octv_stats_payloads(const OctvPayload * payloads, int num_payloads) {
+  OctvParseStats * const stats = octv_parse_stats;
+  if( stats == NULL ) return;
+  for( int index = 0; index < num_payloads; ++index ) {
+    ++stats->terminals_by_type[payloads[index].type];
+  }
+  stats->bytes_consumed += num_payloads * sizeof(OctvPayload);
+}
+
+// count an error passed to an error_cb
+static inline
+void octv_stats_error(int code) {
+  OctvParseStats * const stats = octv_parse_stats;
+  if( stats == NULL ) return;
+  ++stats->errors_by_code[code & 7];
+}
+
+// assign code from call, a callback, timing it when stats are attached
+#define OCTV_STATS_CALLBACK(code, call)  do { \
+    OctvParseStats * const stats_ = octv_parse_stats; \
+    if( stats_ == NULL ) { \
+      code = (call); \
+    } \
+    else { \
+      const uint64_t start_ns_ = octv_stats_now_ns(); \
+      code = (call); \
+      stats_->callback_ns += octv_stats_now_ns() - start_ns_; \
+    } \
+  } while( 0 )
+
+// the internal callbacks of the flat and filter parsers, which time the client's callbacks themselves
+static int error_flat_cb(int error_code, OctvPayload * payload, void * user_data);
+static int error_filter_cb(int error_code, OctvPayload * payload, void * user_data);
+
+// whether parse_class_cbs are the client's, rather than a flat or filter parser's
+static inline
+int octv_class_cbs_client(const OctvParseClass * parse_class_cbs) {
+  return parse_class_cbs->error_cb != error_flat_cb && parse_class_cbs->error_cb != error_filter_cb;
+}
+
+// like OCTV_STATS_CALLBACK, for a call to one of parse_class_cbs, timed only if it's the client's
+#define OCTV_STATS_CLASS_CALLBACK(code, parse_class_cbs, call)  do { \
+    if( octv_class_cbs_client(parse_class_cbs) ) { \
+      OCTV_STATS_CALLBACK(code, call); \
+    } \
+    else { \
+      code = (call); \
+    } \
+  } while( 0 )
+
+
 // error condition, see what client wants to do
 static
 int octv_error(int code, OctvPayload * payload, const OctvParseClass * parse_class_cbs) {
-  return parse_class_cbs != NULL && parse_class_cbs->error_cb != NULL
-    ? parse_class_cbs->error_cb(code, payload, parse_class_cbs->user_data)
-    : code;
+  OCTV_TRACE_EVENT(OCTV_TRACE_ERROR, "octv_error", code, payload != NULL ? payload->type : 0);
+  octv_stats_error(code);
+  if( parse_class_cbs == NULL || parse_class_cbs->error_cb == NULL ) return code;
+  int error_code;
+  OCTV_STATS_CLASS_CALLBACK(error_code, parse_class_cbs, parse_class_cbs->error_cb(code, payload, parse_class_cbs->user_data));
+  return error_code;
 }
 
 // check OctvPayload.delimiter.signature
@@ -34,16 +162,141 @@ int octv_check_signature(const OctvDelimiter * delimiter) {
   return delimiter->signature[0] == 0xa4 && delimiter->signature[1] == 0x6d && delimiter->signature[2] == 0xae && delimiter->signature[3] == 0xb6;
 }
 
+// the terminal class of each type byte, for table-driven dispatch
+enum {
+  OCTV_CLASS_ERROR = 0,
+  OCTV_CLASS_SENTINEL,
+  OCTV_CLASS_END,
+  OCTV_CLASS_CONFIG,
+  OCTV_CLASS_MOMENT,
+  OCTV_CLASS_TICK,
+  OCTV_CLASS_FEATURE,
+  OCTV_NUM_CLASSES
+};
+
+static const uint8_t octv_class_by_type[256] = {
+  [OCTV_SENTINEL_TYPE] = OCTV_CLASS_SENTINEL,
+  [OCTV_END_TYPE] = OCTV_CLASS_END,
+  [OCTV_CONFIG_TYPE] = OCTV_CLASS_CONFIG,
+  [OCTV_MOMENT_TYPE] = OCTV_CLASS_MOMENT,
+  [OCTV_TICK_TYPE] = OCTV_CLASS_TICK,
+  [OCTV_FEATURE_0_LOWER ... OCTV_FEATURE_3_UPPER - 1] = OCTV_CLASS_FEATURE,
+};
+
+// handlers for octv_dispatch_class, one per terminal class
+
+typedef int (*octv_dispatch_class_t)(OctvPayload * payload, const OctvParseClass * parse_class_cbs, int * is_end);
+
+static
+int octv_class_error(OctvPayload * payload, const OctvParseClass * parse_class_cbs, int * is_end) {
+  // invalid type, client can return 0 to allow parsing to continue, see octv_find_sentinel for resynchronizing
+  return octv_error(OCTV_ERROR_TYPE, payload, parse_class_cbs);
+}
+
+static
+int octv_class_end(OctvPayload * payload, const OctvParseClass * parse_class_cbs, int * is_end) {
+  const char * chars = payload->delimiter.chars;
+  if( !(chars[0] == 'n' && chars[1] == 'd' && chars[2] == ' ' && octv_check_signature(&payload->delimiter)) ) {
+    return octv_error(OCTV_ERROR_VALUE, payload, parse_class_cbs);
+  }
+  // always return on valid OCTV_END_TYPE
+  *is_end = 1;
+  if( parse_class_cbs == NULL || parse_class_cbs->end_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CLASS_CALLBACK(code, parse_class_cbs, parse_class_cbs->end_cb(&payload->delimiter, parse_class_cbs->user_data));
+  return code;
+}
+
+static
+int octv_class_sentinel(OctvPayload * payload, const OctvParseClass * parse_class_cbs, int * is_end) {
+  const char * chars = payload->delimiter.chars;
+  if( !(chars[0] == 'c' && chars[1] == 't' && chars[2] == 'v' && octv_check_signature(&payload->delimiter)) ) {
+    return octv_error(OCTV_ERROR_VALUE, payload, parse_class_cbs);
+  }
+  if( parse_class_cbs == NULL || parse_class_cbs->sentinel_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CLASS_CALLBACK(code, parse_class_cbs, parse_class_cbs->sentinel_cb(&payload->delimiter, parse_class_cbs->user_data));
+  return code;
+}
+
+static
+int octv_class_config(OctvPayload * payload, const OctvParseClass * parse_class_cbs, int * is_end) {
+  // TODO: plan for older versions...
+  if( payload->config.octv_version != OCTV_VERSION ) {
+    return octv_error(OCTV_ERROR_VALUE, payload, parse_class_cbs);
+  }
+  if( parse_class_cbs == NULL || parse_class_cbs->config_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CLASS_CALLBACK(code, parse_class_cbs, parse_class_cbs->config_cb(&payload->config, parse_class_cbs->user_data));
+  return code;
+}
+
+static
+int octv_class_moment(OctvPayload * payload, const OctvParseClass * parse_class_cbs, int * is_end) {
+  if( parse_class_cbs == NULL || parse_class_cbs->moment_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CLASS_CALLBACK(code, parse_class_cbs, parse_class_cbs->moment_cb(&payload->moment, parse_class_cbs->user_data));
+  return code;
+}
+
+static
+int octv_class_tick(OctvPayload * payload, const OctvParseClass * parse_class_cbs, int * is_end) {
+  if( parse_class_cbs == NULL || parse_class_cbs->tick_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CLASS_CALLBACK(code, parse_class_cbs, parse_class_cbs->tick_cb(&payload->tick, parse_class_cbs->user_data));
+  return code;
+}
+
+static
+int octv_class_feature(OctvPayload * payload, const OctvParseClass * parse_class_cbs, int * is_end) {
+  if( parse_class_cbs == NULL || parse_class_cbs->feature_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CLASS_CALLBACK(code, parse_class_cbs, parse_class_cbs->feature_cb(&payload->feature, parse_class_cbs->user_data));
+  return code;
+}
+
+static const octv_dispatch_class_t octv_dispatch_class_table[OCTV_NUM_CLASSES] = {
+  [OCTV_CLASS_ERROR] = octv_class_error,
+  [OCTV_CLASS_SENTINEL] = octv_class_sentinel,
+  [OCTV_CLASS_END] = octv_class_end,
+  [OCTV_CLASS_CONFIG] = octv_class_config,
+  [OCTV_CLASS_MOMENT] = octv_class_moment,
+  [OCTV_CLASS_TICK] = octv_class_tick,
+  [OCTV_CLASS_FEATURE] = octv_class_feature,
+};
+
+// dispatch one payload to its terminal type, sets *is_end on a valid END, after which parsing
+// returns regardless of the code
+static
+int octv_dispatch_class(OctvPayload * payload, const OctvParseClass * parse_class_cbs, int * is_end) {
+  return octv_dispatch_class_table[octv_class_by_type[payload->type]](payload, parse_class_cbs, is_end);
+}
+
+
+// scan for the next SENTINEL, e.g. to resynchronize after damage to a stream
+size_t octv_find_sentinel(const uint8_t * buffer, size_t size, size_t start) {
+  static const uint8_t sentinel[sizeof(OctvPayload)] = { OCTV_SENTINEL_TYPE, 'c', 't', 'v', 0xa4, 0x6d, 0xae, 0xb6 };
+
+  if( buffer == NULL ) return size;
+
+  size_t offset = start;
+  while( offset < size && size - offset >= sizeof(sentinel) ) {
+    const uint8_t * found = memchr(buffer + offset, OCTV_SENTINEL_TYPE, size - offset - sizeof(sentinel) + 1);
+    if( found == NULL ) break;
+    if( memcmp(found, sentinel, sizeof(sentinel)) == 0 ) return found - buffer;
+    offset = found - buffer + 1;
+  }
+  return size;
+}
+
 // parse a FILE * stream, dispatching to each terminal type, stateless
 int octv_parse_class(FILE * file, const OctvParseClass * parse_class_cbs) {
-  printf("octv.c:: octv_parse_class(): file: %p, parse_class_cbs: %p, user_data: %p\n", file, parse_class_cbs, parse_class_cbs != NULL ? parse_class_cbs->user_data : NULL);
-  fflush(stdout);
+  OCTV_TRACE_EVENT(OCTV_TRACE_DEBUG, "octv_parse_class", file, parse_class_cbs);
 
   if( file == NULL ||  parse_class_cbs == NULL ) return OCTV_ERROR_NULL;
 
   while( 1 ) {
     OctvPayload payload;
-    char * chars;
 
     const int num_items = fread(&payload, sizeof(payload), 1, file);
     if( num_items != 1 ) {
@@ -52,75 +305,42 @@ int octv_parse_class(FILE * file, const OctvParseClass * parse_class_cbs) {
       octv_error(OCTV_ERROR_EOF, &payload, parse_class_cbs);
       return OCTV_ERROR_EOF;
     }
+    octv_stats_payloads(&payload, 1);
 
-    // switch statement cases can set code to non-zero, which is then returned
-    int code = 0;
-    switch (payload.type) {
-    default:
-      // invalid type, client can return 0 to allow parsing to continue
-      // TODO: implement code to find next valid terminal or sentinel
-      code = octv_error(OCTV_ERROR_TYPE, &payload, parse_class_cbs);
-      break;
-
-    case OCTV_END_TYPE:
-      chars = payload.delimiter.chars;
-      if( chars[0] == 'n' && chars[1] == 'd' && chars[2] == ' ' && octv_check_signature(&payload.delimiter) ) {
-        // always return on valid OCTV_END_TYPE
-        return parse_class_cbs != NULL && parse_class_cbs->end_cb != NULL
-          ? parse_class_cbs->end_cb(&payload.delimiter, parse_class_cbs->user_data)
-          : 0;
-      }
-      else {
-        code = octv_error(OCTV_ERROR_VALUE, &payload, parse_class_cbs);
-      }
-      break;
-
-    case OCTV_SENTINEL_TYPE:
-      chars = payload.delimiter.chars;
-      if( chars[0] == 'c' && chars[1] == 't' && chars[2] == 'v' && octv_check_signature(&payload.delimiter) ) {
-        if( parse_class_cbs != NULL && parse_class_cbs->sentinel_cb != NULL ) {
-          code = parse_class_cbs->sentinel_cb(&payload.delimiter, parse_class_cbs->user_data);
-        }
-      }
-      else {
-        code = octv_error(OCTV_ERROR_VALUE, &payload, parse_class_cbs);
-      }
-      break;
-
-    case OCTV_CONFIG_TYPE:
-      // TODO: plan for older versions...
-      if( payload.config.octv_version == OCTV_VERSION ) {
-        if( parse_class_cbs != NULL && parse_class_cbs->config_cb != NULL ) {
-          code = parse_class_cbs->config_cb(&payload.config, parse_class_cbs->user_data);
-        }
-      }
-      else {
-        code = octv_error(OCTV_ERROR_VALUE, &payload, parse_class_cbs);
-      }
-      break;
-
-
-    case OCTV_MOMENT_TYPE:
-      if( parse_class_cbs != NULL && parse_class_cbs->moment_cb != NULL ) {
-        code = parse_class_cbs->moment_cb(&payload.moment, parse_class_cbs->user_data);
-      }
-      break;
-
-    case OCTV_TICK_TYPE:
-      if( parse_class_cbs != NULL && parse_class_cbs->tick_cb != NULL ) {
-        code = parse_class_cbs->tick_cb(&payload.tick, parse_class_cbs->user_data);
-      }
-      break;
-
-    case OCTV_FEATURE_0_LOWER ... OCTV_FEATURE_3_UPPER:
-      if( parse_class_cbs != NULL && parse_class_cbs->feature_cb != NULL ) {
-        code = parse_class_cbs->feature_cb(&payload.feature, parse_class_cbs->user_data);
-      }
-      break;
-    }
+    int is_end = 0;
+    const int code = octv_dispatch_class(&payload, parse_class_cbs, &is_end);
+    if( is_end || code != 0 ) return code;
+  }
+}
 
-    if( code != 0 ) return code;
+// parse the payloads in a buffer, dispatching to each terminal type, stateless
+// *consumed is set to the number of bytes parsed, which includes the payload that caused the return;
+// running out of complete payloads returns OCTV_ERROR_EOF without calling error_cb, so parsing can
+// resume at buffer + *consumed once more data is available
+int octv_parse_class_buffer(const uint8_t * buffer, size_t size, size_t * consumed, const OctvParseClass * parse_class_cbs) {
+  OCTV_TRACE_EVENT(OCTV_TRACE_DEBUG, "octv_parse_class_buffer", buffer, size);
+
+  if( consumed != NULL ) *consumed = 0;
+  if( buffer == NULL ||  parse_class_cbs == NULL ) return OCTV_ERROR_NULL;
+
+  size_t offset = 0;
+  while( size - offset >= sizeof(OctvPayload) ) {
+    // copy, the buffer need not be aligned
+    OctvPayload payload;
+    memcpy(&payload, buffer + offset, sizeof(payload));
+    offset += sizeof(payload);
+    octv_stats_payloads(&payload, 1);
+
+    int is_end = 0;
+    const int code = octv_dispatch_class(&payload, parse_class_cbs, &is_end);
+    if( is_end || code != 0 ) {
+      if( consumed != NULL ) *consumed = offset;
+      return code;
+    }
   }
+
+  if( consumed != NULL ) *consumed = offset;
+  return OCTV_ERROR_EOF;
 }
 
 
@@ -163,6 +383,18 @@ int tick_flat_cb(OctvTick * tick, void * user_data) {
 static
 int feature_flat_cb(OctvFeature * feature, void * user_data) {
   OctvFlatFeatureState * flat_feature_state = user_data;
+
+  // a FEATURE belongs to the preceding TICK, without one there is no context to flatten it with
+  if( flat_feature_state->tick->type != OCTV_TICK_TYPE ) {
+    octv_stats_error(OCTV_ERROR_VALUE);
+    return OCTV_ERROR_VALUE;
+  }
+
+  if( flat_feature_state->filter != NULL ) {
+    const uint64_t audio_frame_index = ((uint64_t)flat_feature_state->moment->audio_frame_index_hi_bytes << 16) | flat_feature_state->tick->audio_frame_index_lo_bytes;
+    if( !octv_filter_feature(flat_feature_state->filter, feature, flat_feature_state->tick->audio_channel, audio_frame_index) ) return 0;
+  }
+
   *flat_feature_state->feature = *feature;
 
   // build the flat_feature
@@ -186,7 +418,9 @@ int feature_flat_cb(OctvFeature * feature, void * user_data) {
     .detector_index = flat_feature_state->feature->detector_index,
   };
 
-  return flat_feature_state->parse_flat_cbs->flat_feature_cb(&flat_feature, flat_feature_state->parse_flat_cbs->user_data);
+  int code;
+  OCTV_STATS_CALLBACK(code, flat_feature_state->parse_flat_cbs->flat_feature_cb(&flat_feature, flat_feature_state->parse_flat_cbs->user_data));
+  return code;
 }
 
 static
@@ -196,28 +430,23 @@ int error_flat_cb(int error_code, OctvPayload * payload, void * user_data) {
 }
 
 
-// stateful parsing, emit each feature
-int octv_parse_flat(FILE * file, const OctvParseFlat * parse_flat_cbs) {
-  printf("octv.c:: octv_parse_flat(): file: %p, parse_flat_cbs: %p, user_data: %p\n", file, parse_flat_cbs, parse_flat_cbs != NULL ? parse_flat_cbs->user_data : NULL);
-  fflush(stdout);
-
-  if( file == NULL || parse_flat_cbs == NULL ) return OCTV_ERROR_NULL;
-
-  // state for flat feature work
-  OctvConfig config;
-  OctvMoment moment;
-  OctvTick tick;
-  OctvFeature feature;
-  OctvFlatFeatureState flat_feature_state = {
-    .config = &config,
-    .moment = &moment,
-    .tick = &tick,
-    .feature = &feature,
-    .parse_flat_cbs = parse_flat_cbs
+// no CONFIG, MOMENT, or TICK has been seen, so a FEATURE is an error until a TICK arrives
+void octv_flat_parser_init(OctvFlatParser * flat_parser) {
+  flat_parser->config = (OctvConfig){ 0 };
+  flat_parser->moment = (OctvMoment){ 0 };
+  flat_parser->tick = (OctvTick){ 0 };
+  flat_parser->feature = (OctvFeature){ 0 };
+
+  flat_parser->flat_feature_state = (OctvFlatFeatureState){
+    .config = &flat_parser->config,
+    .moment = &flat_parser->moment,
+    .tick = &flat_parser->tick,
+    .feature = &flat_parser->feature,
+    .parse_flat_cbs = NULL,
+    .filter = NULL
   };
 
-  // callbacks for low-level class parser
-  OctvParseClass parse_class_cbs = {
+  flat_parser->parse_class_cbs = (OctvParseClass){
     .sentinel_cb = NULL,
     .end_cb = NULL,
     .config_cb = config_flat_cb,
@@ -225,11 +454,41 @@ int octv_parse_flat(FILE * file, const OctvParseFlat * parse_flat_cbs) {
     .tick_cb = tick_flat_cb,
     .feature_cb = feature_flat_cb,
     .error_cb = error_flat_cb,
-    .user_data = &flat_feature_state
+    .user_data = &flat_parser->flat_feature_state
   };
+}
 
+// stateful parsing of the payloads in a buffer, emit each feature, see octv_parse_class_buffer;
+// the CONFIG, MOMENT, and TICK context is in flat_parser, so parsing can resume at buffer + *consumed
+// in a later call with the same flat_parser
+int octv_parse_flat_parser_buffer(const uint8_t * buffer, size_t size, size_t * consumed, const OctvParseFlat * parse_flat_cbs, OctvFlatParser * flat_parser) {
+  if( consumed != NULL ) *consumed = 0;
+  if( buffer == NULL || parse_flat_cbs == NULL || flat_parser == NULL ) return OCTV_ERROR_NULL;
 
-  int code = octv_parse_class(file,  &parse_class_cbs);
+  flat_parser->flat_feature_state.parse_flat_cbs = parse_flat_cbs;
+
+  return octv_parse_class_buffer(buffer, size, consumed, &flat_parser->parse_class_cbs);
+}
+
+// like octv_parse_flat_parser_buffer, starting without context, e.g. for a buffer that starts at a SENTINEL
+int octv_parse_flat_buffer(const uint8_t * buffer, size_t size, size_t * consumed, const OctvParseFlat * parse_flat_cbs) {
+  OctvFlatParser flat_parser;
+  octv_flat_parser_init(&flat_parser);
+
+  return octv_parse_flat_parser_buffer(buffer, size, consumed, parse_flat_cbs, &flat_parser);
+}
+
+// stateful parsing, emit each feature
+int octv_parse_flat(FILE * file, const OctvParseFlat * parse_flat_cbs) {
+  OCTV_TRACE_EVENT(OCTV_TRACE_DEBUG, "octv_parse_flat", file, parse_flat_cbs);
+
+  if( file == NULL || parse_flat_cbs == NULL ) return OCTV_ERROR_NULL;
+
+  OctvFlatParser flat_parser;
+  octv_flat_parser_init(&flat_parser);
+  flat_parser.flat_feature_state.parse_flat_cbs = parse_flat_cbs;
+
+  int code = octv_parse_class(file,  &flat_parser.parse_class_cbs);
   return code;
 
 
@@ -240,96 +499,354 @@ int octv_parse_flat(FILE * file, const OctvParseFlat * parse_flat_cbs) {
   return 0;
 }
 
+// stateful parsing, emit each feature that filter accepts
+int octv_parse_flat_filter(FILE * file, const OctvParseFlat * parse_flat_cbs, const OctvFilter * filter) {
+  if( file == NULL || parse_flat_cbs == NULL || filter == NULL ) return OCTV_ERROR_NULL;
+
+  OctvFlatParser flat_parser;
+  octv_flat_parser_init(&flat_parser);
+  flat_parser.flat_feature_state.parse_flat_cbs = parse_flat_cbs;
+  flat_parser.flat_feature_state.filter = filter;
+
+  return octv_parse_class(file, &flat_parser.parse_class_cbs);
+}
+
+
+// filtering, see OctvFilter
+
+void octv_filter_init(OctvFilter * filter) {
+  *filter = (OctvFilter){
+    .feature_types = ~(uint64_t)0,
+    .detector_index_lower = 0,
+    .detector_index_upper = (uint32_t)UINT16_MAX + 1,
+    .audio_channels = { ~(uint64_t)0, ~(uint64_t)0, ~(uint64_t)0, ~(uint64_t)0 },
+    .audio_frame_index_lower = 0,
+    .audio_frame_index_upper = UINT64_MAX,
+    .level_threshold = INT32_MIN,
+  };
+}
+
+int octv_filter_tick(const OctvFilter * filter, uint8_t audio_channel, uint64_t audio_frame_index) {
+  return ((filter->audio_channels[audio_channel >> 6] >> (audio_channel & 63)) & 1)
+    && filter->audio_frame_index_lower <= audio_frame_index && audio_frame_index < filter->audio_frame_index_upper;
+}
+
+// whether any of the level_* fields of the feature's type is at least threshold
+static
+int octv_feature_level_at_least(const OctvFeature * feature, int32_t threshold) {
+  if( feature->type < OCTV_FEATURE_2_LOWER ) {
+    return feature->level_0_int8_0 >= threshold || feature->level_0_int8_1 >= threshold
+      || feature->level_0_int8_2 >= threshold || feature->level_0_int8_3 >= threshold;
+  }
+  if( feature->type < OCTV_FEATURE_3_LOWER ) {
+    return feature->level_2_int8_0 >= threshold || feature->level_2_int8_1 >= threshold || feature->level_2_int16_0 >= threshold;
+  }
+  return feature->level_3_int16_0 >= threshold || feature->level_3_int16_1 >= threshold;
+}
+
+int octv_filter_feature(const OctvFilter * filter, const OctvFeature * feature, uint8_t audio_channel, uint64_t audio_frame_index) {
+  return ((filter->feature_types >> (feature->type & OCTV_FEATURE_MASK)) & 1)
+    && filter->detector_index_lower <= feature->detector_index && feature->detector_index < filter->detector_index_upper
+    && octv_filter_tick(filter, audio_channel, audio_frame_index)
+    && (filter->level_threshold == INT32_MIN || octv_feature_level_at_least(feature, filter->level_threshold));
+}
+
+// state for filtered class parsing, wraps the client's callbacks
+typedef struct {
+  const OctvFilter * filter;
+  const OctvParseClass * parse_class_cbs;
+  OctvMoment moment;
+  OctvTick tick;
+  OctvParseClass filter_cbs;
+} OctvFilterParser;
+
+static
+int sentinel_filter_cb(OctvDelimiter * sentinel, void * user_data) {
+  const OctvParseClass * cbs = ((OctvFilterParser *)user_data)->parse_class_cbs;
+  if( cbs->sentinel_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CALLBACK(code, cbs->sentinel_cb(sentinel, cbs->user_data));
+  return code;
+}
+static
+int end_filter_cb(OctvDelimiter * end, void * user_data) {
+  const OctvParseClass * cbs = ((OctvFilterParser *)user_data)->parse_class_cbs;
+  if( cbs->end_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CALLBACK(code, cbs->end_cb(end, cbs->user_data));
+  return code;
+}
+static
+int config_filter_cb(OctvConfig * config, void * user_data) {
+  const OctvParseClass * cbs = ((OctvFilterParser *)user_data)->parse_class_cbs;
+  if( cbs->config_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CALLBACK(code, cbs->config_cb(config, cbs->user_data));
+  return code;
+}
+static
+int moment_filter_cb(OctvMoment * moment, void * user_data) {
+  OctvFilterParser * filter_parser = user_data;
+  filter_parser->moment = *moment;
+  const OctvParseClass * cbs = filter_parser->parse_class_cbs;
+  if( cbs->moment_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CALLBACK(code, cbs->moment_cb(moment, cbs->user_data));
+  return code;
+}
+static
+int tick_filter_cb(OctvTick * tick, void * user_data) {
+  OctvFilterParser * filter_parser = user_data;
+  filter_parser->tick = *tick;
+  const uint64_t audio_frame_index = ((uint64_t)filter_parser->moment.audio_frame_index_hi_bytes << 16) | tick->audio_frame_index_lo_bytes;
+  if( !octv_filter_tick(filter_parser->filter, tick->audio_channel, audio_frame_index) ) return 0;
+  const OctvParseClass * cbs = filter_parser->parse_class_cbs;
+  if( cbs->tick_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CALLBACK(code, cbs->tick_cb(tick, cbs->user_data));
+  return code;
+}
+static
+int feature_filter_cb(OctvFeature * feature, void * user_data) {
+  OctvFilterParser * filter_parser = user_data;
+  const uint64_t audio_frame_index = ((uint64_t)filter_parser->moment.audio_frame_index_hi_bytes << 16) | filter_parser->tick.audio_frame_index_lo_bytes;
+  if( !octv_filter_feature(filter_parser->filter, feature, filter_parser->tick.audio_channel, audio_frame_index) ) return 0;
+  const OctvParseClass * cbs = filter_parser->parse_class_cbs;
+  if( cbs->feature_cb == NULL ) return 0;
+  int code;
+  OCTV_STATS_CALLBACK(code, cbs->feature_cb(feature, cbs->user_data));
+  return code;
+}
+static
+int error_filter_cb(int error_code, OctvPayload * payload, void * user_data) {
+  const OctvParseClass * cbs = ((OctvFilterParser *)user_data)->parse_class_cbs;
+  if( cbs->error_cb == NULL ) return error_code;
+  int code;
+  OCTV_STATS_CALLBACK(code, cbs->error_cb(error_code, payload, cbs->user_data));
+  return code;
+}
+
+// parse a FILE * stream, dispatching the terminals that filter accepts, SENTINEL, END, CONFIG, and
+// MOMENT are always dispatched
+int octv_parse_class_filter(FILE * file, const OctvParseClass * parse_class_cbs, const OctvFilter * filter) {
+  if( file == NULL || parse_class_cbs == NULL || filter == NULL ) return OCTV_ERROR_NULL;
+
+  OctvFilterParser filter_parser = {
+    .filter = filter,
+    .parse_class_cbs = parse_class_cbs,
+    .moment = { 0 },
+    .tick = { 0 },
+  };
+  filter_parser.filter_cbs = (OctvParseClass){
+    .sentinel_cb = sentinel_filter_cb,
+    .end_cb = end_filter_cb,
+    .config_cb = config_filter_cb,
+    .moment_cb = moment_filter_cb,
+    .tick_cb = tick_filter_cb,
+    .feature_cb = feature_filter_cb,
+    .error_cb = error_filter_cb,
+    .user_data = &filter_parser
+  };
+
+  return octv_parse_class(file, &filter_parser.filter_cbs);
+}
+
 int octv_parse_class0(FILE * file,  octv_parse_class0_cb_t parse_class0_cb, void * user_data) {
   //int octv_parse_class(FILE * file, int(*parse_class_cb)(OctvPayload *, void *), void * user_data) {
-  printf("octv.c:: octv_parse_class0():\n");
-  fflush(stdout);
+  OCTV_TRACE_EVENT(OCTV_TRACE_DEBUG, "octv_parse_class0", file, user_data);
 
   while( 1 ) {
     OctvPayload payload;
     const int got = fread(&payload, sizeof(payload), 1, file);
     if( got != 1 ) return OCTV_ERROR_EOF;
+    octv_stats_payloads(&payload, 1);
 
-    const int code = parse_class0_cb(&payload, user_data);
+    int code;
+    OCTV_STATS_CALLBACK(code, parse_class0_cb(&payload, user_data));
     if( code != 0 ) return code;
   }
 }
 
+// see octv_parse_class_buffer for buffer, size, and consumed
+int octv_parse_class0_buffer(const uint8_t * buffer, size_t size, size_t * consumed, octv_parse_class0_cb_t parse_class0_cb, void * user_data) {
+  OCTV_TRACE_EVENT(OCTV_TRACE_DEBUG, "octv_parse_class0_buffer", buffer, size);
+
+  if( consumed != NULL ) *consumed = 0;
+  if( buffer == NULL || parse_class0_cb == NULL ) return OCTV_ERROR_NULL;
+
+  size_t offset = 0;
+  while( size - offset >= sizeof(OctvPayload) ) {
+    OctvPayload payload;
+    memcpy(&payload, buffer + offset, sizeof(payload));
+    offset += sizeof(payload);
+    octv_stats_payloads(&payload, 1);
+
+    int code;
+    OCTV_STATS_CALLBACK(code, parse_class0_cb(&payload, user_data));
+    if( code != 0 ) {
+      if( consumed != NULL ) *consumed = offset;
+      return code;
+    }
+  }
+
+  if( consumed != NULL ) *consumed = offset;
+  return OCTV_ERROR_EOF;
+}
+
+// like octv_parse_class0, but fills payloads, an array of max_payloads, and calls parse_batch_cb
+// once per batch rather than once per terminal
+int octv_parse_batch(FILE * file, OctvPayload * payloads, int max_payloads, octv_parse_batch_cb_t parse_batch_cb, void * user_data) {
+  OCTV_TRACE_EVENT(OCTV_TRACE_DEBUG, "octv_parse_batch", file, max_payloads);
+
+  if( file == NULL || payloads == NULL || parse_batch_cb == NULL ) return OCTV_ERROR_NULL;
+  if( max_payloads < 1 ) return OCTV_ERROR_VALUE;
+
+  while( 1 ) {
+    const int got = fread(payloads, sizeof(OctvPayload), max_payloads, file);
+    // a partial batch means eof or error, deliver the complete payloads that were read
+    if( got > 0 ) {
+      octv_stats_payloads(payloads, got);
+      int code;
+      OCTV_STATS_CALLBACK(code, parse_batch_cb(payloads, got, user_data));
+      if( code != 0 ) return code;
+    }
+    if( got != max_payloads ) return OCTV_ERROR_EOF;
+  }
+}
+
+
+// handlers for octv_dispatch_full, one per terminal class, each passes the callback a copy of the terminal
+// and times only the callback
+
+typedef int (*octv_dispatch_full_t)(OctvPayload * payload, OctvParseCallbacks * callbacks, int * is_end);
+
+static
+int octv_full_error(OctvPayload * payload, OctvParseCallbacks * callbacks, int * is_end) {
+  // type is not handled
+  octv_stats_error(OCTV_ERROR_TYPE);
+  int code;
+  OCTV_STATS_CALLBACK(code, callbacks->error_cb(OCTV_ERROR_TYPE, payload));
+  return code;
+}
+
+static
+int octv_full_end(OctvPayload * payload, OctvParseCallbacks * callbacks, int * is_end) {
+  OctvDelimiter end = payload->delimiter;
+  // end of what we consume from stream, regardless of value of code
+  *is_end = 1;
+  int code;
+  OCTV_STATS_CALLBACK(code, callbacks->end_cb(&end));
+  return code;
+}
+
+static
+int octv_full_sentinel(OctvPayload * payload, OctvParseCallbacks * callbacks, int * is_end) {
+  OctvDelimiter sentinel = payload->delimiter;
+  int code;
+  OCTV_STATS_CALLBACK(code, callbacks->sentinel_cb(&sentinel));
+  return code;
+}
+
+static
+int octv_full_config(OctvPayload * payload, OctvParseCallbacks * callbacks, int * is_end) {
+  OctvConfig config = payload->config;
+  int code;
+  OCTV_STATS_CALLBACK(code, callbacks->config_cb(&config));
+  return code;
+}
+
+static
+int octv_full_moment(OctvPayload * payload, OctvParseCallbacks * callbacks, int * is_end) {
+  OctvMoment moment = payload->moment;
+  int code;
+  OCTV_STATS_CALLBACK(code, callbacks->moment_cb(&moment));
+  return code;
+}
+
+static
+int octv_full_tick(OctvPayload * payload, OctvParseCallbacks * callbacks, int * is_end) {
+  OctvTick tick = payload->tick;
+  int code;
+  OCTV_STATS_CALLBACK(code, callbacks->tick_cb(&tick));
+  return code;
+}
+
+static
+int octv_full_feature(OctvPayload * payload, OctvParseCallbacks * callbacks, int * is_end) {
+  OctvFeature feature = payload->feature;
+  int code;
+  OCTV_STATS_CALLBACK(code, callbacks->feature_cb(&feature));
+  return code;
+}
+
+static const octv_dispatch_full_t octv_dispatch_full_table[OCTV_NUM_CLASSES] = {
+  [OCTV_CLASS_ERROR] = octv_full_error,
+  [OCTV_CLASS_SENTINEL] = octv_full_sentinel,
+  [OCTV_CLASS_END] = octv_full_end,
+  [OCTV_CLASS_CONFIG] = octv_full_config,
+  [OCTV_CLASS_MOMENT] = octv_full_moment,
+  [OCTV_CLASS_TICK] = octv_full_tick,
+  [OCTV_CLASS_FEATURE] = octv_full_feature,
+};
+
+// dispatch one payload for octv_parse_full, sets *is_end on END, after which parsing returns
+// regardless of the code
+static
+int octv_dispatch_full(OctvPayload * payload, OctvParseCallbacks * callbacks, int * is_end) {
+  return octv_dispatch_full_table[octv_class_by_type[payload->type]](payload, callbacks, is_end);
+}
 
 int octv_parse_full(FILE * file, OctvParseCallbacks * callbacks) {
-  printf("octv.c:: octv_parse_full():\n");
-  fflush(stdout);
+  OCTV_TRACE_EVENT(OCTV_TRACE_DEBUG, "octv_parse_full", file, callbacks);
 
   OctvPayload payload;
-  int code;
 
   while( 1 ) {
     const int got = fread(&payload, sizeof(payload), 1, file);
     if( got != 1 ) {
-      callbacks->error_cb(OCTV_ERROR_EOF, NULL);
+      octv_stats_error(OCTV_ERROR_EOF);
+      // we ignore the code from error_cb
+      int code;
+      OCTV_STATS_CALLBACK(code, callbacks->error_cb(OCTV_ERROR_EOF, NULL));
+      (void)code;
       return OCTV_ERROR_EOF;
     }
+    octv_stats_payloads(&payload, 1);
 
-    //printf("octv.c:: octv_parse_full: payload.type: 0x%02x\n", payload.type);
-    //fflush(stdout);
-
-    if( payload.type & OCTV_NON_FEATURE_MASK ) {
-      // terminals other than FEATURE
-      switch (payload.type) {
-      default:
-        // type is not handled
-        code = callbacks->error_cb(OCTV_ERROR_TYPE, &payload);
-        if( code != 0 ) return code;
-        break;
-
-      case OCTV_END_TYPE:
-        OctvDelimiter end = payload.delimiter;
-        code = callbacks->end_cb(&end);
-        // end of what we consume from stream, regardless of value of code
-        return code;
-
-
-      case OCTV_SENTINEL_TYPE:
-        OctvDelimiter sentinel = payload.delimiter;
-        code = callbacks->sentinel_cb(&sentinel);
-        if( code != 0 ) return code;
-        break;
-
-      case OCTV_CONFIG_TYPE:
-        OctvConfig config = payload.config;
-        code = callbacks->config_cb(&config);
-        if( code != 0 ) return code;
-        break;
-
-      case OCTV_MOMENT_TYPE:
-        OctvMoment moment = payload.moment;
-        code = callbacks->moment_cb(&moment);
-        if( code != 0 ) return code;
-        break;
-
-      case OCTV_TICK_TYPE:
-        OctvTick tick = payload.tick;
-        code = callbacks->tick_cb(&tick);
-        if( code != 0 ) return code;
-        break;
-      }
-    }
-    else if( payload.type & OCTV_FEATURE_MASK ) {
-      // FEATURE
-      OctvFeature feature = payload.feature;
-      code = callbacks->feature_cb(&feature);
-      if( code != 0 ) return code;
-    }
-    else {
-      // payload.type field is 0x00
-      code = callbacks->error_cb(OCTV_ERROR_TYPE, &payload);
-      if( code != 0 ) return code;
+    int is_end = 0;
+    const int code = octv_dispatch_full(&payload, callbacks, &is_end);
+    if( is_end || code != 0 ) return code;
+  }
+}
+
+// see octv_parse_class_buffer for buffer, size, and consumed
+int octv_parse_full_buffer(const uint8_t * buffer, size_t size, size_t * consumed, OctvParseCallbacks * callbacks) {
+  OCTV_TRACE_EVENT(OCTV_TRACE_DEBUG, "octv_parse_full_buffer", buffer, size);
+
+  if( consumed != NULL ) *consumed = 0;
+  if( buffer == NULL || callbacks == NULL ) return OCTV_ERROR_NULL;
+
+  size_t offset = 0;
+  while( size - offset >= sizeof(OctvPayload) ) {
+    OctvPayload payload;
+    memcpy(&payload, buffer + offset, sizeof(payload));
+    offset += sizeof(payload);
+    octv_stats_payloads(&payload, 1);
+
+    int is_end = 0;
+    const int code = octv_dispatch_full(&payload, callbacks, &is_end);
+    if( is_end || code != 0 ) {
+      if( consumed != NULL ) *consumed = offset;
+      return code;
     }
   }
+
+  if( consumed != NULL ) *consumed = offset;
+  return OCTV_ERROR_EOF;
 }
 
 int octv_parse_flat0(FILE * file, octv_flat_feature_cb_t flat_feature_cb, void * user_data) {
-  printf("octv.c:: octv_parse_flat0():\n");
+  OCTV_TRACE_EVENT(OCTV_TRACE_DEBUG, "octv_parse_flat0", file, user_data);
 
   OctvFlatFeature flat_feature = { 0 };
 
@@ -339,14 +856,12 @@ int octv_parse_flat0(FILE * file, octv_flat_feature_cb_t flat_feature_cb, void *
     int got = fread(&payload, sizeof(payload), 1, file);
     if( got != 1 ) break;
   }
-  fflush(stdout);
 
   int code = 0;
   if( flat_feature_cb != NULL ) {
     code = flat_feature_cb(&flat_feature, user_data);
   }
 
-  fflush(stdout);
   return code + flat_feature.type;
 }
 
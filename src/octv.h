@@ -264,6 +264,9 @@ typedef struct {
 
 typedef int (*octv_parse_class0_cb_t)(OctvPayload * payload, void * user_data);
 
+// called with each batch of up to max_payloads payloads, filled into the caller-supplied array
+typedef int (*octv_parse_batch_cb_t)(OctvPayload * payloads, int num_payloads, void * user_data);
+
 typedef struct {
   int (*sentinel_cb)(OctvDelimiter * sentinel);
   int (*end_cb)(OctvDelimiter * end);
@@ -301,6 +304,27 @@ typedef struct {
   void * user_data;
 } OctvParseFlat;
 
+// Filter evaluated by the parser so that the TICKs and FEATUREs it rejects never reach the
+// callbacks, see octv_filter_init for one that accepts everything
+typedef struct {
+  // FEATURE types, bit type is set to accept a type
+  uint64_t feature_types;
+
+  // half-open range of detector_index
+  uint32_t detector_index_lower;
+  uint32_t detector_index_upper;
+
+  // audio_channel is accepted when bit (audio_channel % 64) of audio_channels[audio_channel / 64] is set
+  uint64_t audio_channels[4];
+
+  // half-open range of the 48-bit audio_frame_index of the TICK
+  uint64_t audio_frame_index_lower;
+  uint64_t audio_frame_index_upper;
+
+  // a FEATURE is accepted when any of the level_* fields of its type is at least level_threshold
+  int32_t level_threshold;
+} OctvFilter;
+
 // TODO: add support for Sparse Stream state machine checks
 typedef struct {
   OctvConfig * config;
@@ -310,8 +334,22 @@ typedef struct {
 
   // Note: const may affect the struct's field ordering
   const OctvParseFlat * parse_flat_cbs;
+
+  // NULL, or FEATUREs it rejects are not emitted
+  const OctvFilter * filter;
 } OctvFlatFeatureState;
 
+// state of stateful flat parsing, the CONFIG, MOMENT, and TICK context of the features, which
+// persists across calls of octv_parse_flat_parser_buffer, see octv_flat_parser_init
+typedef struct {
+  OctvConfig config;
+  OctvMoment moment;
+  OctvTick tick;
+  OctvFeature feature;
+  OctvFlatFeatureState flat_feature_state;
+  OctvParseClass parse_class_cbs;
+} OctvFlatParser;
+
 
 /*
 typedef struct {
@@ -329,9 +367,73 @@ int octv_parse_class(FILE * file, const OctvParseClass * parse_class_cbs);
 int octv_parse_flat(FILE * file, const OctvParseFlat * parse_flat_cbs);
 
 int octv_parse_class0(FILE * file,  octv_parse_class0_cb_t parse_class0_cb, void * user_data);
+int octv_parse_batch(FILE * file, OctvPayload * payloads, int max_payloads, octv_parse_batch_cb_t parse_batch_cb, void * user_data);
 int octv_parse_flat0(FILE * file, octv_flat_feature_cb_t flat_feature_cb, void * user_data);
 //int octv_parse_class(FILE * file, int(*parse_class_cb)(OctvPayload *, void *), void * user_data);
 
 int octv_parse_full(FILE * file, OctvParseCallbacks * callbacks);
 
+// filtered parsing, see OctvFilter
+void octv_filter_init(OctvFilter * filter);
+int octv_filter_tick(const OctvFilter * filter, uint8_t audio_channel, uint64_t audio_frame_index);
+int octv_filter_feature(const OctvFilter * filter, const OctvFeature * feature, uint8_t audio_channel, uint64_t audio_frame_index);
+int octv_parse_class_filter(FILE * file, const OctvParseClass * parse_class_cbs, const OctvFilter * filter);
+int octv_parse_flat_filter(FILE * file, const OctvParseFlat * parse_flat_cbs, const OctvFilter * filter);
+
+// offset of the first SENTINEL in buffer at or after start, at any alignment, size if there is none
+size_t octv_find_sentinel(const uint8_t * buffer, size_t size, size_t start);
+
+// parsing of the payloads in an in-memory buffer, *consumed is set to the number of bytes parsed
+int octv_parse_class_buffer(const uint8_t * buffer, size_t size, size_t * consumed, const OctvParseClass * parse_class_cbs);
+int octv_parse_flat_buffer(const uint8_t * buffer, size_t size, size_t * consumed, const OctvParseFlat * parse_flat_cbs);
+int octv_parse_class0_buffer(const uint8_t * buffer, size_t size, size_t * consumed, octv_parse_class0_cb_t parse_class0_cb, void * user_data);
+int octv_parse_full_buffer(const uint8_t * buffer, size_t size, size_t * consumed, OctvParseCallbacks * callbacks);
+
+// flat parsing of a stream that arrives in chunks, e.g. from a socket, flat_parser holds the context
+// of the features from one call to the next, a FEATURE before any TICK is OCTV_ERROR_VALUE
+void octv_flat_parser_init(OctvFlatParser * flat_parser);
+int octv_parse_flat_parser_buffer(const uint8_t * buffer, size_t size, size_t * consumed, const OctvParseFlat * parse_flat_cbs, OctvFlatParser * flat_parser);
+
+// tracing: when octv.c is compiled with OCTV_TRACE defined, the parsers record leveled events in
+// a ring buffer of the most recent OCTV_TRACE_RING_SIZE events, otherwise the trace points compile
+// to nothing and octv_trace_read finds no events; levels are those of Python's logging
+#define OCTV_TRACE_DEBUG  10
+#define OCTV_TRACE_INFO  20
+#define OCTV_TRACE_ERROR  40
+
+#define OCTV_TRACE_RING_SIZE  1024
+
+typedef struct {
+  uint64_t sequence;
+  // a static string, e.g. the name of the function
+  const char * name;
+  uint64_t arg0;
+  uint64_t arg1;
+  int level;
+} OctvTraceEvent;
+
+// whether the trace points are compiled in
+int octv_trace_compiled(void);
+// events below level are not recorded, returns the previous level
+int octv_trace_set_level(int level);
+// the sequence number of the next event
+uint64_t octv_trace_next_sequence(void);
+// copy the events from sequence on that are still in the ring, at most max_events, returns the number copied
+size_t octv_trace_read(uint64_t sequence, OctvTraceEvent * events, size_t max_events);
+
+// parse statistics: while a stats struct is attached, the parsers called by the same thread count
+// the payloads they read, by type byte, and the errors they pass to error_cb, by OCTV_ERROR_* code,
+// and time the callbacks they make
+typedef struct {
+  uint64_t terminals_by_type[256];
+  // indexed by OCTV_ERROR_* code
+  uint64_t errors_by_code[8];
+  uint64_t bytes_consumed;
+  // nanoseconds of CLOCK_MONOTONIC in the callbacks
+  uint64_t callback_ns;
+} OctvParseStats;
+
+// attach stats for the calling thread, NULL to detach, returns the previously attached stats
+OctvParseStats * octv_parse_stats_attach(OctvParseStats * stats);
+
 int _octv_prevent_warnings();
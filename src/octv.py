@@ -1,21 +1,98 @@
-import sys, os
+import os
 import contextlib
+import mmap
 import struct
 import json
 import operator
 import collections
+import weakref
 import time
+import functools
+import threading
 
 from octv_cffi import ffi, lib
 
-debug = False
-debug = True
+# debug log lines are only formatted when debug is true, from the OCTV_DEBUG environment variable
+debug = bool(os.environ.get('OCTV_DEBUG'))
 
 _, FILE = os.path.split(__file__)
 
-def log(*args):
-    print(f'{FILE}:', *args)
-    sys.stdout.flush()
+# log lines go to trace_sink, a callable of the level and the line, see set_trace_sink; tracing is
+# off, with nothing formatted, unless a sink is set or OCTV_DEBUG is set, which prints them
+def print_trace_sink(level, line):
+    # stdout is not flushed, it may be a pipe
+    print(line)
+
+trace_sink = print_trace_sink if debug else None
+
+# lines and events below trace_level are neither formatted nor sent to trace_sink, nor recorded in
+# the C trace ring, see set_trace_level; the same as the C ring's initial level
+trace_level = lib.OCTV_TRACE_DEBUG
+
+def trace_enabled(level=lib.OCTV_TRACE_INFO):
+    # whether a line at level would reach a sink, so callers can skip formatting it
+    return trace_sink is not None and level >= trace_level
+
+def set_trace_sink(sink):
+    """
+    Set the sink for log() and octv_trace_drain(), a callable of the level, see OCTV_TRACE_* in
+    octv.h, and the line, or None to discard them; returns the previous sink.
+
+    >>> lines = list()
+    >>> previous = set_trace_sink(lambda level, line: lines.append((level, line)))
+    >>> log('hello', 2)
+    >>> set_trace_sink(previous) is not None, lines
+    (True, [(20, 'octv.py: hello 2')])
+    """
+    global trace_sink
+    previous = trace_sink
+    trace_sink = sink
+    return previous
+
+def set_trace_level(level):
+    """
+    Set the lowest level, see OCTV_TRACE_* in octv.h, of the lines of log() that reach the sink and
+    of the events that the C trace ring records; returns the previous level.
+
+    >>> lines = list()
+    >>> previous_sink = set_trace_sink(lambda level, line: lines.append((level, line)))
+    >>> previous_level = set_trace_level(lib.OCTV_TRACE_ERROR)
+    >>> log('quiet'), log('loud', level=lib.OCTV_TRACE_ERROR), trace_enabled()
+    (None, None, False)
+    >>> set_trace_level(previous_level) == lib.OCTV_TRACE_ERROR, set_trace_sink(previous_sink) is not None, lines
+    (True, True, [(40, 'octv.py: loud')])
+    """
+    global trace_level
+    previous = trace_level
+    trace_level = level
+    lib.octv_trace_set_level(level)
+    return previous
+
+def log(*args, level=lib.OCTV_TRACE_INFO):
+    if trace_enabled(level):
+        trace_sink(level, ' '.join(str(arg) for arg in (f'{FILE}:',) + args))
+
+def octv_trace_events(sequence=0, *, max_events=lib.OCTV_TRACE_RING_SIZE):
+    # the events in the C trace ring buffer from sequence on, oldest first, as O with the fields of
+    # OctvTraceEvent, always empty unless octv.c is compiled with OCTV_TRACE, see lib.octv_trace_compiled()
+    events_c = ffi.new('OctvTraceEvent[]', max_events)
+    num_events = lib.octv_trace_read(sequence, events_c, max_events)
+    return [O(sequence=event_c.sequence, level=event_c.level, name=ffi.string(event_c.name).decode(), arg0=event_c.arg0, arg1=event_c.arg1)
+            for event_c in events_c[0:num_events]]
+
+# sequence number of the next C trace event to drain
+trace_drain_sequence = 0
+
+def octv_trace_drain():
+    # send the C trace events recorded since the last drain to trace_sink, returns the events
+    global trace_drain_sequence
+    events = octv_trace_events(trace_drain_sequence)
+    if events:
+        trace_drain_sequence = events[-1].sequence + 1
+    for event in events:
+        if trace_enabled(event.level):
+            trace_sink(event.level, f'octv.c: {event.name}: sequence: {event.sequence}, arg0: 0x{event.arg0:x}, arg1: 0x{event.arg1:x}')
+    return events
 
 def octv_assert_invariants():
     """
@@ -33,16 +110,18 @@ def octv_assert_invariants():
     assert lib.OCTV_FEATURE_2_UPPER == lib.OCTV_FEATURE_3_LOWER, str((hex(lib.OCTV_FEATURE_2_UPPER), hex(lib.OCTV_FEATURE_3_LOWER)))
 
 
-# referents holds onto cdata objects until this module goes away, needed because pointers in cdata
-# structs don't hold onto the underlying cdata
+# pointers in cdata structs don't hold onto the underlying cdata, so referents holds onto such cdata,
+# e.g. the handle in the user_data of a callbacks struct, for as long as the struct that points to
+# it, typically the duration of one parse call
 
-referents = list()
+referents = weakref.WeakKeyDictionary()
+def keep_alive(owner_c, referent_c):
+    referents.setdefault(owner_c, list()).append(referent_c)
+    return referent_c
 def ffi_new(c_type, init=None):
-    referents.append(ffi.new(c_type, init))
-    return referents[-1]
+    return ffi.new(c_type, init)
 def ffi_new_handle(obj):
-    referents.append(ffi.new_handle(obj))
-    return referents[-1]
+    return ffi.new_handle(obj)
 
 @contextlib.contextmanager
 def open_file_c(filename, *, mode=os.O_RDONLY):
@@ -50,16 +129,33 @@ def open_file_c(filename, *, mode=os.O_RDONLY):
     file_c = None
     try:
         fd = os.open(filename, mode)
-        sys.stdout.flush()
         file_c = lib.fdopen(fd, b'r')
         debug and log(f'open_file_c: open: filename: {filename}, fd: {fd}, file_c: {file_c}')
         yield file_c
     finally:
         if file_c is not None:
             debug and log(f'open_file_c: close: filename: {filename}, fd: {fd}, file_c: {file_c}')
-            sys.stdout.flush()
             lib.fclose(file_c)
 
+@contextlib.contextmanager
+def open_file_mmap(filename):
+    # map a file read-only and manage a memoryview of the whole file, pages are shared with other
+    # processes mapping the same file, and slices of the memoryview do not copy
+    with open(filename, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        # mmap does not support zero-length files
+        file_mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size > 0 else None
+    file_view = memoryview(file_mmap) if file_mmap is not None else memoryview(b'')
+    try:
+        debug and log(f'open_file_mmap: open: filename: {filename}, size: {size}')
+        yield file_view
+    finally:
+        debug and log(f'open_file_mmap: close: filename: {filename}, size: {size}')
+        # slices of file_view must not be used beyond the with block
+        file_view.release()
+        if file_mmap is not None:
+            file_mmap.close()
+
 class O(object):
     """
     Object with attribute behavior
@@ -114,38 +210,61 @@ octv_struct_name_by_type = {
 for feature_type in range(lib.OCTV_FEATURE_0_LOWER, lib.OCTV_FEATURE_3_UPPER):
     octv_struct_name_by_type[feature_type] = ('OctvFeature', 'feature')
 
-log(f'octv_struct_name_by_type:')
-for key, (struct_name, terminal_name) in sorted(octv_struct_name_by_type.items()):
-    log(f'  0x{key:02x}:  {struct_name}  {terminal_name}')
 assert all(struct_name in octv_struct_names for (struct_name, terminal_name) in octv_struct_name_by_type.values()), str((octv_struct_names, octv_struct_name_by_type))
 
 
+def make_dispatch_table(entries, default=None):
+    """
+    A 256-entry tuple indexed by the type byte, for dispatch without branching on ranges of types.
+    The entries are (types, entry) pairs, where types is a type or a range of types.
+
+    >>> table = make_dispatch_table(((lib.OCTV_TICK_TYPE, 'tick'), (range(lib.OCTV_FEATURE_0_LOWER, lib.OCTV_FEATURE_3_UPPER), 'feature')))
+    >>> len(table), table[0x00], table[0x01], table[0x3f], table[0x40], table[0x70]
+    (256, None, 'feature', 'feature', None, 'tick')
+    """
+    table = [default] * 256
+    for types, entry in entries:
+        for type in (types if isinstance(types, range) else (types,)):
+            table[type] = entry
+    return tuple(table)
+
+# (struct_name, terminal_name) of each type, (None, None) for unhandled types
+octv_struct_name_table = make_dispatch_table(octv_struct_name_by_type.items(), (None, None))
+
+
 # stuff for working with Octv objects
-octv_fields_by_type = O()
-log(f'octv_fields_by_type:')
-for  octv_type, (struct_name, terminal_name) in octv_struct_name_by_type.items():
-    fields = tuple(field for field in dir(ffi.new(f'{struct_name} *')) if not field.startswith('_'))
-    #log(f'  0x{octv_type:02x}  {terminal_name}  {struct_name}  {fields}')
-    item = O(
+
+@functools.cache
+def octv_fields_of_type(octv_type):
+    """
+    O with the type, terminal_name, struct_name and fields of the struct of an Octv type, or None
+    for unhandled types, built on first use rather than at import.
+
+    >>> octv_fields_of_type(lib.OCTV_TICK_TYPE).fields
+    ('type', 'audio_channel', 'audio_frame_index_lo_bytes', 'audio_sample')
+    >>> octv_fields_of_type(0x00) is None
+    True
+    """
+    struct_name, terminal_name = octv_struct_name_table[octv_type]
+    if struct_name is None: return None
+    return O(
         type = octv_type,
         terminal_name = terminal_name,
         struct_name = struct_name,
-        fields = fields,
+        fields = tuple(field for field, field_type in ffi.typeof(struct_name).fields),
         )
-    #log(f'  item: {item}')
-    octv_fields_by_type[octv_type] = item
 
 
 def octv_struct_str(terminal):
-    item = octv_fields_by_type.get(terminal.type)
+    item = octv_fields_of_type(terminal.type)
     if item is None: return f'type: 0x{terminal.type:02x}'
 
     field_values = ', '.join(f'{field_name}: {hexify(getattr(terminal, field_name))}' for field_name in item.fields)
     return f'type: 0x{item.type:02x}, terminal_name: {item.terminal_name}, struct_name: {item.struct_name} :  fields: {field_values}'
 
-    #return ', '.join(f'{field_name}: {getattr(terminal, field_name)}' for field_name in octv_type_fields.get(terminal.type, ()))
-
 def log_terminal(label, terminal):
+    # called for every terminal by the octv_*X_cb callbacks, nothing is formatted unless it would be logged
+    if not trace_enabled(): return
     if terminal != ffi.NULL and terminal is not None:
         log(f'log_terminal: {label}: {octv_struct_str(terminal)}')
     else:
@@ -157,15 +276,18 @@ class OctvBase(object):
     @ffi.def_extern()
     @staticmethod
     def octv_error_cb(error_code, payload, user_data_c):
+        # called from C when the parser has encountered an error
         try:
-            log(f'octv_error_cb: error_code: {error_code} payload: {payload}, user_data_c: {user_data_c}')
+            debug and log(f'OctvBase.octv_error_cb: error_code: {error_code} payload: {payload}, user_data_c: {user_data_c}')
             send = ffi.from_handle(user_data_c) if user_data_c != ffi.NULL else None
-            # TODO: how to handle errors, separate error_user_data_c, or attribute on send
-            # want an exception that is raised once we're back in python land...
+            # TODO: how to handle C errors, separate error_user_data_c, or attribute on send
             return error_code
-        finally:
-            # we're about to return into C code, so flush stdout
-            sys.stdout.flush()
+        except Exception as error:
+            # secondary exception (from client's python code reached from send
+            # want to create a python exception that is raised once we're back in python land...
+            # e.g. via a new_handle attached to user_data
+            log(f'OctvBase.octv_error_cb: error: {type(error).__name__}: error: {error}', level=lib.OCTV_TRACE_ERROR)
+            return lib.OCTV_ERROR_CLIENT
 
     @property
     def type(self):
@@ -203,10 +325,14 @@ class OctvBase(object):
 
     def __init__(self, obj_c):
         # self_c is an instance of a C struct (cffi) and used for getting most attributes
-        self.self_c = ffi_new(self.struct_type, self.dict_from(obj_c))
+        # copy the whole struct, obj_c points into the C parser's transient payload
+        self.self_c = ffi_new(self.struct_type, obj_c[0])
         debug and log(f'{type(self).__name__}.__init__: obj_c: {obj_c}, self.self_c: {self.self_c}')
-        payload = ffi.cast('OctvPayload *', obj_c)
-        self.payload_hex = '_'.join(f'{byte:02x}' for byte in payload.bytes)
+
+    @property
+    def payload_hex(self):
+        # derived from self_c when needed, rather than formatted for every terminal
+        return bytes(ffi.buffer(self.self_c)).hex('_')
 
     @staticmethod
     def send(terminal, user_data_c):
@@ -217,7 +343,7 @@ class OctvBase(object):
         except Exception as error:
             # TODO: signal error back to python, e.g. via field in user_data_c?
             # needs to happen in cb function so that this try/except is superfluous
-            log(f'OctvBase.send: error: {type(error).__name__}: error: {error}')
+            log(f'OctvBase.send: error: {type(error).__name__}: error: {error}', level=lib.OCTV_TRACE_ERROR)
             return lib.OCTV_ERROR_CLIENT
 
 
@@ -228,10 +354,7 @@ class OctvSentinel(OctvBase):
     #   @ffi.def_extern()  TypeError: expected a callable object, not classmethod
     @staticmethod
     def octv_sentinel_cb(sentinel_c, user_data_c):
-        try:
-            return OctvBase.send(OctvSentinel(sentinel_c), user_data_c)
-        finally:
-            sys.stdout.flush()
+        return OctvBase.send(OctvSentinel(sentinel_c), user_data_c)
 
     struct_type = 'OctvDelimiter *'
     fields = 'type',
@@ -241,10 +364,7 @@ class OctvEnd(OctvBase):
     @ffi.def_extern()
     @staticmethod
     def octv_end_cb(end_c, user_data_c):
-        try:
-            return OctvBase.send(OctvEnd(end_c), user_data_c)
-        finally:
-            sys.stdout.flush()
+        return OctvBase.send(OctvEnd(end_c), user_data_c)
 
     struct_type = 'OctvDelimiter *'
     fields = 'type',
@@ -254,10 +374,7 @@ class OctvConfig(OctvBase):
     @ffi.def_extern()
     @staticmethod
     def octv_config_cb(config_c, user_data_c):
-        try:
-            return OctvBase.send(OctvConfig(config_c), user_data_c)
-        finally:
-            sys.stdout.flush()
+        return OctvBase.send(OctvConfig(config_c), user_data_c)
 
     struct_type = 'OctvConfig *'
     fields = 'type', 'octv_version', 'num_audio_channels', 'audio_sample_rate_0', 'audio_sample_rate_1', 'audio_sample_rate_2', 'num_detectors',
@@ -291,10 +408,7 @@ class OctvMoment(OctvBase):
     @ffi.def_extern()
     @staticmethod
     def octv_moment_cb(moment_c, user_data_c):
-        try:
-            return OctvBase.send(OctvMoment(moment_c), user_data_c)
-        finally:
-            sys.stdout.flush()
+        return OctvBase.send(OctvMoment(moment_c), user_data_c)
 
     struct_type = 'OctvMoment *'
     fields = 'type', 'audio_frame_index_hi_bytes',
@@ -309,10 +423,7 @@ class OctvTick(OctvBase):
     @ffi.def_extern()
     @staticmethod
     def octv_tick_cb(tick_c, user_data_c):
-        try:
-            return OctvBase.send(OctvTick(tick_c), user_data_c)
-        finally:
-            sys.stdout.flush()
+        return OctvBase.send(OctvTick(tick_c), user_data_c)
 
     struct_type = 'OctvTick *'
     fields = 'type', 'audio_channel', 'audio_frame_index_lo_bytes', 'audio_sample'
@@ -345,20 +456,12 @@ class OctvFeatureBase(OctvBase):
     @ffi.def_extern()
     @staticmethod
     def octv_feature_cb(feature_c, user_data_c):
-        try:
-            feature_type = feature_c.type
-            if feature_type in OctvFeatureBase.level_0:
-                cls = OctvFeature_0
-            elif feature_type in OctvFeatureBase.level_2:
-                cls = OctvFeature_2
-            elif feature_type in OctvFeatureBase.level_3:
-                cls = OctvFeature_3
-            else:
-                raise AssertionError(f'unhandled feature type: {feature_type}  0x{feature_type:02x}')
+        feature_type = feature_c.type
+        cls = octv_feature_class_table[feature_type]
+        if cls is None:
+            raise AssertionError(f'unhandled feature type: {feature_type}  0x{feature_type:02x}')
 
-            return OctvBase.send(cls(feature_c), user_data_c)
-        finally:
-            sys.stdout.flush()
+        return OctvBase.send(cls(feature_c), user_data_c)
 
     struct_type = 'OctvFeature *'
     fields = 'type', 'frame_offset', 'detector_index',
@@ -421,6 +524,13 @@ class OctvFeature_3(OctvFeatureBase):
     def level_3_int16_1(self):
         return self.self_c.level_3_int16_1
 
+# the OctvFeatureBase subclass of each type, None for other types
+octv_feature_class_table = make_dispatch_table((
+    (OctvFeatureBase.level_0, OctvFeature_0),
+    (OctvFeatureBase.level_2, OctvFeature_2),
+    (OctvFeatureBase.level_3, OctvFeature_3),
+    ))
+
 
 # class decorator to add getter properties for each of struct_fields, proxy-ing through self.self_c
 def octv_terminal(cls):
@@ -433,12 +543,6 @@ def octv_terminal(cls):
 
 def proxy_fields(proxy_name, fields_name):
     def octv_terminal(cls):
-        struct_name = cls.__name__
-        struct = ffi.new(struct_name + '*')
-        fields1 = tuple(dir(struct))
-        print(f'octv_terminal: cls: {cls}, struct_name: {struct_name}, struct: {struct}, fields1: {fields1}')
-        sys.stdout.flush()
-
         for attr_name in getattr(cls, fields_name):
             def get_attr(self, *, attr_name=attr_name):
                 return getattr(getattr(self, proxy_name), attr_name)
@@ -457,6 +561,11 @@ class OctvFlatBase(OctvBase):
         #self.self_c = ffi_new(self.struct_type, self.dict_from(obj_c))
         debug and log(f'{type(self).__name__}.__init__: obj_c: {obj_c}, self.self_c: {self.self_c}')
 
+    @property
+    def payload_hex(self):
+        # a flat feature is not a single payload
+        raise AttributeError(f'{type(self).__name__} has no payload_hex')
+
 @octv_ffi_proxy
 class OctvFlatFeature(OctvFlatBase):
     pass
@@ -464,219 +573,8 @@ class OctvFlatFeature(OctvFlatBase):
     fields = 'octv_version', 'num_audio_channels', 'audio_sample_rate_0', 'audio_sample_rate_1', 'audio_sample_rate_2', 'num_detectors', 'audio_frame_index_hi_bytes', 'audio_channel', 'audio_frame_index_lo_bytes', 'audio_sample', 'type', 'frame_offset', 'detector_index',
 
 
-
-
-if False:
-    @octv_ffi_proxy
-    class OctvFlatFeature_2(OctvFlatBase):
-        #struct_type = 'OctvFlatFeature_2 *'
-        fields = 'octv_version','num_audio_channels','audio_sample_rate','audio_frame_index','audio_channel','audio_sample','detector_index','level_2_int8_0','level_2_int8_1','level_2_int16_0',
-
-
-def octv_proxy(cls, *, proxy_name = 'self_c'):
-    slots = proxy_name,
-    setattr(cls, '__slots__', slots)
-    struct_name = cls.__name__
-    struct_fields = tuple(map(operator.itemgetter(0), ffi.typeof(struct_name).fields))
-    log(f'octv_proxy: struct_name: {struct_name}, struct_fields: {struct_fields}')
-    # TODO: 'struct_fields'
-    setattr(cls, 'fields', struct_fields)
-    # Note: at first we reverse engineered, before working hard on https://cffi.readthedocs.io/en/latest/ref.html#ffi-cdata-ffi-ctype
-    #struct_fields = dir(ffi.new(struct_name + '*'))
-
-    for attr_name in struct_fields:
-        setattr(cls, attr_name, property(operator.attrgetter(f'{proxy_name}.{attr_name}')))
-        def get_attr(self, *, attr_name=attr_name):
-            return getattr(getattr(self, proxy_name), attr_name)
-        #setattr(cls, attr_name, property(get_attr))
-    return cls
-
-    log(f'octv_proxy: struct_fields 0: {struct_fields}')
-    log(f'octv_proxy: ffi.new(struct_name + "*"): {ffi.new(struct_name + "*")}')
-    log(f'octv_proxy: type(ffi.new(struct_name + "*")): {type(ffi.new(struct_name + "*"))}')
-    log(f'octv_proxy: ffi.typeof(ffi.new(struct_name + "*")): {ffi.typeof(ffi.new(struct_name + "*"))}')
-    log(f'octv_proxy: ffi.typeof(struct_name + "*"): {ffi.typeof(struct_name + "*")}')
-    log(f'octv_proxy: dir(ffi.typeof(struct_name + "*")): {dir(ffi.typeof(struct_name + "*"))}')
-    log(f'octv_proxy: dir(ffi.typeof(struct_name)): {dir(ffi.typeof(struct_name))}')
-    x = ffi.typeof(struct_name)
-    #x = ffi.typeof(struct_name + "*")
-    for field in dir(x):
-        log(f'  {field}: {getattr(x,field)}')
-
-
-    log(f'octv_proxy: ffi.typeof(struct_name).fields: {ffi.typeof(struct_name).fields}')
-    fs = ffi.typeof(struct_name).fields
-    log(f'  {tuple(x[0] for x in fs)}')
-
-    if False:
-        log(f'octv_proxy: ffi.typeof(ffi.new(struct_name + "*")).fields: {ffi.typeof(ffi.new(struct_name + "*")).fields}')
-
-        log(f'octv_proxy: getattr(ffi.new(struct_name + "*")[0], "fields"): {getattr(ffi.new(struct_name + "*")[0], "fields")}')
-        log(f'octv_proxy: type(ffi.new(struct_name + "*")[0]): {type(ffi.new(struct_name + "*")[0])}')
-        sys.stdout.flush()
-
-        struct_fields = type(ffi.new(struct_name + '*')).fields
-        log(f'octv_proxy: struct_fields 1: {struct_fields}')
-
-        sys.stdout.flush()
-        1/0
-
-    print(f'octv_terminal: cls: {cls}, struct_name: {struct_name}, struct: {struct}, fields1: {fields1}')
-
-    for attr_name in getattr(cls, fields_name):
-        def get_attr(self, *, attr_name=attr_name):
-            return getattr(getattr(self, proxy_name), attr_name)
-        setattr(cls, attr_name, property(get_attr))
-    return cls
-
-
-class OctvProxy(object):
-    proxy_name = 'self_c'
-
-    @classmethod
-    def octv_proxy(cls0, cls):
-        setattr(cls, '__slots__', (cls0.proxy_name,))
-
-        struct_name = cls.__name__
-        struct_fields = tuple(map(operator.itemgetter(0), ffi.typeof(struct_name).fields))
-        log(f'octv_proxy: struct_name: {struct_name}, struct_fields: {struct_fields}')
-        setattr(cls, 'struct_fields', struct_fields)
-        # Note: at first we reverse engineered, before working hard on https://cffi.readthedocs.io/en/latest/ref.html#ffi-cdata-ffi-ctype
-        #struct_fields = dir(ffi.new(struct_name + '*'))
-
-        for attr_name in struct_fields:
-            setattr(cls, attr_name, property(operator.attrgetter(f'{cls0.proxy_name}.{attr_name}')))
-
-        return cls
-
-    @classmethod
-    def dict_from(cls, obj_c):
-        return dict((field, getattr(obj_c, field)) for field in cls.struct_fields)
-
-    def __init__(self, obj_c):
-        # self_c is an instance of a C struct (cffi) and used as a proxy for getting most attributes
-        # struct pointer type is derived from cls name
-        setattr(self, self.proxy_name, ffi_new(f'{type(self).__name__} *', self.dict_from(obj_c)))
-        #self.self_c = ffi_new(f'{type(self).__name__} *', self.dict_from(obj_c))
-        debug and log(f'{type(self).__name__}.__init__: obj_c: {obj_c}, self.self_c: {self.self_c}')
-
-
-
-def octv_proxy(cls, *, proxy_name = 'self_c'):
-    slots = proxy_name,
-    setattr(cls, '__slots__', slots)
-    struct_name = cls.__name__
-    struct_fields = tuple(map(operator.itemgetter(0), ffi.typeof(struct_name).fields))
-    log(f'octv_proxy: struct_name: {struct_name}, struct_fields: {struct_fields}')
-    # TODO: 'struct_fields'
-    setattr(cls, 'fields', struct_fields)
-    # Note: at first we reverse engineered, before working hard on https://cffi.readthedocs.io/en/latest/ref.html#ffi-cdata-ffi-ctype
-    #struct_fields = dir(ffi.new(struct_name + '*'))
-
-    for attr_name in struct_fields:
-        setattr(cls, attr_name, property(operator.attrgetter(f'{proxy_name}.{attr_name}')))
-        def get_attr(self, *, attr_name=attr_name):
-            return getattr(getattr(self, proxy_name), attr_name)
-        #setattr(cls, attr_name, property(get_attr))
-    return cls
-
-
-@OctvProxy.octv_proxy
-class OctvFlatFeature_2(OctvProxy):
-#@octv_proxy
-#class OctvFlatFeature_2(OctvFlatBase):
-    pass
-    #struct_type = 'OctvFlatFeature_2 *'
-    #fields = 'octv_version','num_audio_channels','audio_sample_rate','audio_frame_index','audio_channel','audio_sample','detector_index','level_2_int8_0','level_2_int8_1','level_2_int16_0',
-
-of_c = ffi.new('OctvFlatFeature_2 *')
-of_c.detector_type = 0x2f
-of_c.audio_sample = 23.25
-of = OctvFlatFeature_2(of_c)
-log(f'of: {of}, of.detector_type: {hex(of.detector_type)}')
-
-
-class foon(collections.namedtuple('foon', ('foo', 'bar'))):
-    def __new__(cls, *args):
-        log(f'foon.__new__: args: {args}')
-        return super().__new__(cls, 'def', 'xxx')
-    pass
-
-x = foon('xyz')
-log(f'x: {x}')
-
-def foobar(cls):
-    log(f'foobar: dir(cls): {dir(cls)}')
-    log(f'foobar: cls.__mro__: {cls.__mro__}')
-    log(f'foobar: cls.mro(): {cls.mro()}')
-
-    struct_name = cls.__name__
-    struct_fields = tuple(map(operator.itemgetter(0), ffi.typeof(struct_name).fields))
-    log(f'foobar: struct_name: {struct_name}, struct_fields: {struct_fields}')
-    baz = collections.namedtuple(struct_name, struct_fields)
-
-    def __new__(cls, obj_c):
-        log(f'{struct_name}.__new__: obj_c: {obj_c}')
-        #return super(baz).__new__(cls, struct_fields)
-        x = dict((value,key) for key,value in enumerate(struct_fields))
-        return baz.__new__(cls, **x)
-        #return super(baz, cls).__new__(cls, **x)
-        #return super(baz, cls).__new__(cls, struct_fields)
-        #return super(baz, me).__new__(cls, struct_fields)
-        #return super(baz, me).__new__(cls, *struct_fields)
-        #return super().__new__(cls, 'def', 'xxx')
-
-
-    class classY:
-        def hello(self):
-            log(f'ClassY.hello: self: {self}')
-            return 'yow'
-
-    #me = type(struct_name, (baz, classY), dict(__new__ = staticmethod(__new__)))
-    d = dict(cls.__dict__)
-    d.update(__new__ = staticmethod(__new__))
-    me = type(struct_name, (baz,) + cls.__bases__, d)
-    #me = type(struct_name, (baz,) + cls.__bases__, dict(__new__ = staticmethod(__new__)))
-    #me = type(struct_name, (baz, cls.__mro__[1]), dict(__new__ = staticmethod(__new__)))
-    #me = type(struct_name, (cls.__mro__[1], baz), dict(__new__ = staticmethod(__new__)))
-    #me = type(struct_name, (baz,) + cls.__mro__[1:2], dict(__new__ = staticmethod(__new__)))
-    #me = type(struct_name, (baz,), {})  # , **dict(__new__=__new__))
-
-
-    #setattr(baz, '__new__', __new__)
-
-    #setattr(me, '__new__', staticmethod(__new__))
-
-    return me
-
-class classX:
-    def hello(self):
-        log(f'ClassX.hello: self: {self}')
-        return 'zayow'
-
-log(f'classX().hello(): {classX().hello()}')
-
-@foobar
-class OctvFlatFeature_2:
-#class OctvFlatFeature_2(classX):
-    def hello(self):
-        log(f'ClassZZ.hello: self: {self}')
-        return 'zzzz'
-
-    pass
-
-#foobar(OctvFlatFeature_2)
-
-y = OctvFlatFeature_2(of_c)
-log(f'y.audio_sample: {repr(y.audio_sample)}')
-log(f'y: {y}')
-log(f'y.hello(): {y.hello()}')
-
-
-
-
 # base class for getting ffi struct values, used by octv_struct
-class OctvBase:
+class OctvStructBase:
     __slots__ = ()
 
     @property
@@ -687,30 +585,6 @@ class OctvBase:
     def __str__(self):
         return self._as_json
 
-    @ffi.def_extern()
-    @staticmethod
-    def octv_error_cb(error_code, payload, user_data_c):
-        # called from C when the parser has encountered an error
-        try:
-            log(f'OctvBase.octv_error_cb: error_code: {error_code} payload: {payload}, user_data_c: {user_data_c}')
-            send = ffi.from_handle(user_data_c) if user_data_c != ffi.NULL else None
-            # TODO: how to handle C errors, separate error_user_data_c, or attribute on send
-            return error_code
-        except Exception as error:
-            # secondary exception (from client's python code reached from send
-            # want to create a python exception that is raised once we're back in python land...
-            # e.g. via a new_handle attached to user_data
-            log(f'OctvBase.octv_error_cb: error: {type(error).__name__}: error: {error}')
-            return lib.OCTV_ERROR_CLIENT
-        finally:
-            # we're about to return into C code, so flush stdout
-            sys.stdout.flush()
-
-    @staticmethod
-    def send(terminal, user_data_c):
-        # TODO: user_data needs formal structure for send and for error
-        send = ffi.from_handle(user_data_c) if user_data_c != ffi.NULL else None
-        return send(terminal) if callable(send) else 0
 
 # class decorator
 # include a namedtuple (derived from the cls name, an ffi struct) in cls's bases
@@ -727,10 +601,8 @@ def octv_struct(cls):
         debug and log(f'octv_struct: {struct_name}.__new__: obj_c: {obj_c}')
         return struct_tuple.__new__(cls, *(getter(obj_c) for getter in field_getters))
 
-    log(f'octv_struct: cls.__bases__: {cls.__bases__}')
-    #bases = (struct_tuple, ) + cls.__bases__
-    bases = (struct_tuple, OctvBase) + cls.__bases__
-    log(f'octv_struct: bases: {bases}')
+    bases = (struct_tuple, OctvStructBase) + cls.__bases__
+    debug and log(f'octv_struct: bases: {bases}')
 
     class_dict = cls.__dict__.copy()
     class_dict.pop('__dict__', None)
@@ -740,33 +612,15 @@ def octv_struct(cls):
     return type(struct_name, bases, class_dict)
 
 @octv_struct
-#class OctvFlatFeature_2(OctvBase):
 class OctvFlatFeature_2:
     __slots__ = ()
-    pass
-
-zz = OctvFlatFeature_2(of_c)
-log(f'zz.audio_sample: {repr(zz.audio_sample)}')
-log(f'zz: {zz}')
-#log(f'zz.hello(): {zz.hello()}')
-log(f'dir(zz): {dir(zz)}')
-log(f'zz._fields: {zz._fields}')
-log(f'zz._asdict(): {zz._asdict()}')
-log(f'zz._as_json: {zz._as_json}')
-
-log(f'dir(collections.namedtuple("footuple", ("foo", "bar", "baz"))): {dir(collections.namedtuple("footuple", ("foo", "bar", "baz")))}')
-
-sys.stdout.flush()
-time.sleep(0.0625)
-
-#1/0
 
 
 @ffi.def_extern()
 def octv_flat_feature_cb(flat_feature_c, user_data_c):
     send = ffi.from_handle(user_data_c) if user_data_c != ffi.NULL else None
     flat_feature = OctvFlatFeature(flat_feature_c)
-    log(f'octv_flat_feature_cb: flat_feature_c {flat_feature_c}, user_data_c: {user_data_c}, send: {send}, flat_feature: {flat_feature}')
+    debug and log(f'octv_flat_feature_cb: flat_feature_c {flat_feature_c}, user_data_c: {user_data_c}, send: {send}, flat_feature: {flat_feature}')
     return send(flat_feature) if send is not None else 0
 
 
@@ -780,26 +634,69 @@ class OctvX(object):
             octv = OctvX.new_octv(payload)
             return ffi.from_handle(user_data)(octv) if user_data != ffi.NULL else 0
         except Exception as error:
-            log(f'OctvX.octv_class_cb: {type(error).__name__}: error: {error}')
+            log(f'OctvX.octv_class_cb: {type(error).__name__}: error: {error}', level=lib.OCTV_TRACE_ERROR)
             return 0
 
     @staticmethod
     def new_octv(payload):
-        match struct.pack('<BBBBBBBB', *payload.bytes):
-            case payload_bytes if payload_bytes[0] in OctvXFeature.type_c:
-                return OctvXFeature(payload_bytes)
-            case payload_bytes if payload_bytes.startswith(OctvXTick.type_c):
-                return OctvXTick(payload_bytes)
-            case payload_bytes if payload_bytes.startswith(OctvXMoment.type_c):
-                return OctvXMoment(payload_bytes)
-            case payload_bytes if payload_bytes.startswith(OctvXSentinel.type_c):
-                return OctvXSentinel(payload_bytes)
-            case payload_bytes if payload_bytes.startswith(OctvXConfig.type_c):
-                return OctvXConfig(payload_bytes)
-            case payload_bytes if payload_bytes.startswith(OctvXEnd.type_c):
-                return OctvXEnd(payload_bytes)
-            case _:
-                return payload_bytes
+        return OctvX.new_octv_bytes(bytes(ffi.buffer(payload)))
+
+    @staticmethod
+    def new_octv_bytes(payload_bytes):
+        # payload_bytes can be bytes or a memoryview slice, which the OctvX object references without copying
+        return OctvX.new_octv_at(payload_bytes, 0)
+
+    @staticmethod
+    def class_at(buffer, offset):
+        # the OctvX class of the payload at offset in buffer, None if the payload is not valid
+        cls, prefix = octv_x_class_table[buffer[offset]]
+        if prefix is not None and buffer[offset:offset+len(prefix)] != prefix:
+            return None
+        return cls
+
+    @staticmethod
+    def new_octv_at(buffer, offset):
+        # an OctvX view of the payload at offset in buffer, or the payload itself if it is not valid
+        cls = OctvX.class_at(buffer, offset)
+        return cls.view(buffer, offset) if cls is not None else buffer[offset:offset+8]
+
+    @staticmethod
+    def iter_octv(buffer):
+        r"""
+        Generate OctvX objects for each complete payload in buffer, e.g. from open_file_mmap.  Each
+        object is a view of buffer at the payload's offset, invalid payloads are generated as
+        slices of buffer.
+
+        >>> [type(octv).__name__ for octv in OctvX.iter_octv(memoryview(b'Octv\xa4\x6d\xae\xb6' b'\x70\x01\x01\x02\x00\x00\x40\x3f'))]
+        ['OctvXSentinel', 'OctvXTick']
+        """
+        size = len(buffer) - len(buffer) % 8
+        for offset, (type,) in zip(range(0, size, 8), octv_x_type_struct.iter_unpack(memoryview(buffer)[:size])):
+            cls, prefix = octv_x_class_table[type]
+            if cls is None or prefix is not None and buffer[offset:offset+len(prefix)] != prefix:
+                yield buffer[offset:offset+8]
+            else:
+                yield cls.view(buffer, offset)
+
+    @staticmethod
+    def iter_unpack(buffer):
+        r"""
+        Batch decode of buffer without creating terminal objects, generating a tuple of the OctvX
+        class and the unpacked fields of each complete payload, see OctvXBase.unpacked.  The class
+        is None, and the fields are empty, for payloads that are not valid.
+
+        >>> [(cls.__name__, fields) for cls, fields in OctvX.iter_unpack(open('test2.octv', 'rb').read())][1:5]
+        [('OctvXConfig', (1, 2, 128, 187, 0, 600)), ('OctvXMoment', (2,)), ('OctvXTick', (1, 513, 0.75)), ('OctvXFeature', (15, 513))]
+        """
+        size = len(buffer) - len(buffer) % 8
+        for offset, (type,) in zip(range(0, size, 8), octv_x_type_struct.iter_unpack(memoryview(buffer)[:size])):
+            cls, prefix = octv_x_class_table[type]
+            if cls is None or prefix is not None and buffer[offset:offset+len(prefix)] != prefix:
+                yield None, ()
+            elif cls.payload_struct is None:
+                yield cls, ()
+            else:
+                yield cls, cls.payload_struct.unpack_from(buffer, offset)
 
     if False:
         payload_bytes = struct.pack('<BBBBBBBB', *payload.bytes)
@@ -829,14 +726,39 @@ class OctvX(object):
         #return res
 
 
+# precompiled formats of the OctvX views, the fields of a payload are unpacked when accessed
+octv_x_type_struct = struct.Struct('<B 7x')
+octv_x_config_struct = struct.Struct('<x B B BBB H')
+octv_x_moment_struct = struct.Struct('<x xxx I')
+octv_x_tick_struct = struct.Struct('<x B H f')
+octv_x_feature_struct = struct.Struct('<x B H xxxx')
+
+# the types of each FEATURE class, with the format and the names of its level_* fields
+octv_x_levels_structs = (
+    (range(lib.OCTV_FEATURE_0_LOWER, lib.OCTV_FEATURE_0_UPPER), struct.Struct('<4x BBBB'), ('level_0_int8_0', 'level_0_int8_1', 'level_0_int8_2', 'level_0_int8_3')),
+    (range(lib.OCTV_FEATURE_2_LOWER, lib.OCTV_FEATURE_2_UPPER), struct.Struct('<4x BBH'), ('level_2_int8_0', 'level_2_int8_1', 'level_2_int16_0')),
+    (range(lib.OCTV_FEATURE_3_LOWER, lib.OCTV_FEATURE_3_UPPER), struct.Struct('<4x HH'), ('level_3_int16_0', 'level_3_int16_1')),
+    )
+octv_x_levels_table = make_dispatch_table(((types, (levels_struct, fields)) for types, levels_struct, fields in octv_x_levels_structs), (None, None))
+
 class OctvXBase(object):
+    # A view of the 8-byte payload at offset in buffer, bytes or memoryview, which is referenced,
+    # not copied, e.g. open_file_mmap or a block read from a file.  With the default offset, the
+    # buffer is the payload.
+
+    __slots__ = ('_buffer', '_offset')
+
+    payload_struct = None
+
     @property
     def type(self):
-        return self._payload[0]
+        return self._buffer[self._offset]
 
     @property
     def payload(self):
-        return self._payload
+        if self._offset == 0 and len(self._buffer) == 8:
+            return self._buffer
+        return self._buffer[self._offset:self._offset+8]
 
     @property
     def as_dict(self):
@@ -848,27 +770,40 @@ class OctvXBase(object):
 
     @property
     def unpacked(self):
-        return struct.unpack(self.struct_format, self.payload)
+        return self.payload_struct.unpack_from(self._buffer, self._offset) if self.payload_struct is not None else ()
 
     def validate_payload(self):
         # called from super().__init__ after self.payload and self.type are usable
-        if not self.payload.startswith(self.type_c):
-            raise ValueError(f'{type(self).__name__} expected payload to start with {self.type_c}, got {self.payload}')
-
-    def __init__(self, payload):
-        if not isinstance(payload, bytes):
-            raise TypeError(f'{type(self).__name__} expected payload to be bytes, got {type(payload).__name__}')
-        if len(payload) != 8:
-            raise ValueError(f'{type(self).__name__} expected payload length to be 8 bytes, got {len(payload)}')
-
-        self._payload = payload
+        if self._buffer[self._offset:self._offset+len(self.type_c)] != self.type_c:
+            raise ValueError(f'{type(self).__name__} expected payload to start with {self.type_c}, got {bytes(self.payload)}')
+
+    def __init__(self, payload, offset=None):
+        if not isinstance(payload, (bytes, memoryview)):
+            raise TypeError(f'{type(self).__name__} expected payload to be bytes or memoryview, got {type(payload).__name__}')
+        if offset is None:
+            if len(payload) != 8:
+                raise ValueError(f'{type(self).__name__} expected payload length to be 8 bytes, got {len(payload)}')
+            offset = 0
+        elif not 0 <= offset <= len(payload) - 8:
+            raise ValueError(f'{type(self).__name__} expected 8 bytes at offset {offset}, got buffer length {len(payload)}')
+
+        self._buffer = payload
+        self._offset = offset
         self.validate_payload()
 
+    @classmethod
+    def view(cls, buffer, offset):
+        # a view without the checks of __init__, for a payload that is known to be valid
+        octv = cls.__new__(cls)
+        octv._buffer = buffer
+        octv._offset = offset
+        return octv
+
     def __str__(self):
         return json.dumps(self.as_dict)
 
     def __repr__(self):
-        return f'{type(self).__name__}({self.payload})'
+        return f'{type(self).__name__}({bytes(self.payload)})'
 
 class OctvXSentinel(OctvXBase):
     r"""
@@ -881,6 +816,8 @@ class OctvXSentinel(OctvXBase):
     '{"type_name": "OctvXSentinel", "type": "0x4f", "payload": "4f_63_74_76_a4_6d_ae_b6"}'
     """
 
+    __slots__ = ()
+
     type_c = b'Octv\xa4\x6d\xae\xb6'
 
 class OctvXEnd(OctvXBase):
@@ -894,6 +831,8 @@ class OctvXEnd(OctvXBase):
     '{"type_name": "OctvXEnd", "type": "0x45", "payload": "45_6e_64_20_a4_6d_ae_b6"}'
     """
 
+    __slots__ = ()
+
     type_c = b'End \xa4\x6d\xae\xb6'
 
 
@@ -908,25 +847,28 @@ class OctvXConfig(OctvXBase):
     '{"type_name": "OctvXConfig", "type": "0x50", "payload": "50_01_02_80_bb_00_58_02", "octv_version": 1, "audio_sample_rate": 48000, "num_detectors": 600}'
     """
 
+    __slots__ = ()
+
     # includes octv_version
     type_c = b'\x50\x01'
-    struct_format = '<x B B BBB H'
+    payload_struct = octv_x_config_struct
 
     @property
     def octv_version(self):
-        return self._octv_version
+        return self.unpacked[0]
 
     @property
     def num_audio_channels(self):
-        return self._num_audio_channels
+        return self.unpacked[1]
 
     @property
     def audio_sample_rate(self):
-        return self._audio_sample_rate
+        _, _, rate0, rate1, rate2, _ = self.unpacked
+        return rate0 | (rate1 << 8) | (rate2 << 16)
 
     @property
     def num_detectors(self):
-        return self._num_detectors
+        return self.unpacked[5]
 
     @property
     def as_dict(self):
@@ -938,11 +880,6 @@ class OctvXConfig(OctvXBase):
         )
         return as_dict
 
-    def __init__(self, payload):
-        super().__init__(payload)
-        self._octv_version, self._num_audio_channels, rate0, rate1, rate2, self._num_detectors = self.unpacked
-        self._audio_sample_rate = rate0 | (rate1 << 8) | (rate2 << 16)
-
 
 class OctvXMoment(OctvXBase):
     r"""
@@ -955,12 +892,14 @@ class OctvXMoment(OctvXBase):
     '{"type_name": "OctvXMoment", "type": "0x60", "payload": "60_00_00_00_02_00_00_00", "audio_frame_index_hi_bytes": 131072}'
     """
 
+    __slots__ = ()
+
     type_c = b'\x60'
-    struct_format = '<x xxx I'
+    payload_struct = octv_x_moment_struct
 
     @property
     def audio_frame_index_hi_bytes(self):
-        return self._audio_frame_index_hi_bytes
+        return self.unpacked[0] << 16
 
     @property
     def as_dict(self):
@@ -970,11 +909,6 @@ class OctvXMoment(OctvXBase):
         )
         return as_dict
 
-    def __init__(self, payload):
-        super().__init__(payload)
-        self._audio_frame_index_hi_bytes, = self.unpacked
-        self._audio_frame_index_hi_bytes <<= 16
-
 
 class OctvXTick(OctvXBase):
     r"""
@@ -987,35 +921,34 @@ class OctvXTick(OctvXBase):
     '{"type_name": "OctvXTick", "type": "0x70", "payload": "70_01_01_02_00_00_40_3f", "audio_channel": 1, "audio_frame_index_lo_bytes": 513, "audio_sample": 0.75}'
     """
 
+    __slots__ = ()
+
     type_c = b'\x70'
-    struct_format = '<x B H f'
+    payload_struct = octv_x_tick_struct
 
     @property
     def audio_channel(self):
-        return self._audio_channel
+        return self.unpacked[0]
 
     @property
     def audio_frame_index_lo_bytes(self):
-        return self._audio_frame_index_lo_bytes
+        return self.unpacked[1]
 
     @property
     def audio_sample(self):
-        return self._audio_sample
+        return self.unpacked[2]
 
     @property
     def as_dict(self):
         as_dict = super().as_dict
+        audio_channel, audio_frame_index_lo_bytes, audio_sample = self.unpacked
         as_dict.update(
-            audio_channel=self._audio_channel,
-            audio_frame_index_lo_bytes=self._audio_frame_index_lo_bytes,
-            audio_sample=self._audio_sample,
+            audio_channel=audio_channel,
+            audio_frame_index_lo_bytes=audio_frame_index_lo_bytes,
+            audio_sample=audio_sample,
         )
         return as_dict
 
-    def __init__(self, payload):
-        super().__init__(payload)
-        self._audio_channel, self._audio_frame_index_lo_bytes, self._audio_sample = self.unpacked
-
 class OctvXFeature(OctvXBase):
     r"""
     >>> o = OctvXFeature(b'\x03\x0f\x01\x02\x01\x02\x04\x08')
@@ -1032,8 +965,10 @@ class OctvXFeature(OctvXBase):
     '{"type_name": "OctvXFeature", "type": "0x33", "payload": "33_0f_01_02_01_02_04_08", "frame_offset": 15, "detector_index": 513, "level_3_int16_0": 513, "level_3_int16_1": 2052}'
     """
 
+    __slots__ = ()
+
     type_c = range(lib.OCTV_FEATURE_0_LOWER, lib.OCTV_FEATURE_3_UPPER)
-    struct_format = '<x B H xxxx'
+    payload_struct = octv_x_feature_struct
 
     level_0 = range(lib.OCTV_FEATURE_0_LOWER, lib.OCTV_FEATURE_0_UPPER)
     level_2 = range(lib.OCTV_FEATURE_2_LOWER, lib.OCTV_FEATURE_2_UPPER)
@@ -1041,43 +976,29 @@ class OctvXFeature(OctvXBase):
 
     @property
     def frame_offset(self):
-        return self._frame_offset
+        return self.unpacked[0]
 
     @property
     def detector_index(self):
-        return self._detector_index
+        return self.unpacked[1]
+
+    @property
+    def levels(self):
+        # dict of the level_* fields for the type
+        levels_struct, fields = octv_x_levels_table[self.type]
+        if levels_struct is None:
+            raise AssertionError(f'should never happen, got {self.type}')
+        return dict(zip(fields, levels_struct.unpack_from(self._buffer, self._offset)))
 
     @property
     def as_dict(self):
         as_dict = super().as_dict
+        frame_offset, detector_index = self.unpacked
         as_dict.update(
-            frame_offset=self._frame_offset,
-            detector_index=self._detector_index,
+            frame_offset=frame_offset,
+            detector_index=detector_index,
         )
-        match self.type:
-            case level_0 if level_0 in self.level_0:
-                int8s = struct.unpack('<BBBB', self.payload[4:])
-                as_dict.update(
-                    level_0_int8_0 = int8s[0],
-                    level_0_int8_1 = int8s[1],
-                    level_0_int8_2 = int8s[2],
-                    level_0_int8_3 = int8s[3],
-                    )
-            case level_2 if level_2 in self.level_2:
-                int8sint16 = struct.unpack('<BBH', self.payload[4:])
-                as_dict.update(
-                    level_2_int8_0 = int8sint16[0],
-                    level_2_int8_1 = int8sint16[1],
-                    level_2_int16_0 = int8sint16[2],
-                    )
-            case level_3 if level_3 in self.level_3:
-                int16s = struct.unpack('<HH', self.payload[4:])
-                as_dict.update(
-                    level_3_int16_0 = int16s[0],
-                    level_3_int16_1 = int16s[1],
-                    )
-            case _:
-                raise AssertionError(f'should never happen, got {self.type}')
+        as_dict.update(self.levels)
         return as_dict
 
     def validate_payload(self):
@@ -1085,15 +1006,201 @@ class OctvXFeature(OctvXBase):
         if not self.type in self.type_c:
             raise ValueError(f'{type(self).__name__} expected type to be in {self.type_c}, got {self.type}')
 
-    def __init__(self, payload):
-        super().__init__(payload)
-        self._frame_offset, self._detector_index = self.unpacked
+
+# the OctvX class of each type, with the prefix that a payload of the type must also match,
+# (None, None) for unhandled types
+octv_x_class_table = make_dispatch_table((
+    (lib.OCTV_SENTINEL_TYPE, (OctvXSentinel, OctvXSentinel.type_c)),
+    (lib.OCTV_END_TYPE, (OctvXEnd, OctvXEnd.type_c)),
+    (lib.OCTV_CONFIG_TYPE, (OctvXConfig, OctvXConfig.type_c)),
+    (lib.OCTV_MOMENT_TYPE, (OctvXMoment, None)),
+    (lib.OCTV_TICK_TYPE, (OctvXTick, None)),
+    (OctvXFeature.type_c, (OctvXFeature, None)),
+    ), (None, None))
+
+
+# Pull-style iteration, an alternative to the callbacks of octv_parse_class and octv_parse_flat
+
+default_chunk_size = 1 << 20
+
+def iter_payload_blocks(path_or_file, *, chunk_size=default_chunk_size):
+    # generate memoryviews of the whole payloads in each block of chunk_size bytes read from
+    # path_or_file, a filename or a binary file object, a partial payload is joined with the next block
+    with contextlib.ExitStack() as stack:
+        file = stack.enter_context(open(path_or_file, 'rb')) if isinstance(path_or_file, (str, os.PathLike)) else path_or_file
+        pending = b''
+        while True:
+            block = file.read(chunk_size)
+            if not block: break
+            if pending:
+                block = pending + block
+            size = len(block) - len(block) % 8
+            pending = block[size:]
+            yield memoryview(block)[:size]
+
+def iter_terminals(path_or_file, *, chunk_size=default_chunk_size):
+    """
+    Generate an OctvX object for each terminal in path_or_file, through the END terminal.  Each
+    object references a slice of the block it was read in.  An invalid payload is generated as
+    that slice, see OctvX.new_octv_bytes.
+
+    >>> [type(terminal).__name__ for terminal in iter_terminals('test2.octv', chunk_size=20)]
+    ['OctvXSentinel', 'OctvXConfig', 'OctvXMoment', 'OctvXTick', 'OctvXFeature', 'OctvXFeature', 'OctvXFeature', 'OctvXEnd']
+    """
+    for block in iter_payload_blocks(path_or_file, chunk_size=chunk_size):
+        for terminal in OctvX.iter_octv(block):
+            yield terminal
+            if isinstance(terminal, OctvXEnd): return
+
+def iter_flat_features(path_or_file, *, chunk_size=default_chunk_size):
+    """
+    Generate an O object for each FEATURE in path_or_file, with the values of its CONFIG, MOMENT,
+    and TICK context, the full audio_frame_index, and the level_* fields for its type.
+
+    >>> flat_feature = next(iter_flat_features('test2.octv'))
+    >>> flat_feature.audio_frame_index, flat_feature.audio_sample_rate, flat_feature.detector_index, flat_feature.level_0_int8_3
+    (131585, 48000, 513, 8)
+    >>> [flat_feature.type for flat_feature in iter_flat_features('test2.octv', chunk_size=1)]
+    [3, 35, 51]
+    """
+    config = moment = tick = None
+    for terminal in iter_terminals(path_or_file, chunk_size=chunk_size):
+        match terminal:
+            case OctvXFeature():
+                flat_feature = O(
+                    octv_version = config.octv_version if config is not None else 0,
+                    num_audio_channels = config.num_audio_channels if config is not None else 0,
+                    audio_sample_rate = config.audio_sample_rate if config is not None else 0,
+                    num_detectors = config.num_detectors if config is not None else 0,
+                    audio_channel = tick.audio_channel if tick is not None else 0,
+                    audio_sample = tick.audio_sample if tick is not None else 0.0,
+                    audio_frame_index = ((moment.audio_frame_index_hi_bytes if moment is not None else 0)
+                                         | (tick.audio_frame_index_lo_bytes if tick is not None else 0)),
+                    type = terminal.type,
+                    frame_offset = terminal.frame_offset,
+                    detector_index = terminal.detector_index,
+                    )
+                flat_feature.update(terminal.levels)
+                yield flat_feature
+            case OctvXTick():
+                tick = terminal
+            case OctvXMoment():
+                moment = terminal
+            case OctvXConfig():
+                config = terminal
+
+
+class OctvWriter(object):
+    r"""
+    Buffered encoder of an Octv stream, written to path_or_file, a filename or a binary file object.
+
+    start_extent() emits SENTINEL and CONFIG, tick() emits TICK, preceded by a MOMENT whenever the
+    high 32 bits of the 48-bit audio_frame_index differ from those of the current MOMENT, e.g. when
+    the low 16 bits roll over, and feature() emits a FEATURE with the level_* values for its type.
+    Terminals are packed into a buffer that is written in blocks of about buffer_size bytes.
+
+    >>> import io
+    >>> file = io.BytesIO()
+    >>> with OctvWriter(file) as writer:
+    ...     writer.start_extent(num_audio_channels=2, audio_sample_rate=48000, num_detectors=600)
+    ...     writer.tick((2 << 16) | 513, 1, 0.75)
+    ...     writer.feature(0x03, 15, 513, 1, 2, 4, 8)
+    ...     writer.feature(0x23, 15, 513, 1, 2, 2052)
+    ...     writer.feature(0x33, 15, 513, 513, 2052)
+    ...     writer.end()
+    >>> file.getvalue() == open('test2.octv', 'rb').read()
+    True
+    """
+
+    sentinel_payload = b'Octv\xa4\x6d\xae\xb6'
+    end_payload = b'End \xa4\x6d\xae\xb6'
+
+    config_struct = struct.Struct('<B B B BBB H')
+    moment_struct = struct.Struct('<B xxx I')
+    tick_struct = struct.Struct('<B B H f')
+    # (types, struct, number of level_* fields)
+    feature_structs = (
+        (range(lib.OCTV_FEATURE_0_LOWER, lib.OCTV_FEATURE_0_UPPER), struct.Struct('<B B H bbbb'), 4),
+        (range(lib.OCTV_FEATURE_2_LOWER, lib.OCTV_FEATURE_2_UPPER), struct.Struct('<B B H bbh'), 3),
+        (range(lib.OCTV_FEATURE_3_LOWER, lib.OCTV_FEATURE_3_UPPER), struct.Struct('<B B H hh'), 2),
+        )
+
+    def __init__(self, path_or_file, *, buffer_size=default_chunk_size):
+        self._stack = contextlib.ExitStack()
+        self._file = self._stack.enter_context(open(path_or_file, 'wb')) if isinstance(path_or_file, (str, os.PathLike)) else path_or_file
+        self._buffer_size = buffer_size
+        self._buffer = bytearray()
+
+        # grammar state, the high bytes of the current MOMENT, None outside a moment
+        self._in_extent = False
+        self._in_tick = False
+        self._audio_frame_index_hi_bytes = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _emit(self, payload):
+        self._buffer += payload
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+
+    def close(self):
+        self.flush()
+        self._stack.close()
+
+    def start_extent(self, num_audio_channels, audio_sample_rate, num_detectors, *, octv_version=lib.OCTV_VERSION):
+        self._emit(self.sentinel_payload)
+        self._emit(self.config_struct.pack(lib.OCTV_CONFIG_TYPE, octv_version, num_audio_channels,
+                                           audio_sample_rate & 0xff, (audio_sample_rate >> 8) & 0xff, (audio_sample_rate >> 16) & 0xff,
+                                           num_detectors))
+        self._in_extent = True
+        self._in_tick = False
+        self._audio_frame_index_hi_bytes = None
+
+    def tick(self, audio_frame_index, audio_channel, audio_sample):
+        if not self._in_extent:
+            raise ValueError(f'{type(self).__name__}.tick: expected start_extent() before the first tick')
+        if not 0 <= audio_frame_index < (1 << 48):
+            raise ValueError(f'{type(self).__name__}.tick: expected a 48-bit audio_frame_index, got {audio_frame_index}')
+
+        audio_frame_index_hi_bytes = audio_frame_index >> 16
+        if audio_frame_index_hi_bytes != self._audio_frame_index_hi_bytes:
+            self._emit(self.moment_struct.pack(lib.OCTV_MOMENT_TYPE, audio_frame_index_hi_bytes))
+            self._audio_frame_index_hi_bytes = audio_frame_index_hi_bytes
+        self._emit(self.tick_struct.pack(lib.OCTV_TICK_TYPE, audio_channel, audio_frame_index & 0xffff, audio_sample))
+        self._in_tick = True
+
+    def feature(self, type, frame_offset, detector_index, *levels):
+        # levels are the level_* values for the type, missing values are 0
+        if not self._in_tick:
+            raise ValueError(f'{self.__class__.__name__}.feature: expected tick() before a feature')
+        for types, feature_struct, num_levels in self.feature_structs:
+            if type in types:
+                if len(levels) > num_levels:
+                    raise ValueError(f'{self.__class__.__name__}.feature: expected at most {num_levels} levels for type 0x{type:02x}, got {levels}')
+                self._emit(feature_struct.pack(type, frame_offset, detector_index, *levels, *((0,) * (num_levels - len(levels)))))
+                return
+        raise ValueError(f'{self.__class__.__name__}.feature: expected a FEATURE type, got {type}')
+
+    def end(self):
+        self._emit(self.end_payload)
+        self._in_extent = self._in_tick = False
+        self._audio_frame_index_hi_bytes = None
+        self.flush()
 
 
 @ffi.def_extern()
 def octv_flat_feature_cb0(flat_feature, user_data):
     cb = ffi.from_handle(user_data) if user_data != ffi.NULL else None
-    log(f'octv_flat_feature_cb0: flat_feature {flat_feature}, user_data: {user_data}, cb: {cb}')
+    debug and log(f'octv_flat_feature_cb0: flat_feature {flat_feature}, user_data: {user_data}, cb: {cb}')
     return cb(flat_feature) if cb is not None else 0
 
 
@@ -1142,8 +1249,11 @@ def octv_errorX_cb(code, payload):
     return 0
 
 
-octv_flat_feature_fields = dir(ffi.new('OctvFlatFeature *'))
-debug and log(f'octv_flat_feature_fields: {tuple(octv_flat_feature_fields)}')
+@functools.cache
+def octv_flat_feature_fields():
+    # the OctvFlatFeature fields, in the order of dir(), built on first use rather than at import
+    return tuple(dir(ffi.new('OctvFlatFeature *')))
+
 octv_feature_0_range = range(lib.OCTV_FEATURE_0_LOWER, lib.OCTV_FEATURE_0_UPPER)
 octv_feature_2_range = range(lib.OCTV_FEATURE_2_LOWER, lib.OCTV_FEATURE_2_UPPER)
 octv_feature_3_range = range(lib.OCTV_FEATURE_3_LOWER, lib.OCTV_FEATURE_3_UPPER)
@@ -1151,7 +1261,7 @@ octv_feature_3_range = range(lib.OCTV_FEATURE_3_LOWER, lib.OCTV_FEATURE_3_UPPER)
 def flat_feature_object(flat_feature):
     ret = O()
     type = flat_feature.type
-    for field in octv_flat_feature_fields:
+    for field in octv_flat_feature_fields():
         # set all non-level_* fields, and level_* fields that match the type
         if (not field.startswith('level_')
             or field.startswith('level_0') and type in octv_feature_0_range
@@ -1163,7 +1273,6 @@ def flat_feature_object(flat_feature):
 
 def parse_flat0(file_c, flat_feature_cb):
     assert callable(flat_feature_cb), str((file_c, flat_feature_cb))
-    sys.stdout.flush()
     lib.octv_parse_flat0(file_c, lib.octv_flat_feature_cb0, ffi.NULL)
     res = lib.octv_parse_flat0(file_c, lib.octv_flat_feature_cb0, ffi_new_handle(flat_feature_cb))
 
@@ -1175,11 +1284,8 @@ def make_octv_parse_class_callbacks(send):
 
     callbacks = ffi_new('OctvParseClass *')
 
-    callbacks.user_data = ffi_new_handle(send)
-    if False:
-        # Yow! structs, (callbacks) only hold the pointer value, not the full handle object
-        referents.append(ffi.new_handle(send))
-        callbacks.user_data = referents[-1]
+    # Yow! structs, (callbacks) only hold the pointer value, not the full handle object
+    callbacks.user_data = keep_alive(callbacks, ffi_new_handle(send))
 
     if False:
         log(f'user_data: {callbacks.user_data}')
@@ -1207,34 +1313,446 @@ def make_octv_parse_flat_callbacks(send):
 
     callbacks = ffi_new('OctvParseFlat *')
 
-    callbacks.user_data = ffi_new_handle(send)
+    callbacks.user_data = keep_alive(callbacks, ffi_new_handle(send))
     callbacks.flat_feature_cb = lib.octv_flat_feature_cb
 
     return callbacks
 
+# OCTV_ERROR_* names by code, e.g. for metrics
+octv_error_names = dict((getattr(lib, name), name) for name in dir(lib) if name.startswith('OCTV_ERROR_'))
+
+def octv_code_name(code):
+    return 'OK' if code == 0 else octv_error_names.get(code, str(code))
+
+# the OctvParseStats attached in each thread
+parse_stats_local = threading.local()
+
+class OctvParseStats(object):
+    """
+    Statistics of the parse calls made by the current thread while the stats are attached, e.g. in
+    a with block.  The C parsers count the payloads they read, by type byte, and the errors they
+    pass to error callbacks, by OCTV_ERROR_* name, and time their callbacks; the Python parse
+    functions time each call and the consumer's send, and count the codes they return.
+
+    Time, in nanoseconds, is split into callback_ns, in the callbacks from C, of which send_ns is in
+    the consumer's send and crossing_ns is in the cffi crossing and the making of terminal objects,
+    and c_ns, the rest of the time in the parse calls, reading and dispatch.
+
+    >>> test2 = open('test2.octv', 'rb').read()
+    >>> with OctvParseStats() as stats:
+    ...     octv_parse_class0_buffer(test2 + test2[:12], lambda terminal: 0)
+    (4, 72)
+    >>> stats.num_calls, stats.num_terminals, stats.bytes_consumed, stats.terminals[0x4f], stats.results
+    (1, 9, 72, 2, Counter({'OCTV_ERROR_EOF': 1}))
+    >>> 0 < stats.send_ns <= stats.callback_ns <= stats.parse_ns
+    True
+    """
+    def __init__(self):
+        self.stats_c = ffi_new('OctvParseStats *')
+        self.num_calls = 0
+        self.parse_ns = 0
+        self.send_ns = 0
+        self.results = collections.Counter()
+        self._previous = None
+
+    def __enter__(self):
+        self._previous = getattr(parse_stats_local, 'stats', None), lib.octv_parse_stats_attach(self.stats_c)
+        parse_stats_local.stats = self
+        return self
+
+    def __exit__(self, *exc_info):
+        previous, previous_c = self._previous
+        parse_stats_local.stats = previous
+        lib.octv_parse_stats_attach(previous_c)
+        self._previous = None
+
+    @property
+    def terminals(self):
+        # counts of the payloads read, by type byte
+        return collections.Counter(dict((octv_type, count) for octv_type, count in enumerate(self.stats_c.terminals_by_type) if count))
+
+    @property
+    def num_terminals(self):
+        return sum(self.stats_c.terminals_by_type)
+
+    @property
+    def bytes_consumed(self):
+        return self.stats_c.bytes_consumed
+
+    @property
+    def errors(self):
+        # counts of the errors passed to error callbacks, by OCTV_ERROR_* name
+        return collections.Counter(dict((octv_code_name(code), count) for code, count in enumerate(self.stats_c.errors_by_code) if count))
+
+    @property
+    def callback_ns(self):
+        return self.stats_c.callback_ns
+
+    @property
+    def crossing_ns(self):
+        return max(self.callback_ns - self.send_ns, 0)
+
+    @property
+    def c_ns(self):
+        return max(self.parse_ns - self.callback_ns, 0)
+
+    @property
+    def terminals_per_second(self):
+        return self.num_terminals * 1e9 / self.parse_ns if self.parse_ns else 0.0
+
+    def as_dict(self):
+        # flat name: number metrics, e.g. for export to a metrics system
+        metrics = dict(
+            num_calls=self.num_calls,
+            num_terminals=self.num_terminals,
+            bytes_consumed=self.bytes_consumed,
+            parse_ns=self.parse_ns,
+            c_ns=self.c_ns,
+            callback_ns=self.callback_ns,
+            crossing_ns=self.crossing_ns,
+            send_ns=self.send_ns,
+            terminals_per_second=self.terminals_per_second,
+            )
+        metrics.update((f'terminals.0x{octv_type:02x}', count) for octv_type, count in sorted(self.terminals.items()))
+        metrics.update((f'errors.{name}', count) for name, count in sorted(self.errors.items()))
+        metrics.update((f'results.{name}', count) for name, count in sorted(self.results.items()))
+        return metrics
+
+    def timed_send(self, send):
+        # send, adding the time spent in it to send_ns
+        def timed_send(*args):
+            start_ns = time.perf_counter_ns()
+            try:
+                return send(*args)
+            finally:
+                self.send_ns += time.perf_counter_ns() - start_ns
+        return timed_send
+
+    def record(self, parse, source, send, *args, **kwargs):
+        if callable(send):
+            send = self.timed_send(send)
+        start_ns = time.perf_counter_ns()
+        try:
+            res = parse(source, send, *args, **kwargs)
+        finally:
+            self.parse_ns += time.perf_counter_ns() - start_ns
+            self.num_calls += 1
+        self.results[octv_code_name(res[0] if isinstance(res, tuple) else res)] += 1
+        return res
+
+def parse_stats_recorded(parse):
+    # decorator for parse functions of (source, send, ...), recording into the attached OctvParseStats, if any
+    @functools.wraps(parse)
+    def parse_recorded(source, send, *args, **kwargs):
+        stats = getattr(parse_stats_local, 'stats', None)
+        if stats is None:
+            return parse(source, send, *args, **kwargs)
+        return stats.record(parse, source, send, *args, **kwargs)
+    return parse_recorded
+
+@parse_stats_recorded
 def octv_parse_class(file_c, send):
     callbacks = make_octv_parse_class_callbacks(send)
 
-    sys.stdout.flush()
     res = lib.octv_parse_class(file_c, callbacks)
     #res = lib.octv_parse_class(file_c, ffi.NULL)
     #res = lib.octv_parse_class(file_c, lib.octv_class_cb, ffi.new_handle(send))
 
     return res
 
+@parse_stats_recorded
 def octv_parse_flat(file_c, send):
     callbacks = make_octv_parse_flat_callbacks(send)
 
-    sys.stdout.flush()
     res = lib.octv_parse_flat(file_c, callbacks)
 
     return res
 
+def make_octv_filter(*, feature_types=None, detector_index=None, audio_channels=None, audio_frame_index=None, level_threshold=None):
+    """
+    An OctvFilter for octv_parse_class_filter and octv_parse_flat_filter, each argument that is
+    not None restricts what is accepted: feature_types and audio_channels are iterables of the
+    accepted values, detector_index and audio_frame_index are ranges, or (start, stop) pairs, and
+    a FEATURE is accepted when any of the level_* fields of its type is at least level_threshold.
+
+    >>> octv_filter = make_octv_filter(feature_types=(0x03, 0x33), detector_index=range(500, 600), audio_channels=(1,))
+    >>> hex(octv_filter.feature_types), octv_filter.detector_index_lower, octv_filter.detector_index_upper, hex(octv_filter.audio_channels[0])
+    ('0x8000000000008', 500, 600, '0x2')
+    >>> feature_c = ffi.new('OctvFeature *', dict(type=0x33, detector_index=513, level_3_int16_0=-5, level_3_int16_1=7))
+    >>> lib.octv_filter_feature(octv_filter, feature_c, 1, 0), lib.octv_filter_feature(octv_filter, feature_c, 0, 0)
+    (1, 0)
+    >>> lib.octv_filter_feature(make_octv_filter(level_threshold=8), feature_c, 0, 0), lib.octv_filter_feature(make_octv_filter(level_threshold=7), feature_c, 0, 0)
+    (0, 1)
+    """
+    def bounds(name, values, upper):
+        start, stop = (values.start, values.stop) if isinstance(values, range) else values
+        if not 0 <= start <= stop <= upper:
+            raise ValueError(f'make_octv_filter: expected {name} within 0 to {upper}, got {start} to {stop}')
+        return start, stop
+
+    octv_filter = ffi.new('OctvFilter *')
+    lib.octv_filter_init(octv_filter)
+
+    if feature_types is not None:
+        octv_filter.feature_types = 0
+        for feature_type in feature_types:
+            if feature_type not in range(lib.OCTV_FEATURE_0_LOWER, lib.OCTV_FEATURE_3_UPPER):
+                raise ValueError(f'make_octv_filter: expected FEATURE types, got {feature_type}')
+            octv_filter.feature_types |= 1 << feature_type
+    if detector_index is not None:
+        octv_filter.detector_index_lower, octv_filter.detector_index_upper = bounds('detector_index', detector_index, 1 << 16)
+    if audio_channels is not None:
+        channel_masks = [0] * 4
+        for audio_channel in audio_channels:
+            if audio_channel not in range(256):
+                raise ValueError(f'make_octv_filter: expected audio_channels within 0 to 255, got {audio_channel}')
+            channel_masks[audio_channel >> 6] |= 1 << (audio_channel & 63)
+        octv_filter.audio_channels = channel_masks
+    if audio_frame_index is not None:
+        octv_filter.audio_frame_index_lower, octv_filter.audio_frame_index_upper = bounds('audio_frame_index', audio_frame_index, 1 << 48)
+    if level_threshold is not None:
+        octv_filter.level_threshold = level_threshold
+
+    return octv_filter
+
+@parse_stats_recorded
+def octv_parse_class_filter(file_c, send, octv_filter):
+    # octv_parse_class, only the TICKs and FEATUREs that octv_filter accepts are sent
+    callbacks = make_octv_parse_class_callbacks(send)
+
+    return lib.octv_parse_class_filter(file_c, callbacks, octv_filter)
+
+@parse_stats_recorded
+def octv_parse_flat_filter(file_c, send, octv_filter):
+    # octv_parse_flat, only the features that octv_filter accepts are sent
+    callbacks = make_octv_parse_flat_callbacks(send)
+
+    return lib.octv_parse_flat_filter(file_c, callbacks, octv_filter)
+
+@parse_stats_recorded
 def octv_parse_class0(file_c, send):
-    sys.stdout.flush()
     res = lib.octv_parse_class0(file_c, lib.octv_class_cb, ffi_new_handle(send))
     return res
 
+def buffer_c_from(buffer):
+    # a uint8_t[] view of bytes, bytearray, or memoryview, without copying
+    return ffi.from_buffer('uint8_t[]', buffer)
+
+@parse_stats_recorded
+def octv_parse_class_buffer(buffer, send):
+    # parse the payloads in buffer, returns the code and the number of bytes consumed
+    callbacks = make_octv_parse_class_callbacks(send)
+    buffer_c = buffer_c_from(buffer)
+    consumed_c = ffi.new('size_t *')
+
+    res = lib.octv_parse_class_buffer(buffer_c, len(buffer_c), consumed_c, callbacks)
+
+    return res, consumed_c[0]
+
+def make_octv_flat_parser():
+    # the context of flat parsing, for octv_parse_flat_buffer calls that resume where the previous one stopped
+    flat_parser = ffi_new('OctvFlatParser *')
+    lib.octv_flat_parser_init(flat_parser)
+    return flat_parser
+
+@parse_stats_recorded
+def octv_parse_flat_buffer(buffer, send, flat_parser=None):
+    # parse the payloads in buffer, returns the code and the number of bytes consumed; pass the same
+    # flat_parser, from make_octv_flat_parser, to each call when buffer + consumed is resumed in a later call
+    callbacks = make_octv_parse_flat_callbacks(send)
+    buffer_c = buffer_c_from(buffer)
+    consumed_c = ffi.new('size_t *')
+    if flat_parser is None:
+        flat_parser = make_octv_flat_parser()
+
+    res = lib.octv_parse_flat_parser_buffer(buffer_c, len(buffer_c), consumed_c, callbacks, flat_parser)
+
+    return res, consumed_c[0]
+
+@parse_stats_recorded
+def octv_parse_class0_buffer(buffer, send):
+    buffer_c = buffer_c_from(buffer)
+    consumed_c = ffi.new('size_t *')
+
+    res = lib.octv_parse_class0_buffer(buffer_c, len(buffer_c), consumed_c, lib.octv_class_cb, ffi_new_handle(send))
+
+    return res, consumed_c[0]
+
+# the OctvPayload union member of each terminal name
+octv_payload_members = dict(
+    sentinel='delimiter',
+    end='delimiter',
+    config='config',
+    moment='moment',
+    tick='tick',
+    feature='feature',
+    )
+
+class OctvCursor(object):
+    r"""
+    A flyweight terminal that is rebound to each payload in turn, for consumers that do not keep
+    terminals, so that parsing creates no object per terminal.  The fields are read from the
+    payload the cursor is bound to, which is only valid until the cursor is rebound, so consumers
+    copy out what they keep.
+
+    The terminal_name is that of the payload's type, the delimiters and CONFIG are not validated.
+
+    >>> terminals = [(cursor.terminal_name, cursor.type) for cursor in OctvCursor().iter_buffer(open('test2.octv', 'rb').read())]
+    >>> terminals[:4], len(terminals)
+    ([('sentinel', 79), ('config', 80), ('moment', 96), ('tick', 112)], 8)
+    >>> cursor = OctvCursor().bind(ffi.new('OctvPayload *', dict(tick=dict(type=0x70, audio_frame_index_lo_bytes=513))))
+    >>> cursor.terminal_name, cursor.audio_frame_index_lo_bytes
+    ('tick', 513)
+    """
+    __slots__ = ('payload_c', 'terminal_name', 'terminal_c')
+
+    def __init__(self):
+        self.bind(ffi.NULL)
+
+    def bind(self, payload_c):
+        # rebind to payload_c, an OctvPayload *, or to NULL
+        self.payload_c = payload_c
+        if payload_c == ffi.NULL:
+            self.terminal_name = self.terminal_c = None
+        else:
+            self.terminal_name = octv_struct_name_table[payload_c.delimiter.type][1]
+            self.terminal_c = getattr(payload_c, octv_payload_members[self.terminal_name]) if self.terminal_name is not None else None
+        return self
+
+    @property
+    def type(self):
+        return self.payload_c.delimiter.type
+
+    def __getattr__(self, name):
+        # the fields of the bound terminal
+        if self.terminal_c is None:
+            raise AttributeError(f'{type(self).__name__}: no terminal field: {name}, terminal_name: {self.terminal_name}')
+        return getattr(self.terminal_c, name)
+
+    def iter_buffer(self, buffer):
+        # generate this cursor, bound to each payload of buffer in turn
+        buffer_c = buffer_c_from(buffer)
+        payloads_c = ffi.cast('OctvPayload *', buffer_c)
+        try:
+            for index in range(len(buffer_c) // ffi.sizeof('OctvPayload')):
+                yield self.bind(payloads_c + index)
+        finally:
+            self.bind(ffi.NULL)
+
+@ffi.def_extern()
+def octv_cursor_cb(payload_c, user_data):
+    try:
+        cursor, send = ffi.from_handle(user_data)
+        return send(cursor.bind(payload_c))
+    except Exception as error:
+        log(f'octv_cursor_cb: error: {type(error).__name__}: error: {error}', level=lib.OCTV_TRACE_ERROR)
+        return lib.OCTV_ERROR_CLIENT
+
+@parse_stats_recorded
+def octv_parse_cursor(file_c, send, *, cursor=None):
+    # parse with octv_parse_class0, calling send with cursor, or a new OctvCursor, bound to each payload
+    cursor = cursor if cursor is not None else OctvCursor()
+    try:
+        return lib.octv_parse_class0(file_c, lib.octv_cursor_cb, ffi_new_handle((cursor, send)))
+    finally:
+        cursor.bind(ffi.NULL)
+
+@parse_stats_recorded
+def octv_parse_cursor_buffer(buffer, send, *, cursor=None):
+    # see octv_parse_cursor and octv_parse_class_buffer
+    cursor = cursor if cursor is not None else OctvCursor()
+    buffer_c = buffer_c_from(buffer)
+    consumed_c = ffi.new('size_t *')
+    try:
+        res = lib.octv_parse_class0_buffer(buffer_c, len(buffer_c), consumed_c, lib.octv_cursor_cb, ffi_new_handle((cursor, send)))
+    finally:
+        cursor.bind(ffi.NULL)
+    return res, consumed_c[0]
+
+@parse_stats_recorded
+def octv_parse_full_buffer(buffer, parser):
+    buffer_c = buffer_c_from(buffer)
+    consumed_c = ffi.new('size_t *')
+
+    res = lib.octv_parse_full_buffer(buffer_c, len(buffer_c), consumed_c, parser)
+
+    return res, consumed_c[0]
+
+def octv_find_sentinel(buffer, start=0):
+    # offset of the first SENTINEL in buffer at or after start, at any alignment, or len(buffer)
+    buffer_c = buffer_c_from(buffer)
+    return lib.octv_find_sentinel(buffer_c, len(buffer_c), start)
+
+def octv_parse_class_resync(buffer, send):
+    # Parse buffer like octv_parse_class_buffer, but recover from damage to the stream: after an
+    # invalid payload (OCTV_ERROR_TYPE or OCTV_ERROR_VALUE), scan for the next SENTINEL, at any byte
+    # alignment, and resume parsing there.
+    #
+    # Returns the code, the bytes consumed, and a list with an O for each damaged range of bytes,
+    # start to stop, with the audio_frame_index of the last TICK before the damage and of the first
+    # TICK after it, and frames_lost, the frames strictly between them (None until both are known).
+    #
+    # Damage that shifts the alignment can produce valid-looking terminals before an invalid payload
+    # is detected, these have already been sent.  An unaligned SENTINEL among them is still found,
+    # the scan starts just after the beginning of the current segment.
+    buffer = memoryview(buffer).cast('B')
+    damages = list()
+    frames = O(audio_frame_index_hi_bytes=0, audio_frame_index=None)
+
+    def send_tracking(terminal):
+        # track the frame index of the TICKs, for reporting frames lost to damage
+        match terminal:
+            case OctvMoment():
+                frames.audio_frame_index_hi_bytes = terminal.audio_frame_index_hi_bytes
+            case OctvTick():
+                frames.audio_frame_index = (frames.audio_frame_index_hi_bytes << 16) | terminal.audio_frame_index_lo_bytes
+                for damage in damages:
+                    if damage.audio_frame_index_after is None:
+                        damage.audio_frame_index_after = frames.audio_frame_index
+                        if damage.audio_frame_index_before is not None:
+                            damage.frames_lost = max(0, damage.audio_frame_index_after - damage.audio_frame_index_before - 1)
+        return send(terminal) if callable(send) else 0
+
+    segment_start = 0
+    while True:
+        res, consumed = octv_parse_class_buffer(buffer[segment_start:], send_tracking)
+        consumed += segment_start
+        if res not in (lib.OCTV_ERROR_TYPE, lib.OCTV_ERROR_VALUE):
+            return res, consumed, damages
+
+        # the invalid payload, aligned SENTINELs before it have already been parsed
+        bad_start = consumed - ffi.sizeof('OctvPayload')
+        sentinel = octv_find_sentinel(buffer, segment_start + 1)
+        while sentinel < bad_start and (sentinel - segment_start) % ffi.sizeof('OctvPayload') == 0:
+            sentinel = octv_find_sentinel(buffer, sentinel + 1)
+
+        start = min(bad_start, sentinel - (sentinel - segment_start) % ffi.sizeof('OctvPayload'))
+        damages.append(O(start=start, stop=sentinel, audio_frame_index_before=frames.audio_frame_index, audio_frame_index_after=None, frames_lost=None))
+        debug and log(f'octv_parse_class_resync: damage: {damages[-1]}')
+
+        if sentinel >= len(buffer):
+            return lib.OCTV_ERROR_EOF, len(buffer), damages
+        segment_start = sentinel
+
+@ffi.def_extern()
+def octv_batch_cb(payloads, num_payloads, user_data):
+    # one C to Python crossing per batch, send gets a memoryview of the batch's payloads, which is
+    # only valid during the call, e.g. for np.frombuffer or OctvX.iter_octv
+    try:
+        send = ffi.from_handle(user_data) if user_data != ffi.NULL else None
+        return send(memoryview(ffi.buffer(payloads, num_payloads * ffi.sizeof('OctvPayload')))) if send is not None else 0
+    except Exception as error:
+        log(f'octv_batch_cb: error: {type(error).__name__}: error: {error}', level=lib.OCTV_TRACE_ERROR)
+        return lib.OCTV_ERROR_CLIENT
+
+@parse_stats_recorded
+def octv_parse_batch(file_c, send, *, batch_size=4096):
+    assert callable(send), str((send,))
+    payloads = ffi.new('OctvPayload[]', batch_size)
+    user_data = ffi.new_handle(send)
+    res = lib.octv_parse_batch(file_c, payloads, batch_size, lib.octv_batch_cb, user_data)
+    return res
+
 def new_parser():
     parser = ffi_new('OctvParseCallbacks *')
 
@@ -1249,9 +1767,9 @@ def new_parser():
 
     return parser
 
+@parse_stats_recorded
 def octv_parse_full(file_c, parser):
-    log(f'octv_parse_full: file_c: {file_c}, parser: {parser}')
-    sys.stdout.flush()
+    debug and log(f'octv_parse_full: file_c: {file_c}, parser: {parser}')
     res = lib.octv_parse_full(file_c, parser)
 
     return res
@@ -0,0 +1,168 @@
+import numpy as np
+
+from octv import O, default_chunk_size, iter_payload_blocks
+from octv_numpy import OctvPushParser, octv_flat_level_fields
+
+# Streaming aggregation of flat features into statistics per window of frames
+#
+# Features are grouped by frame window, type, detector_index, and audio_channel, and each group
+# has the count, sum, min, and max of a level value, and a histogram of it.  Each chunk of the
+# stream is reduced with vectorized sorts, reduceat, and a bincount of group and histogram bin, so
+# memory is proportional to the features of a chunk, and partial groups are merged with reduceat,
+# so only the groups of the window that is still open are kept between chunks.  A window is
+# complete, and its groups are generated, once a later window is seen, so frame indices are
+# assumed not to decrease through the stream.  The default window is a MOMENT, 1 << 16 frames.
+
+octv_aggregate_key_fields = ('window', 'type', 'detector_index', 'audio_channel')
+octv_aggregate_stat_fields = ('count', 'sum', 'min', 'max', 'histogram')
+
+# edges of the histogram bins, values outside are counted in the first or last bin
+octv_default_level_bins = np.array([-32768, -4096, -512, -64, -8, 0, 8, 64, 512, 4096, 32768])
+
+
+def octv_feature_max_level(columns):
+    """
+    The level value of each flat feature, the largest of the level_* fields of its type.
+
+    >>> from octv_numpy import octv_decode_flat
+    >>> octv_feature_max_level(octv_decode_flat('test2.octv'))
+    array([   8, 2052, 2052], dtype=int32)
+    """
+    level = np.full(len(columns.type), np.iinfo(np.int32).min, dtype=np.int32)
+    for (lower, upper), fields in octv_flat_level_fields:
+        in_range = (lower <= columns.type) & (columns.type < upper)
+        for field in fields:
+            level = np.where(in_range, np.maximum(level, columns[field]), level)
+    return level
+
+
+def octv_aggregate_rows(columns, *, window_frames, level_bins, level):
+    # one row per flat feature, with the index of its histogram bin rather than a histogram
+    values = level(columns).astype(np.int64)
+    num_bins = len(level_bins) - 1
+    bins = np.clip(np.searchsorted(level_bins, values, side='right') - 1, 0, num_bins - 1)
+    return O(
+        window=columns.audio_frame_index // np.uint64(window_frames),
+        type=columns.type,
+        detector_index=columns.detector_index,
+        audio_channel=columns.audio_channel,
+        count=np.ones(len(values), dtype=np.int64),
+        sum=values,
+        min=values,
+        max=values,
+        bin=bins,
+        )
+
+
+def octv_aggregate_select(groups, selection):
+    return O((field, groups[field][selection]) for field in octv_aggregate_key_fields + octv_aggregate_stat_fields)
+
+
+def octv_aggregate_concatenate(groups_list):
+    return O((field, np.concatenate([groups[field] for groups in groups_list])) for field in octv_aggregate_key_fields + octv_aggregate_stat_fields)
+
+
+def octv_aggregate_order(rows):
+    # the order of rows by key, window first, and where each key starts in that order
+    order = np.lexsort(tuple(rows[field] for field in reversed(octv_aggregate_key_fields)))
+    new_key = np.zeros(len(order), dtype=bool)
+    new_key[0] = True
+    for field in octv_aggregate_key_fields:
+        ordered = rows[field][order]
+        new_key[1:] |= ordered[1:] != ordered[:-1]
+    return order, new_key
+
+
+def octv_aggregate_reduce_stats(rows, order, starts):
+    reduced = O((field, rows[field][order][starts]) for field in octv_aggregate_key_fields)
+    reduced.count = np.add.reduceat(rows.count[order], starts)
+    reduced.sum = np.add.reduceat(rows.sum[order], starts)
+    reduced.min = np.minimum.reduceat(rows.min[order], starts)
+    reduced.max = np.maximum.reduceat(rows.max[order], starts)
+    return reduced
+
+
+def octv_aggregate_reduce_rows(rows, num_bins):
+    """
+    Combine the feature rows of octv_aggregate_rows that have the same key into groups ordered by
+    key, window first.  The histograms are counted with a bincount of group and bin, so no array
+    is larger than the number of features or the groups' histograms.
+    """
+    if len(rows.window) == 0:
+        empty = O((field, rows[field]) for field in octv_aggregate_key_fields + ('count', 'sum', 'min', 'max'))
+        empty.histogram = np.zeros((0, num_bins), dtype=np.int64)
+        return empty
+    order, new_key = octv_aggregate_order(rows)
+    starts = np.flatnonzero(new_key)
+    reduced = octv_aggregate_reduce_stats(rows, order, starts)
+    group = np.cumsum(new_key) - 1
+    reduced.histogram = np.bincount(group * num_bins + rows.bin[order], minlength=len(starts) * num_bins).reshape(len(starts), num_bins)
+    return reduced
+
+
+def octv_aggregate_reduce(groups):
+    """
+    Combine the rows of groups, partial aggregates, that have the same key, the result is ordered
+    by key, window first.
+    """
+    if len(groups.window) == 0:
+        return groups
+    order, new_key = octv_aggregate_order(groups)
+    starts = np.flatnonzero(new_key)
+    reduced = octv_aggregate_reduce_stats(groups, order, starts)
+    reduced.histogram = np.add.reduceat(groups.histogram[order], starts, axis=0)
+    return reduced
+
+
+def octv_aggregate_batches(batches, *, window_frames=1 << 16, level_bins=octv_default_level_bins, level=octv_feature_max_level):
+    """
+    Generate the groups of each completed window, from batches of columnar flat features, e.g. the
+    flat of OctvPushParser.feed(), see octv_aggregate for the groups.
+    """
+    pending = None
+    for columns in batches:
+        if len(columns.type) == 0: continue
+        rows = octv_aggregate_rows(columns, window_frames=window_frames, level_bins=level_bins, level=level)
+        groups = octv_aggregate_reduce_rows(rows, len(level_bins) - 1)
+        if pending is not None:
+            groups = octv_aggregate_reduce(octv_aggregate_concatenate([pending, groups]))
+
+        complete = groups.window < groups.window.max()
+        if complete.any():
+            yield octv_aggregate_with_frames(octv_aggregate_select(groups, complete), window_frames)
+        pending = octv_aggregate_select(groups, ~complete)
+
+    if pending is not None and len(pending.window) > 0:
+        yield octv_aggregate_with_frames(pending, window_frames)
+
+
+def octv_aggregate_with_frames(groups, window_frames):
+    # the first audio_frame_index of each group's window
+    groups.audio_frame_index = groups.window * np.uint64(window_frames)
+    return groups
+
+
+def octv_aggregate(path_or_file, *, chunk_size=default_chunk_size, **kwargs):
+    """
+    Generate per-window statistics of the flat features of an Octv file, path_or_file is a
+    filename or a binary file object, read in blocks of chunk_size bytes, up to END.
+
+    Each generated O has arrays, one entry per group, of the key fields window, type,
+    detector_index, and audio_channel, of audio_frame_index, the first frame of the window, and of
+    count, sum, min, and max of the level values, and histogram, counts of the level values in the
+    level_bins, with one row per group.  The keyword arguments are those of octv_aggregate_batches:
+    window_frames, the frames per window, level_bins, the edges of the histogram bins, and level, a
+    function of flat columns that returns the level value of each feature.
+
+    >>> groups, = octv_aggregate('test2.octv', level_bins=np.array([0, 10, 10000]))
+    >>> groups.window, groups.type, groups.count, groups.max
+    (array([2, 2, 2], dtype=uint64), array([ 3, 35, 51], dtype=uint8), array([1, 1, 1]), array([   8, 2052, 2052]))
+    >>> groups.histogram.tolist(), groups.audio_frame_index
+    ([[1, 0], [0, 1], [0, 1]], array([131072, 131072, 131072], dtype=uint64))
+    """
+    parser = OctvPushParser()
+    def iter_flat():
+        for block in iter_payload_blocks(path_or_file, chunk_size=chunk_size):
+            yield parser.feed(block).flat
+            if parser.ended: break
+    yield from octv_aggregate_batches(iter_flat(), **kwargs)
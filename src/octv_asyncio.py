@@ -0,0 +1,67 @@
+import asyncio
+
+from octv import OctvX
+from octv_numpy import OctvPushParser, octv_flat_records
+
+# asyncio iteration over Octv streams, e.g. for one event loop serving many devices
+#
+# Each read is decoded as one vectorized batch by OctvPushParser, so the work done between awaits
+# is bounded by chunk_size, and the CONFIG, MOMENT, and TICK state carries across reads.  Iteration
+# stops after the END terminal of the stream.
+
+default_chunk_size = 1 << 16
+
+async def octv_aiter_batches(reader, *, chunk_size=default_chunk_size, parser=None):
+    r"""
+    Asynchronously generate the batches of OctvPushParser.feed() for the data from reader, an
+    asyncio.StreamReader, until END or eof.  After END, parser.trailing holds what followed END in
+    the last read.
+
+    >>> async def main(parser):
+    ...     reader = asyncio.StreamReader()
+    ...     reader.feed_data(open('test2.octv', 'rb').read() + b'Octv\xa4\x6d\xae\xb6')
+    ...     reader.feed_eof()
+    ...     return [len(batch.terminals.payloads) async for batch in octv_aiter_batches(reader, chunk_size=20, parser=parser)]
+    >>> parser = OctvPushParser()
+    >>> asyncio.run(main(parser)), parser.trailing
+    ([2, 3, 2, 1], b'Octv\xa4m\xae\xb6')
+    """
+    parser = parser if parser is not None else OctvPushParser()
+    while not parser.ended:
+        chunk = await reader.read(chunk_size)
+        if not chunk: break
+        yield parser.feed(chunk)
+
+async def octv_aiter_terminals(reader, *, chunk_size=default_chunk_size):
+    r"""
+    Asynchronously generate an OctvX object for each terminal from reader.
+
+    >>> async def main():
+    ...     reader = asyncio.StreamReader()
+    ...     reader.feed_data(open('test2.octv', 'rb').read())
+    ...     reader.feed_eof()
+    ...     return [type(terminal).__name__ async for terminal in octv_aiter_terminals(reader, chunk_size=20)]
+    >>> asyncio.run(main())
+    ['OctvXSentinel', 'OctvXConfig', 'OctvXMoment', 'OctvXTick', 'OctvXFeature', 'OctvXFeature', 'OctvXFeature', 'OctvXEnd']
+    """
+    async for batch in octv_aiter_batches(reader, chunk_size=chunk_size):
+        # bytes, the payloads view can reference a chunk that the reader reuses
+        for terminal in OctvX.iter_octv(memoryview(batch.terminals.payloads.tobytes())):
+            yield terminal
+
+async def octv_aiter_flat_features(reader, *, chunk_size=default_chunk_size):
+    """
+    Asynchronously generate a record for each flat feature from reader, with the fields of
+    octv_numpy.octv_flat_columns_fields.
+
+    >>> async def main():
+    ...     reader = asyncio.StreamReader()
+    ...     reader.feed_data(open('test2.octv', 'rb').read())
+    ...     reader.feed_eof()
+    ...     return [(int(feature['type']), int(feature['audio_frame_index'])) async for feature in octv_aiter_flat_features(reader, chunk_size=20)]
+    >>> asyncio.run(main())
+    [(3, 131585), (35, 131585), (51, 131585)]
+    """
+    async for batch in octv_aiter_batches(reader, chunk_size=chunk_size):
+        for feature in octv_flat_records(batch.flat):
+            yield feature
@@ -0,0 +1,326 @@
+import sys, os
+import json
+import time
+import platform
+import resource
+import tempfile
+import datetime
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from octv_cffi import ffi, lib
+
+import octv
+from octv import O
+from octv_numpy import octv_encode_flat, octv_flat_level_fields
+
+# Benchmarks of the parse APIs on streams of realistic density
+#
+# A stream has a TICK for every frame of every audio channel, each followed by features_per_tick
+# FEATUREs, dozens in practice, of random types, detectors, and levels, with a MOMENT every 65536
+# frames; it is generated with numpy and octv_numpy.octv_encode_flat.  Each case parses the whole
+# stream through one API with a send that only counts, and records the time of every batch of
+# batch_deliveries calls to send, for the latency per batch.  By default each stream is generated,
+# and each case is run, in a fresh process, so that peak RSS, ru_maxrss, is that of the case; on
+# Linux a child starts with the ru_maxrss of its parent, which therefore stays small.  Results are JSON, see
+# octv_bench_compare for comparing them with a baseline.
+
+octv_bench_schema = 'octv_bench/1'
+
+# the default streams, from 2 channels and 600 detectors to 4 channels and 1440 detectors, each
+# crossing two MOMENTs
+octv_bench_streams = (
+    O(name='2ch-600det-24fpt', num_audio_channels=2, num_detectors=600, features_per_tick=24, num_frames=8192, start_frame=(1 << 16) - 4096),
+    O(name='4ch-1440det-48fpt', num_audio_channels=4, num_detectors=1440, features_per_tick=48, num_frames=8192, start_frame=(1 << 16) - 4096),
+    )
+
+
+def octv_bench_columns(*, num_audio_channels, num_detectors, features_per_tick, num_frames, start_frame=0, seed=0):
+    """
+    Columnar flat features of a benchmark stream, for octv_numpy.octv_encode_flat: every frame from
+    start_frame has a TICK on each audio channel with features_per_tick features.
+
+    >>> columns = octv_bench_columns(num_audio_channels=2, num_detectors=600, features_per_tick=3, num_frames=2, start_frame=(1 << 16) - 1)
+    >>> columns.audio_frame_index.tolist(), columns.audio_channel.tolist()
+    ([65535, 65535, 65535, 65535, 65535, 65535, 65536, 65536, 65536, 65536, 65536, 65536], [0, 0, 0, 1, 1, 1, 0, 0, 0, 1, 1, 1])
+    >>> len(octv_encode_flat(columns, num_audio_channels=2, audio_sample_rate=48000, num_detectors=600))
+    21
+    """
+    rng = np.random.default_rng(seed)
+    num_ticks = num_frames * num_audio_channels
+    num_features = num_ticks * features_per_tick
+
+    audio_frame_index = np.repeat(np.arange(start_frame, start_frame + num_frames, dtype=np.uint64), num_audio_channels * features_per_tick)
+    audio_channel = np.tile(np.repeat(np.arange(num_audio_channels, dtype=np.uint8), features_per_tick), num_frames)
+    columns = O(
+        audio_frame_index=audio_frame_index,
+        audio_channel=audio_channel,
+        audio_sample=np.repeat(rng.uniform(-1, 1, num_ticks).astype(np.float32), features_per_tick),
+        type=rng.integers(lib.OCTV_FEATURE_0_LOWER, lib.OCTV_FEATURE_3_UPPER, num_features, dtype=np.uint8),
+        frame_offset=rng.integers(0, 256, num_features, dtype=np.uint8),
+        detector_index=rng.integers(0, num_detectors, num_features, dtype=np.uint16),
+        )
+    for types, fields in octv_flat_level_fields:
+        for field in fields:
+            info = np.iinfo(np.int8 if 'int8' in field else np.int16)
+            columns[field] = rng.integers(info.min, info.max + 1, num_features, dtype=info.dtype)
+    return columns
+
+
+def octv_bench_write_stream(path, stream, *, seed=0):
+    # write the benchmark stream described by stream, one of octv_bench_streams, to path, returns the number of payloads
+    columns = octv_bench_columns(
+        num_audio_channels=stream.num_audio_channels, num_detectors=stream.num_detectors,
+        features_per_tick=stream.features_per_tick, num_frames=stream.num_frames, start_frame=stream.start_frame, seed=seed)
+    payloads = octv_encode_flat(columns, num_audio_channels=stream.num_audio_channels, audio_sample_rate=48000, num_detectors=stream.num_detectors)
+    payloads.tofile(path)
+    return len(payloads)
+
+
+class OctvBenchRecorder(object):
+    # a send that counts its calls, and records the time of every batch_deliveries calls
+
+    def __init__(self, batch_deliveries):
+        self.batch_deliveries = batch_deliveries
+        self.num_deliveries = 0
+        self.batch_ns = [time.perf_counter_ns()]
+
+    def __call__(self, *args):
+        self.num_deliveries += 1
+        if self.num_deliveries % self.batch_deliveries == 0:
+            self.batch_ns.append(time.perf_counter_ns())
+        return 0
+
+
+def octv_bench_parse_class(path, send):
+    with octv.open_file_c(path) as file_c:
+        octv.octv_parse_class(file_c, send)
+
+def octv_bench_parse_flat(path, send):
+    with octv.open_file_c(path) as file_c:
+        octv.octv_parse_flat(file_c, send)
+
+def octv_bench_parse_class0(path, send):
+    with octv.open_file_c(path) as file_c:
+        octv.octv_parse_class0(file_c, send)
+
+def octv_bench_parse_full(path, send):
+    # OctvParseCallbacks have no user_data, and the octv_*X_cb callbacks of new_parser() only log,
+    # so each callback is a cffi callback that calls send with the terminal pointer itself; these
+    # cross from C a little more slowly than the extern "Python" callbacks of the other cases
+    parser = ffi.new('OctvParseCallbacks *')
+    callbacks = list()
+    for field, field_type in ffi.typeof('OctvParseCallbacks').fields:
+        callback = ffi.callback(field_type.type, lambda *args: send(args[-1]))
+        callbacks.append(callback)
+        setattr(parser, field, callback)
+    with octv.open_file_c(path) as file_c:
+        octv.octv_parse_full(file_c, parser)
+
+def octv_bench_octv_x(path, send):
+    # pure Python, an OctvX view of each payload of the mapped file
+    with octv.open_file_mmap(path) as file_view:
+        for terminal in octv.OctvX.iter_octv(file_view):
+            send(terminal)
+        # the views must not outlive the mapping
+        terminal = None
+
+# the namedtuple of the OctvFlatFeature fields, by octv.octv_struct
+OctvBenchFlatTuple = octv.octv_struct(type('OctvFlatFeature', (), dict(__slots__=())))
+
+def octv_bench_octv_struct(path, send):
+    # the C flat parser calling octv_flat_feature_cb0, which passes the OctvFlatFeature pointer
+    # itself, with a namedtuple of each flat feature from octv.octv_struct
+    def flat_feature_cb(flat_feature_c):
+        return send(OctvBenchFlatTuple(flat_feature_c))
+    callbacks = ffi.new('OctvParseFlat *')
+    callbacks.flat_feature_cb = lib.octv_flat_feature_cb0
+    callbacks.user_data = octv.keep_alive(callbacks, ffi.new_handle(flat_feature_cb))
+    with octv.open_file_c(path) as file_c:
+        lib.octv_parse_flat(file_c, callbacks)
+
+octv_bench_cases = dict(
+    octv_parse_class=octv_bench_parse_class,
+    octv_parse_flat=octv_bench_parse_flat,
+    octv_parse_full=octv_bench_parse_full,
+    octv_parse_class0=octv_bench_parse_class0,
+    octv_x=octv_bench_octv_x,
+    octv_struct=octv_bench_octv_struct,
+    )
+
+
+def octv_bench_peak_rss_kib():
+    # peak resident set size of this process, ru_maxrss is in KiB on Linux, in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss // 1024 if sys.platform == 'darwin' else peak_rss
+
+
+def octv_bench_case(path, case_name, *, repeat, batch_deliveries):
+    """
+    Run a case repeat times on the stream at path, returns O of its metrics from the fastest run.
+    """
+    parse = octv_bench_cases[case_name]
+    num_bytes = os.path.getsize(path)
+    num_terminals = num_bytes // ffi.sizeof('OctvPayload')
+    rss_before_kib = octv_bench_peak_rss_kib()
+
+    previous_sink = octv.set_trace_sink(None)
+    try:
+        runs = list()
+        for _ in range(repeat):
+            recorder = OctvBenchRecorder(batch_deliveries)
+            parse(path, recorder)
+            stop_ns = time.perf_counter_ns()
+            runs.append((stop_ns - recorder.batch_ns[0], recorder))
+    finally:
+        octv.set_trace_sink(previous_sink)
+
+    run_ns = sorted(ns for ns, recorder in runs)
+    best_ns, recorder = min(runs, key=lambda run: run[0])
+    seconds = best_ns / 1e9
+    # a run shorter than a batch counts as one batch
+    batch_ms = np.diff(recorder.batch_ns) / 1e6 if len(recorder.batch_ns) > 1 else np.array([best_ns / 1e6])
+    peak_rss_kib = octv_bench_peak_rss_kib()
+    return O(
+        case=case_name,
+        num_terminals=num_terminals,
+        num_bytes=num_bytes,
+        num_deliveries=recorder.num_deliveries,
+        repeat=repeat,
+        seconds=seconds,
+        seconds_median=run_ns[len(run_ns) // 2] / 1e9,
+        terminals_per_second=num_terminals / seconds,
+        megabytes_per_second=num_bytes / 1e6 / seconds,
+        batch_deliveries=batch_deliveries,
+        num_batches=len(recorder.batch_ns) - 1,
+        batch_ms_p50=float(np.percentile(batch_ms, 50)),
+        batch_ms_p99=float(np.percentile(batch_ms, 99)),
+        batch_ms_max=float(batch_ms.max()),
+        peak_rss_kib=peak_rss_kib,
+        peak_rss_growth_kib=peak_rss_kib - rss_before_kib,
+        )
+
+
+def octv_bench_case_dict(path, case_name, *, repeat, batch_deliveries):
+    # worker: the metrics of a case, as a dict
+    return octv_bench_case(path, case_name, repeat=repeat, batch_deliveries=batch_deliveries).__dict__
+
+
+def octv_bench_call(in_process, function, *args, **kwargs):
+    # function(*args, **kwargs), in this process or in a fresh one
+    if in_process:
+        return function(*args, **kwargs)
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(function, *args, **kwargs).result()
+
+
+def octv_bench_environment():
+    return dict(
+        python=platform.python_version(),
+        implementation=platform.python_implementation(),
+        platform=platform.platform(),
+        machine=platform.machine(),
+        processor=platform.processor(),
+        cpu_count=os.cpu_count(),
+        numpy=np.__version__,
+        octv_version=lib.OCTV_VERSION,
+        trace_compiled=bool(lib.octv_trace_compiled()),
+        )
+
+
+def octv_bench(*, streams=octv_bench_streams, case_names=tuple(octv_bench_cases), repeat=3, batch_deliveries=4096, in_process=False, seed=0):
+    """
+    Run each of case_names, keys of octv_bench_cases, on each of streams, returns the results as a
+    dict for JSON.  Each stream is written to a temporary file, then each of its cases is run in a
+    fresh process, unless in_process is true, when peak RSS is that of the calling process.
+
+    Each result has the stream and case names, num_terminals, num_bytes, and num_deliveries, the
+    calls to send, which are terminals or flat features depending on the case; the
+    seconds of the fastest of repeat runs, and seconds_median; terminals_per_second and
+    megabytes_per_second of the fastest run; the p50, p99, and max milliseconds per batch of
+    batch_deliveries calls to send; and peak_rss_kib, with its growth over the case.
+    """
+    unknown = sorted(set(case_names) - set(octv_bench_cases))
+    if unknown:
+        raise ValueError(f'octv_bench: expected case names in {sorted(octv_bench_cases)}, got {unknown}')
+
+    results = list()
+    stream_infos = list()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for stream in streams:
+            path = os.path.join(temp_dir, f'{stream.name}.octv')
+            num_payloads = octv_bench_call(in_process, octv_bench_write_stream, path, stream, seed=seed)
+            stream_infos.append(dict(stream.__dict__, num_payloads=num_payloads, num_bytes=os.path.getsize(path)))
+
+            for case_name in case_names:
+                case_result = octv_bench_call(in_process, octv_bench_case_dict, path, case_name, repeat=repeat, batch_deliveries=batch_deliveries)
+                results.append(dict(stream=stream.name, **case_result))
+
+    return dict(
+        schema=octv_bench_schema,
+        created=datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        environment=octv_bench_environment(),
+        streams=stream_infos,
+        results=results,
+        )
+
+
+def octv_bench_compare(results, baseline, *, metric='terminals_per_second', tolerance=0.1):
+    """
+    Compare the metric, where higher is better, of each (stream, case) in results with that in
+    baseline, both from octv_bench; returns a list of O with the stream, case, current and baseline
+    values, their ratio, and regressed, true when the ratio is below 1 - tolerance.
+
+    >>> baseline = dict(schema=octv_bench_schema, results=[dict(stream='s', case='octv_parse_class', terminals_per_second=1000.0)])
+    >>> results = dict(schema=octv_bench_schema, results=[dict(stream='s', case='octv_parse_class', terminals_per_second=850.0)])
+    >>> [(item.case, item.ratio, item.regressed) for item in octv_bench_compare(results, baseline)]
+    [('octv_parse_class', 0.85, True)]
+    """
+    for name, bench in (('results', results), ('baseline', baseline)):
+        if bench.get('schema') != octv_bench_schema:
+            raise ValueError(f'octv_bench_compare: expected {name} with schema {octv_bench_schema!r}, got {bench.get("schema")!r}')
+    baseline_values = dict(((result['stream'], result['case']), result[metric]) for result in baseline['results'])
+    comparisons = list()
+    for result in results['results']:
+        baseline_value = baseline_values.get((result['stream'], result['case']))
+        if baseline_value is None: continue
+        ratio = result[metric] / baseline_value
+        comparisons.append(O(stream=result['stream'], case=result['case'], metric=metric, current=result[metric], baseline=baseline_value,
+                             ratio=ratio, regressed=ratio < 1 - tolerance))
+    return comparisons
+
+
+def octv_bench_main(args):
+    parser = argparse.ArgumentParser(prog='octv_bench.py', description='Benchmark the Octv parse APIs, write the results as JSON')
+    parser.add_argument('out', help='JSON file for the results')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare with, exit status 1 on a regression')
+    parser.add_argument('--cases', default=','.join(octv_bench_cases), help='comma-separated cases, default all')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--num-frames', type=int, help='frames per stream, default that of each stream')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='fraction of the baseline terminals_per_second that is a regression')
+    options = parser.parse_args(args)
+
+    streams = octv_bench_streams if options.num_frames is None else tuple(O(stream.__dict__, num_frames=options.num_frames) for stream in octv_bench_streams)
+    results = octv_bench(streams=streams, case_names=tuple(options.cases.split(',')), repeat=options.repeat)
+    with open(options.out, 'w') as out:
+        json.dump(results, out, indent=2)
+        out.write('\n')
+
+    for result in results['results']:
+        print(f"{result['stream']:20} {result['case']:18} {result['terminals_per_second']:14,.0f} terminals/s {result['megabytes_per_second']:8.1f} MB/s"
+              f"  batch p50 {result['batch_ms_p50']:8.3f} ms p99 {result['batch_ms_p99']:8.3f} ms  peak RSS {result['peak_rss_kib']:,} KiB")
+
+    if options.baseline is None:
+        return 0
+    with open(options.baseline) as baseline_file:
+        comparisons = octv_bench_compare(results, json.load(baseline_file), tolerance=options.tolerance)
+    for item in comparisons:
+        print(f"{item.stream:20} {item.case:18} {item.ratio:6.2f}x baseline{'  REGRESSED' if item.regressed else ''}")
+    return 1 if any(item.regressed for item in comparisons) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(octv_bench_main(sys.argv[1:]))
@@ -0,0 +1,298 @@
+import os
+import lzma
+import zlib
+import struct
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from octv_cffi import lib
+
+from octv import O, default_chunk_size, iter_payload_blocks
+from octv_numpy import OctvPushParser, octv_flat_columns, octv_flat_columns_fields, octv_payload_dtype, octv_payloads, octv_sentinel_u8, octv_split_payloads
+
+# Block-compressed, seekable container of Octv payloads
+#
+# The payloads are grouped into blocks of about block_payloads payloads, each starting at a MOMENT
+# or a SENTINEL when there is one within twice that.  In each block the 16-bit word at bytes 2-3,
+# the detector_index of a FEATURE and the audio_frame_index_lo_bytes of a TICK, is delta coded
+# among the terminals of the same kind, the bytes are transposed into eight planes, one per byte of
+# the payloads, and the planes are compressed with zlib or lzma.
+#
+# Layout: a header, the compressed blocks, the block index, and a trailer with the offset of the
+# index.  The index has each block's offset, sizes, and the CONFIG, MOMENT, and TICK in effect at
+# its start, so any block decodes to flat features on its own, e.g. in parallel, or for a range of
+# frames; frame indices are assumed not to decrease through the stream.
+
+octv_block_magic = b'OctvBlk1'
+octv_block_header_struct = struct.Struct('<8s B 7x')
+octv_block_trailer_struct = struct.Struct('<Q 8s')
+
+# method: (code, compress(data, level), decompress(data))
+octv_block_methods = {
+    'zlib': (1, lambda data, level: zlib.compress(data, level if level is not None else 6), zlib.decompress),
+    'lzma': (2, lambda data, level: lzma.compress(data, preset=level if level is not None else 6), lzma.decompress),
+    }
+octv_block_method_by_code = dict((code, method) for method, (code, compress, decompress) in octv_block_methods.items())
+
+octv_block_context_dtypes = OctvPushParser.context_dtypes
+
+octv_block_index_dtype = np.dtype([
+    ('offset', '<u8'),
+    ('size', '<u8'),
+    ('num_payloads', '<u8'),
+    # of the TICK in effect at the start of the block, no FEATURE in the block precedes it
+    ('audio_frame_index', '<u8'),
+    ] + [(terminal_name, dtype) for terminal_name, dtype in octv_block_context_dtypes.items()])
+
+
+def octv_block_delta_masks(types):
+    # the payloads whose word at bytes 2-3 is delta coded, one mask per kind of terminal
+    return (
+        ((types & lib.OCTV_NON_FEATURE_MASK) == 0) & (types != 0),
+        types == lib.OCTV_TICK_TYPE,
+        )
+
+
+def octv_block_encode(payloads):
+    """
+    The delta-coded byte planes of payloads, see octv_block_decode.
+
+    >>> payloads = octv_payloads(open('test2.octv', 'rb').read())
+    >>> planes = octv_block_encode(payloads)
+    >>> len(planes), planes[0:8].hex(), planes[2*8:3*8].hex(), planes[3*8:4*8].hex()
+    (64, '4f50607003233345', '7402000101000064', '7680000202000020')
+    >>> octv_block_decode(planes).tobytes() == payloads.tobytes()
+    True
+    """
+    data = payloads.view(np.uint8).reshape(-1, octv_payload_dtype.itemsize).copy()
+    words = data.view('<u2')[:, 1]
+    for mask in octv_block_delta_masks(data[:, 0]):
+        words[mask] = np.diff(words[mask], prepend=np.uint16(0))
+    return data.T.tobytes()
+
+
+def octv_block_decode(planes):
+    # the payloads of the delta-coded byte planes from octv_block_encode
+    data = np.frombuffer(planes, dtype=np.uint8).reshape(octv_payload_dtype.itemsize, -1).T.copy()
+    words = data.view('<u2')[:, 1]
+    for mask in octv_block_delta_masks(data[:, 0]):
+        words[mask] = np.cumsum(words[mask], dtype=np.uint16)
+    return data.reshape(-1).view(octv_payload_dtype)
+
+
+class OctvBlockWriter(object):
+    """
+    Write Octv payloads, given as bytes in chunks of any size, to the block-compressed container
+    at path_or_file, a filename or a binary file object at offset 0.  The blocks are written as the
+    payloads arrive, the index on close(), and a trailing partial payload is not included.
+
+    >>> import io
+    >>> out = io.BytesIO()
+    >>> with OctvBlockWriter(out, method='lzma', block_payloads=2) as writer:
+    ...     writer.write(open('test2.octv', 'rb').read())
+    >>> reader = OctvBlockReader(out)
+    >>> reader.method, len(reader), reader.index['num_payloads'].tolist(), reader.index['audio_frame_index'].tolist()
+    ('lzma', 3, [2, 4, 2], [0, 0, 131585])
+    >>> reader.read_payloads(1)['type'].tolist()
+    [96, 112, 3, 35]
+    """
+    def __init__(self, path_or_file, *, method='zlib', level=None, block_payloads=1 << 16):
+        if method not in octv_block_methods:
+            raise ValueError(f'{type(self).__name__}: expected a method in {sorted(octv_block_methods)}, got {method!r}')
+        if block_payloads < 1:
+            raise ValueError(f'{type(self).__name__}: expected block_payloads of at least 1, got {block_payloads}')
+        self._stack = contextlib.ExitStack()
+        self._file = self._stack.enter_context(open(path_or_file, 'wb')) if isinstance(path_or_file, (str, os.PathLike)) else path_or_file
+        self.method = method
+        self.level = level
+        self.block_payloads = block_payloads
+
+        code, self._compress, decompress = octv_block_methods[method]
+        self._file.write(octv_block_header_struct.pack(octv_block_magic, code))
+        self._offset = octv_block_header_struct.size
+
+        # chunks of the whole payloads not yet in a block, their number, and the bytes of a partial payload
+        self._chunks = list()
+        self._num_buffered = 0
+        self._pending = bytearray()
+        self._context = dict((terminal_name, np.zeros((), dtype=dtype)) for terminal_name, dtype in octv_block_context_dtypes.items())
+        self._index = list()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, data):
+        self._pending += data
+        size = len(self._pending) - len(self._pending) % octv_payload_dtype.itemsize
+        if size > 0:
+            self._chunks.append(bytes(self._pending[:size]))
+            del self._pending[:size]
+            self._num_buffered += size // octv_payload_dtype.itemsize
+        # a block ends within twice block_payloads of its start, so until that many are buffered
+        # no block can be written, and scanning them for boundaries would be repeated for small writes
+        if self._num_buffered >= 2 * self.block_payloads:
+            self._write_blocks(final=False)
+
+    def _write_blocks(self, *, final):
+        buffer = b''.join(self._chunks)
+        payloads = octv_payloads(buffer)
+        boundaries = np.flatnonzero((payloads['type'] == lib.OCTV_MOMENT_TYPE) | (payloads.view('<u8') == octv_sentinel_u8))
+        start = 0
+        while start < len(payloads):
+            # the first boundary that makes the block at least block_payloads, but at most twice that
+            found = boundaries[np.searchsorted(boundaries, start + self.block_payloads):]
+            if len(found) and found[0] <= start + 2 * self.block_payloads:
+                stop = int(found[0])
+            elif len(payloads) - start >= 2 * self.block_payloads:
+                stop = start + 2 * self.block_payloads
+            elif final:
+                stop = len(payloads)
+            else:
+                break
+            self._write_block(payloads[start:stop])
+            start = stop
+        remaining = buffer[start * octv_payload_dtype.itemsize:]
+        self._chunks = [remaining] if remaining else list()
+        self._num_buffered = len(payloads) - start
+
+    def _write_block(self, payloads):
+        data = self._compress(octv_block_encode(payloads), self.level)
+        self._file.write(data)
+
+        entry = np.zeros((), dtype=octv_block_index_dtype)
+        entry['offset'] = self._offset
+        entry['size'] = len(data)
+        entry['num_payloads'] = len(payloads)
+        entry['audio_frame_index'] = (int(self._context['moment']['audio_frame_index_hi_bytes']) << 16) | int(self._context['tick']['audio_frame_index_lo_bytes'])
+        for terminal_name in self._context:
+            entry[terminal_name] = self._context[terminal_name]
+        self._index.append(entry)
+        self._offset += len(data)
+
+        terminals = octv_split_payloads(payloads)
+        for terminal_name in self._context:
+            if len(terminals[terminal_name]) > 0:
+                self._context[terminal_name] = terminals[terminal_name][-1].copy()
+
+    def close(self):
+        if self._index is None: return
+        self._write_blocks(final=True)
+        index = np.array(self._index, dtype=octv_block_index_dtype)
+        self._file.write(index.tobytes())
+        self._file.write(octv_block_trailer_struct.pack(self._offset, octv_block_magic))
+        self._index = None
+        self._stack.close()
+
+
+class OctvBlockReader(object):
+    """
+    Read the blocks of the container at path_or_file, a filename or a binary file object that
+    supports seek, with the container starting at offset 0.  A filename is opened for each read, so a reader can be shared by threads.
+    """
+    def __init__(self, path_or_file):
+        self.path_or_file = path_or_file
+        with self._open() as file:
+            file.seek(0)
+            magic, code = octv_block_header_struct.unpack(file.read(octv_block_header_struct.size))
+            file.seek(-octv_block_trailer_struct.size, os.SEEK_END)
+            trailer_offset = file.tell()
+            index_offset, trailer_magic = octv_block_trailer_struct.unpack(file.read(octv_block_trailer_struct.size))
+            if magic != octv_block_magic or trailer_magic != octv_block_magic or code not in octv_block_method_by_code:
+                raise ValueError(f'{type(self).__name__}: expected an Octv block container, got magic: {magic!r}, {trailer_magic!r}, method: {code}')
+            file.seek(index_offset)
+            self.index = np.frombuffer(file.read(trailer_offset - index_offset), dtype=octv_block_index_dtype)
+        self.method = octv_block_method_by_code[code]
+        self._decompress = octv_block_methods[self.method][2]
+
+    def _open(self):
+        if isinstance(self.path_or_file, (str, os.PathLike)):
+            return open(self.path_or_file, 'rb')
+        return contextlib.nullcontext(self.path_or_file)
+
+    def __len__(self):
+        # number of blocks
+        return len(self.index)
+
+    def _read_payloads(self, file, block_index):
+        entry = self.index[block_index]
+        file.seek(int(entry['offset']))
+        return octv_block_decode(self._decompress(file.read(int(entry['size']))))
+
+    def read_payloads(self, block_index):
+        # the payloads of a block, an array of octv_payload_dtype
+        with self._open() as file:
+            return self._read_payloads(file, block_index)
+
+    def iter_payloads(self):
+        # generate the payloads of each block in turn
+        with self._open() as file:
+            for block_index in range(len(self.index)):
+                yield self._read_payloads(file, block_index)
+
+    def read_flat(self, block_index):
+        # the columnar flat features of a block, see octv_numpy.octv_flat_columns
+        entry = self.index[block_index]
+        context = O((terminal_name, entry[terminal_name]) for terminal_name in octv_block_context_dtypes)
+        return octv_flat_columns(octv_split_payloads(self.read_payloads(block_index)), context=context)
+
+    def read_frames(self, start, stop):
+        """
+        Columnar flat features with audio_frame_index from start up to, not including, stop,
+        decoding only the blocks that can hold them.
+        """
+        frames = self.index['audio_frame_index']
+        # the block before the first that starts at start can end with the TICK at start, and the
+        # features of one TICK can span several blocks that all start at its frame
+        first = max(int(np.searchsorted(frames, start, side='left')) - 1, 0)
+        last = int(np.searchsorted(frames, stop, side='left'))
+        batches = [self.read_flat(block_index) for block_index in range(first, max(last, first + 1)) if block_index < len(self.index)]
+        columns = octv_block_concatenate(batches)
+        in_range = (start <= columns.audio_frame_index) & (columns.audio_frame_index < stop)
+        return O((field, column[in_range]) for field, column in columns.items())
+
+
+def octv_block_concatenate(batches):
+    if not batches:
+        return octv_flat_columns(octv_split_payloads(octv_payloads(b'')))
+    return O((field, np.concatenate([batch[field] for batch in batches])) for field in octv_flat_columns_fields)
+
+
+def octv_block_compress(path_or_file, out, *, chunk_size=default_chunk_size, **kwargs):
+    # write the payloads of the Octv file path_or_file to the container out, see OctvBlockWriter for the keyword arguments
+    with OctvBlockWriter(out, **kwargs) as writer:
+        for block in iter_payload_blocks(path_or_file, chunk_size=chunk_size):
+            writer.write(block)
+
+
+def octv_block_decompress(path_or_file, out):
+    # write the payloads of the container path_or_file to out, a binary file object
+    for payloads in OctvBlockReader(path_or_file).iter_payloads():
+        out.write(payloads.tobytes())
+
+
+def octv_block_read_flat(path, block_index):
+    # worker: the flat columns of one block
+    return dict(OctvBlockReader(path).read_flat(block_index).items())
+
+
+def octv_block_decode_flat(path, *, max_workers=None):
+    """
+    Decode the container at path into columnar flat features, the blocks in parallel in a pool of
+    max_workers processes.
+
+    >>> import io, tempfile
+    >>> with tempfile.TemporaryDirectory() as temp_dir:
+    ...     octv_block_compress('test2.octv', os.path.join(temp_dir, 'test2.octvb'), block_payloads=3)
+    ...     columns = octv_block_decode_flat(os.path.join(temp_dir, 'test2.octvb'), max_workers=2)
+    >>> columns.audio_frame_index, columns.level_3_int16_1
+    (array([131585, 131585, 131585], dtype=uint64), array([   0,    0, 2052], dtype=int16))
+    """
+    num_blocks = len(OctvBlockReader(path))
+    with ProcessPoolExecutor(max_workers) as executor:
+        batches = [O(columns) for columns in executor.map(octv_block_read_flat, [path] * num_blocks, range(num_blocks))]
+    return octv_block_concatenate(batches)
@@ -27,6 +27,9 @@ extern_python_str = """
   extern "Python" int octv_flat_feature_cb(OctvFlatFeature * featurec, void * user_data);
 
   extern "Python" int octv_class_cb(OctvPayload * payload, void * user_data);
+  extern "Python" int octv_cursor_cb(OctvPayload * payload, void * user_data);
+
+  extern "Python" int octv_batch_cb(OctvPayload * payloads, int num_payloads, void * user_data);
 
   extern "Python" int octv_flat_feature_cb0(OctvFlatFeature * flat_feature, void * user_data);
 
@@ -0,0 +1,153 @@
+import os
+import zipfile
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    # optional, only needed for Arrow IPC and Parquet
+    pyarrow = None
+
+from octv import O, default_chunk_size, iter_payload_blocks
+from octv_numpy import OctvPushParser, octv_flat_columns_fields, octv_flat_feature_dtype
+
+# Columnar export of the flat features of an Octv file
+#
+# The stream is parsed in chunks and written in row groups of at most row_group_size features, so
+# memory is bounded by a row group whatever the size of the file.  The columns are those of
+# octv_numpy.octv_flat_columns, the OctvFlatFeature fields plus the full audio_sample_rate and
+# audio_frame_index.  Arrow IPC and Parquet need pyarrow, the .npz format needs only numpy: each
+# column of each row group is an array named <row group index>/<field>.
+
+octv_export_dtypes = tuple((field, octv_flat_feature_dtype[field]) for field in octv_flat_feature_dtype.names) + (
+    ('audio_sample_rate', np.dtype(np.uint32)),
+    ('audio_frame_index', np.dtype(np.uint64)),
+    )
+assert tuple(field for field, dtype in octv_export_dtypes) == octv_flat_columns_fields, str(octv_export_dtypes)
+
+octv_export_row_group_size = 1 << 20
+
+
+def octv_export_row_groups(path_or_file, *, row_group_size=octv_export_row_group_size, chunk_size=default_chunk_size):
+    """
+    Generate the flat features of an Octv file in row groups, O of columns with row_group_size
+    features each, the last one with fewer; path_or_file is a filename or a binary file object,
+    read in blocks of chunk_size bytes, up to END.
+
+    >>> [group.audio_frame_index.tolist() for group in octv_export_row_groups('test2.octv', row_group_size=2, chunk_size=16)]
+    [[131585, 131585], [131585]]
+    """
+    if row_group_size < 1:
+        raise ValueError(f'octv_export_row_groups: expected row_group_size of at least 1, got {row_group_size}')
+    parser = OctvPushParser()
+    pending = list()
+    num_pending = 0
+    for block in iter_payload_blocks(path_or_file, chunk_size=chunk_size):
+        flat = parser.feed(block).flat
+        if len(flat.type) > 0:
+            pending.append(flat)
+            num_pending += len(flat.type)
+        if num_pending >= row_group_size:
+            # one concatenation for all the row groups that are complete, only the tail is carried forward
+            columns = octv_export_concatenate(pending)
+            num_complete = num_pending - num_pending % row_group_size
+            for offset in range(0, num_complete, row_group_size):
+                yield O((field, column[offset:offset+row_group_size]) for field, column in columns.items())
+            pending = [O((field, column[num_complete:]) for field, column in columns.items())]
+            num_pending -= num_complete
+        if parser.ended: break
+    if num_pending > 0:
+        yield octv_export_concatenate(pending)
+
+
+def octv_export_concatenate(batches):
+    return O((field, np.concatenate([batch[field] for batch in batches]).astype(dtype, copy=False)) for field, dtype in octv_export_dtypes)
+
+
+def octv_export_npz(path_or_file, out, **kwargs):
+    """
+    Write the flat features of an Octv file to out, a filename or a binary file object, in the
+    .npz format, one array per column per row group, returns the number of features.  The keyword
+    arguments are those of octv_export_row_groups.
+
+    >>> import io
+    >>> out = io.BytesIO()
+    >>> octv_export_npz('test2.octv', out, row_group_size=2)
+    3
+    >>> _ = out.seek(0)
+    >>> [group.level_3_int16_0.tolist() for group in octv_iter_npz(out)]
+    [[0, 0], [513]]
+    """
+    num_features = 0
+    with zipfile.ZipFile(out, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as npz_file:
+        for index, columns in enumerate(octv_export_row_groups(path_or_file, **kwargs)):
+            for field, dtype in octv_export_dtypes:
+                with npz_file.open(f'{index:06d}/{field}.npy', mode='w', force_zip64=True) as npy_file:
+                    np.lib.format.write_array(npy_file, columns[field], allow_pickle=False)
+            num_features += len(columns.type)
+    return num_features
+
+
+def octv_iter_npz(path_or_file):
+    # generate the row groups of a .npz export, one O of columns for each
+    with np.load(path_or_file) as npz:
+        indices = sorted(set(name.split('/')[0] for name in npz.files))
+        for index in indices:
+            yield O((field, npz[f'{index}/{field}']) for field, dtype in octv_export_dtypes)
+
+
+def octv_export_arrow_schema():
+    # the pyarrow schema of the exported columns
+    if pyarrow is None:
+        raise ImportError('octv_export_arrow_schema: pyarrow is not installed, see octv_export_npz()')
+    return pyarrow.schema([(field, pyarrow.from_numpy_dtype(dtype)) for field, dtype in octv_export_dtypes])
+
+
+def octv_export_record_batches(path_or_file, schema, **kwargs):
+    for columns in octv_export_row_groups(path_or_file, **kwargs):
+        yield pyarrow.RecordBatch.from_arrays([pyarrow.array(columns[field]) for field in schema.names], schema=schema)
+
+
+def octv_export_arrow(path_or_file, out, **kwargs):
+    # write the flat features of an Octv file to out in the Arrow IPC file format, one record batch per row group, returns the number of features
+    schema = octv_export_arrow_schema()
+    num_features = 0
+    with pyarrow.ipc.new_file(out, schema) as writer:
+        for batch in octv_export_record_batches(path_or_file, schema, **kwargs):
+            writer.write_batch(batch)
+            num_features += batch.num_rows
+    return num_features
+
+
+def octv_export_parquet(path_or_file, out, *, compression='zstd', **kwargs):
+    # write the flat features of an Octv file to out as Parquet, one row group per row group, returns the number of features
+    schema = octv_export_arrow_schema()
+    num_features = 0
+    with pyarrow.parquet.ParquetWriter(out, schema, compression=compression) as writer:
+        for batch in octv_export_record_batches(path_or_file, schema, **kwargs):
+            writer.write_table(pyarrow.Table.from_batches([batch], schema=schema), row_group_size=batch.num_rows)
+            num_features += batch.num_rows
+    return num_features
+
+
+octv_exporters = {
+    '.npz': octv_export_npz,
+    '.arrow': octv_export_arrow,
+    '.feather': octv_export_arrow,
+    '.parquet': octv_export_parquet,
+    }
+
+
+def octv_export(path_or_file, out_path, **kwargs):
+    """
+    Write the flat features of an Octv file to the columnar file at out_path, whose suffix selects
+    the format: .npz, .arrow or .feather for Arrow IPC, or .parquet.  Returns the number of
+    features.  The keyword arguments are those of the exporter, e.g. row_group_size.
+    """
+    suffix = os.path.splitext(out_path)[1].lower()
+    if suffix not in octv_exporters:
+        raise ValueError(f'octv_export: expected a suffix in {sorted(octv_exporters)}, got: {out_path!r}')
+    return octv_exporters[suffix](path_or_file, out_path, **kwargs)
@@ -0,0 +1,205 @@
+import os
+import zipfile
+
+import numpy as np
+
+from octv_cffi import lib
+
+from octv import O
+from octv_numpy import octv_flat_columns, octv_forward_fill, octv_numpy_dtype, octv_payload_dtype, octv_payloads, octv_sentinel_u8, octv_split_payloads
+
+# Seek index for random access to Octv files by frame index or time
+#
+# The index has the byte offset of each SENTINEL-started extent and of each MOMENT, with the CONFIG
+# in effect, and is kept in a sidecar file next to the .octv file.  All the frames that follow a
+# MOMENT share its audio_frame_index_hi_bytes, so a query for a range of frames reads from the
+# MOMENT at or before the range up to the first MOMENT after it, 65536 frames at most at each
+# end, about 1.4 seconds at 48 kHz, with a single seek and read.
+#
+# Frame indices are assumed not to decrease through the file.
+
+octv_config_dtype = octv_numpy_dtype('OctvConfig')
+
+octv_index_extents_dtype = np.dtype([
+    ('offset', '<u8'),
+    ('config', octv_config_dtype),
+    ])
+
+octv_index_moments_dtype = np.dtype([
+    ('offset', '<u8'),
+    ('audio_frame_index', '<u8'),
+    ('config', octv_config_dtype),
+    ])
+
+octv_index_suffix = '.idx'
+
+# payloads scanned at a time when building an index, so memory does not grow with the file
+octv_index_chunk_payloads = 1 << 20
+
+
+def octv_index_path(path):
+    # the sidecar for an Octv file
+    return os.fspath(path) + octv_index_suffix
+
+
+def octv_source_stat(path):
+    # for detecting a stale index
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def octv_config_audio_sample_rate(configs):
+    # the audio_sample_rate of each of an array of octv_config_dtype
+    return (configs['audio_sample_rate_0'].astype(np.uint32)
+            | (configs['audio_sample_rate_1'].astype(np.uint32) << 8)
+            | (configs['audio_sample_rate_2'].astype(np.uint32) << 16))
+
+
+def octv_build_index(path, *, chunk_payloads=octv_index_chunk_payloads):
+    """
+    Build the seek index of the Octv file at path, with a vectorized scan of the mapped file,
+    chunk_payloads at a time, that copies only the SENTINEL, CONFIG, and MOMENT payloads.
+
+    Returns an O with the extents and moments arrays, see octv_index_extents_dtype and
+    octv_index_moments_dtype, and the source stat.
+
+    >>> index = octv_build_index('test2.octv')
+    >>> index.extents['offset'], index.moments['offset'], index.moments['audio_frame_index']
+    (array([0], dtype=uint64), array([16], dtype=uint64), array([131072], dtype=uint64))
+    >>> int(index.moments['config']['num_detectors'][0])
+    600
+    """
+    payloads = octv_payloads(path, mmap=True)
+    payload_size = octv_payload_dtype.itemsize
+
+    # the same tests as octv_numpy.octv_type_masks, for the three kinds of payload the index needs
+    sentinel_index = [np.zeros(0, dtype=np.int64)]
+    config_index = [np.zeros(0, dtype=np.int64)]
+    config = [np.zeros(0, dtype=octv_config_dtype)]
+    moment_index = [np.zeros(0, dtype=np.int64)]
+    audio_frame_index_hi_bytes = [np.zeros(0, dtype=np.uint32)]
+    for start in range(0, len(payloads), chunk_payloads):
+        chunk = payloads[start:start+chunk_payloads]
+        types = chunk['type']
+        sentinel_index.append(start + np.flatnonzero(chunk.view('<u8') == octv_sentinel_u8))
+        chunk_config_index = np.flatnonzero((types == lib.OCTV_CONFIG_TYPE) & (chunk['config']['octv_version'] == lib.OCTV_VERSION))
+        config_index.append(start + chunk_config_index)
+        config.append(chunk['config'][chunk_config_index])
+        chunk_moment_index = np.flatnonzero(types == lib.OCTV_MOMENT_TYPE)
+        moment_index.append(start + chunk_moment_index)
+        audio_frame_index_hi_bytes.append(chunk['moment']['audio_frame_index_hi_bytes'][chunk_moment_index])
+    sentinel_index, config_index, config, moment_index, audio_frame_index_hi_bytes = (
+        np.concatenate(arrays) for arrays in (sentinel_index, config_index, config, moment_index, audio_frame_index_hi_bytes))
+
+    # the CONFIG of an extent follows its SENTINEL
+    extents = np.zeros(len(sentinel_index), dtype=octv_index_extents_dtype)
+    extents['offset'] = sentinel_index * payload_size
+    extents['config'] = octv_forward_fill(config, config_index, sentinel_index + 1)
+
+    moments = np.zeros(len(moment_index), dtype=octv_index_moments_dtype)
+    moments['offset'] = moment_index * payload_size
+    moments['audio_frame_index'] = audio_frame_index_hi_bytes.astype(np.uint64) << 16
+    moments['config'] = octv_forward_fill(config, config_index, moment_index)
+
+    return O(extents=extents, moments=moments, source_stat=octv_source_stat(path))
+
+
+def octv_write_index(path, index=None):
+    # build, unless given, and write the sidecar index of the Octv file at path, returns the index
+    index = index if index is not None else octv_build_index(path)
+    with open(octv_index_path(path), 'wb') as index_file:
+        np.savez(index_file, extents=index.extents, moments=index.moments, source_stat=index.source_stat)
+    return index
+
+
+def octv_load_index(path, *, build=True):
+    """
+    Load the sidecar index of the Octv file at path.
+
+    A missing, unreadable, or stale index, i.e. one whose source size or modification time differs
+    from the file's, is rebuilt and written when build is true, otherwise it raises the error, e.g.
+    FileNotFoundError, zipfile.BadZipFile for a truncated sidecar, or ValueError.
+    """
+    try:
+        with np.load(octv_index_path(path)) as index_npz:
+            index = O(extents=index_npz['extents'], moments=index_npz['moments'], source_stat=index_npz['source_stat'])
+        if not np.array_equal(index.source_stat, octv_source_stat(path)):
+            raise ValueError(f'octv_load_index: stale index: {octv_index_path(path)}')
+        return index
+    except (OSError, EOFError, ValueError, KeyError, zipfile.BadZipFile):
+        if not build: raise
+    return octv_write_index(path)
+
+
+class OctvSeekReader(object):
+    """
+    Random access to the flat features of an Octv file by frame index or by time, using its seek
+    index.
+
+    >>> reader = OctvSeekReader('test2.octv', index=octv_build_index('test2.octv'))
+    >>> columns = reader.read_frames(131585, 131586)
+    >>> columns.audio_frame_index, columns.type
+    (array([131585, 131585, 131585], dtype=uint64), array([ 3, 35, 51], dtype=uint8))
+    >>> len(reader.read_frames(0, 131585).type), len(reader.read_seconds(2.741, 2.742).type)
+    (0, 3)
+    """
+    def __init__(self, path, *, index=None):
+        self.path = path
+        self.index = index if index is not None else octv_load_index(path)
+
+    def audio_sample_rate(self):
+        # the one sample rate of the file, see frame_index_at for files whose extents differ
+        audio_sample_rates = set(octv_config_audio_sample_rate(self.index.extents['config']).tolist())
+        if len(audio_sample_rates) != 1:
+            raise ValueError(f'{self.__class__.__name__}: expected one audio_sample_rate, got: {sorted(audio_sample_rates)}')
+        return audio_sample_rates.pop()
+
+    def frame_index_at(self, seconds):
+        """
+        The first audio_frame_index at or after the time in seconds, converted with the
+        audio_sample_rate of the CONFIG in effect at the last MOMENT at or before that time, or at
+        the first MOMENT, so extents can have different sample rates.
+
+        >>> reader = OctvSeekReader('test2.octv', index=octv_build_index('test2.octv'))
+        >>> reader.frame_index_at(2.741), reader.frame_index_at(0.5)
+        (131568, 24000)
+        """
+        moments = self.index.moments
+        if len(moments) == 0: return 0
+        audio_sample_rates = octv_config_audio_sample_rate(moments['config'])
+        moment_seconds = moments['audio_frame_index'] / audio_sample_rates
+        moment_index = max(int(np.searchsorted(moment_seconds, seconds, side='right')) - 1, 0)
+        return int(np.ceil(seconds * audio_sample_rates[moment_index]))
+
+    def read_frames(self, start, stop):
+        """
+        Columnar flat features, see octv_numpy.octv_flat_columns, with audio_frame_index from
+        start up to, not including, stop.
+        """
+        moments = self.index.moments
+        # the frames following a MOMENT are within its 1 << 16 frames
+        first = np.searchsorted(moments['audio_frame_index'], (start >> 16) << 16, side='left')
+        last = np.searchsorted(moments['audio_frame_index'], stop, side='left')
+
+        if first < len(moments):
+            with open(self.path, 'rb') as octv_file:
+                offset = int(moments['offset'][first])
+                octv_file.seek(offset)
+                size = int(moments['offset'][last]) - offset if last < len(moments) else -1
+                data = octv_file.read(size)
+            context = O(
+                config=moments['config'][first],
+                moment=np.zeros((), dtype=octv_numpy_dtype('OctvMoment')),
+                tick=np.zeros((), dtype=octv_numpy_dtype('OctvTick')),
+                )
+        else:
+            data = b''
+            context = None
+
+        columns = octv_flat_columns(octv_split_payloads(octv_payloads(data)), context=context)
+        in_range = (start <= columns.audio_frame_index) & (columns.audio_frame_index < stop)
+        return O((field, column[in_range]) for field, column in columns.items())
+
+    def read_seconds(self, start, stop):
+        # the flat features of the frames in the time range, in seconds, from start up to stop, see frame_index_at
+        return self.read_frames(self.frame_index_at(start), self.frame_index_at(stop))
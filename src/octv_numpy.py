@@ -0,0 +1,438 @@
+import os
+import struct
+
+import numpy as np
+
+from octv_cffi import ffi, lib
+
+from octv import O
+
+# NumPy views of Octv streams, whole-file decode without per-terminal crossings of the cffi boundary
+
+# Octv is little endian on the wire
+octv_numpy_primitives = {
+    'char': 'S1',
+    'uint8_t': 'u1',
+    'int8_t': 'i1',
+    'uint16_t': '<u2',
+    'int16_t': '<i2',
+    'uint32_t': '<u4',
+    'float': '<f4',
+    }
+
+def octv_numpy_dtype_from(ctype):
+    # recursively build a NumPy dtype from a cffi ctype, fields keep their offsets so unions overlap
+    match ctype.kind:
+        case 'primitive':
+            return np.dtype(octv_numpy_primitives[ctype.cname])
+        case 'array':
+            return np.dtype((octv_numpy_dtype_from(ctype.item), ctype.length))
+        case 'struct' | 'union':
+            fields = ctype.fields
+            return np.dtype(dict(
+                names=[name for name, field in fields],
+                formats=[octv_numpy_dtype_from(field.type) for name, field in fields],
+                offsets=[field.offset for name, field in fields],
+                itemsize=ffi.sizeof(ctype),
+                ))
+        case _:
+            raise TypeError(f'octv_numpy_dtype_from: unhandled ctype: {ctype.cname}, kind: {ctype.kind}')
+
+def octv_numpy_dtype(struct_name):
+    """
+    NumPy structured dtype mirroring the layout of an octv.h struct or union.
+
+    >>> octv_numpy_dtype('OctvTick').names
+    ('type', 'audio_channel', 'audio_frame_index_lo_bytes', 'audio_sample')
+    >>> octv_numpy_dtype('OctvPayload').itemsize
+    8
+    """
+    return octv_numpy_dtype_from(ffi.typeof(struct_name))
+
+
+octv_payload_dtype = octv_numpy_dtype('OctvPayload')
+assert octv_payload_dtype.itemsize == ffi.sizeof('OctvPayload'), str((octv_payload_dtype.itemsize, ffi.sizeof('OctvPayload')))
+
+# whole-payload values of the fixed delimiters, for vectorized comparison
+octv_sentinel_u8, = struct.unpack('<Q', b'Octv\xa4\x6d\xae\xb6')
+octv_end_u8, = struct.unpack('<Q', b'End \xa4\x6d\xae\xb6')
+
+
+def octv_payloads(source, *, mmap=False):
+    r"""
+    Return the whole of source as a NumPy array of octv_payload_dtype.
+
+    The source is a filename or a bytes-like object, e.g. a memoryview from octv.open_file_mmap,
+    which is viewed without copying.  A filename is read with a single np.fromfile, or with mmap
+    true, it is mapped read-only so that pages are shared by all processes reading the file.  A
+    trailing partial payload is not included.
+
+    >>> payloads = octv_payloads(b'Octv\xa4\x6d\xae\xb6' b'End \xa4\x6d\xae\xb6' b'\x00')
+    >>> len(payloads), hex(payloads['type'][1])
+    (2, '0x45')
+    >>> payloads['delimiter']['chars'][0]
+    array([b'c', b't', b'v'], dtype='|S1')
+    >>> octv_payloads('test3.octv', mmap=True)['type']
+    memmap([ 79,  80,  96, 112,   3,  35,  51], dtype=uint8)
+    """
+    if isinstance(source, (str, os.PathLike)) and mmap:
+        num_payloads = os.path.getsize(source) // octv_payload_dtype.itemsize
+        # np.memmap does not support zero-length mappings
+        if num_payloads == 0: return np.zeros(0, dtype=octv_payload_dtype)
+        return np.memmap(source, dtype=octv_payload_dtype, mode='r', shape=(num_payloads,))
+    elif isinstance(source, (str, os.PathLike)):
+        payloads = np.fromfile(source, dtype=np.uint8)
+    else:
+        payloads = np.frombuffer(source, dtype=np.uint8)
+    num_payloads = len(payloads) // octv_payload_dtype.itemsize
+    return payloads[:num_payloads * octv_payload_dtype.itemsize].view(octv_payload_dtype)
+
+
+def octv_type_masks(payloads):
+    """
+    Vectorized classification of payloads, one boolean mask per terminal type.
+
+    Delimiters must match all 8 bytes and CONFIG must have the supported octv_version; payloads
+    that fail these checks, or that have an unhandled type, are in the error mask.
+    """
+    types = payloads['type']
+    whole = payloads.view('<u8')
+    masks = O(
+        sentinel = whole == octv_sentinel_u8,
+        end = whole == octv_end_u8,
+        config = (types == lib.OCTV_CONFIG_TYPE) & (payloads['config']['octv_version'] == lib.OCTV_VERSION),
+        moment = types == lib.OCTV_MOMENT_TYPE,
+        tick = types == lib.OCTV_TICK_TYPE,
+        feature = ((types & lib.OCTV_NON_FEATURE_MASK) == 0) & (types != 0),
+        )
+    masks.error = ~(masks.sentinel | masks.end | masks.config | masks.moment | masks.tick | masks.feature)
+    return masks
+
+
+def octv_split_payloads(payloads):
+    r"""
+    Split payloads by type into per-terminal arrays, each with the dtype of its octv.h struct.
+
+    Each terminal array has a companion *_index array of its positions in payloads.  The error
+    array holds whole payloads.
+
+    >>> terminals = octv_split_payloads(octv_payloads(open('test2.octv', 'rb').read()))
+    >>> len(terminals.sentinel), len(terminals.config), len(terminals.moment), len(terminals.tick), len(terminals.feature), len(terminals.end), len(terminals.error)
+    (1, 1, 1, 1, 3, 1, 0)
+    >>> terminals.feature_index
+    array([4, 5, 6])
+    >>> terminals.config['num_detectors'], terminals.moment['audio_frame_index_hi_bytes'], terminals.tick['audio_sample']
+    (array([600], dtype=uint16), array([2], dtype=uint32), array([0.75], dtype=float32))
+    >>> int(terminals.feature['level_2_int16_0'][1]), int(terminals.feature['level_3_int16_1'][2])
+    (2052, 2052)
+    """
+    masks = octv_type_masks(payloads)
+    terminals = O(payloads=payloads)
+    for terminal_name, field_name in (
+            ('sentinel', 'delimiter'),
+            ('end', 'delimiter'),
+            ('config', 'config'),
+            ('moment', 'moment'),
+            ('tick', 'tick'),
+            ('feature', 'feature'),
+            ):
+        mask = masks[terminal_name]
+        terminals[terminal_name] = payloads[field_name][mask]
+        terminals[terminal_name + '_index'] = np.flatnonzero(mask)
+    terminals.error = payloads[masks.error]
+    terminals.error_index = np.flatnonzero(masks.error)
+    return terminals
+
+
+def octv_decode(source, *, mmap=False):
+    """
+    Decode a whole Octv file or buffer into per-terminal NumPy arrays, see octv_payloads and
+    octv_split_payloads.
+    """
+    return octv_split_payloads(octv_payloads(source, mmap=mmap))
+
+
+# Columnar flat features, the vectorized equivalent of octv_parse_flat and OctvFlatFeature
+
+octv_flat_feature_dtype = octv_numpy_dtype('OctvFlatFeature')
+
+# the fields of the outer-tier terminals that are carried into each flat feature
+octv_flat_context_fields = (
+    ('config', ('octv_version', 'num_audio_channels', 'audio_sample_rate_0', 'audio_sample_rate_1', 'audio_sample_rate_2', 'num_detectors')),
+    ('moment', ('audio_frame_index_hi_bytes',)),
+    ('tick', ('audio_channel', 'audio_frame_index_lo_bytes', 'audio_sample')),
+    )
+
+# the level_* fields of each FEATURE class, and the half-open range of types that use them
+octv_flat_level_fields = (
+    ((lib.OCTV_FEATURE_0_LOWER, lib.OCTV_FEATURE_0_UPPER), ('level_0_int8_0', 'level_0_int8_1', 'level_0_int8_2', 'level_0_int8_3')),
+    ((lib.OCTV_FEATURE_2_LOWER, lib.OCTV_FEATURE_2_UPPER), ('level_2_int8_0', 'level_2_int8_1', 'level_2_int16_0')),
+    ((lib.OCTV_FEATURE_3_LOWER, lib.OCTV_FEATURE_3_UPPER), ('level_3_int16_0', 'level_3_int16_1')),
+    )
+
+# OctvFlatFeature fields plus the derived full values
+octv_flat_columns_fields = octv_flat_feature_dtype.names + ('audio_sample_rate', 'audio_frame_index')
+
+
+def octv_forward_fill(context, context_index, feature_index, initial=None):
+    """
+    For each feature_index, the most recent context terminal preceding it in the stream.
+
+    Features that precede any context terminal get initial, e.g. the state carried from earlier in
+    the stream, or zeros, as for a zero-initialized C struct.
+
+    >>> octv_forward_fill(np.array([10, 20, 30]), np.array([0, 4, 5]), np.array([1, 2, 6, 7]))
+    array([10, 10, 30, 30])
+    >>> octv_forward_fill(np.array([10]), np.array([3]), np.array([1, 4]))
+    array([ 0, 10])
+    >>> octv_forward_fill(np.array([10]), np.array([3]), np.array([1, 4]), initial=7)
+    array([ 7, 10])
+    """
+    latest = np.searchsorted(context_index, feature_index, side='right')
+    filled = np.zeros(len(context) + 1, dtype=context.dtype)
+    if initial is not None:
+        filled[0] = initial
+    filled[1:] = context
+    return filled[latest]
+
+
+def octv_flat_columns(terminals, *, context=None):
+    """
+    Columnar flat features, one array per field of octv_flat_columns_fields, from the output of
+    octv_split_payloads.
+
+    The CONFIG, MOMENT, and TICK context of each FEATURE is found by a vectorized forward fill
+    over terminal positions, starting from the optional context, a mapping from 'config',
+    'moment', and 'tick' to the terminal in effect before the first payload.  The level_* columns
+    that do not apply to a feature's type are zero.
+    """
+    feature = terminals.feature
+    feature_index = terminals.feature_index
+
+    columns = O()
+    for terminal_name, fields in octv_flat_context_fields:
+        initial = context[terminal_name] if context is not None else None
+        filled = octv_forward_fill(terminals[terminal_name], terminals[terminal_name + '_index'], feature_index, initial)
+        for field in fields:
+            columns[field] = filled[field]
+
+    for field in ('type', 'frame_offset', 'detector_index'):
+        columns[field] = feature[field]
+
+    types = feature['type']
+    for (lower, upper), fields in octv_flat_level_fields:
+        in_range = (lower <= types) & (types < upper)
+        for field in fields:
+            columns[field] = np.where(in_range, feature[field], 0).astype(feature[field].dtype)
+
+    octv_flat_derive(columns)
+
+    assert set(columns.keys()) == set(octv_flat_columns_fields), str((sorted(columns.keys()), octv_flat_columns_fields))
+    return columns
+
+
+def octv_flat_derive(columns):
+    # set the derived full-value columns from their parts
+    columns.audio_sample_rate = (columns.audio_sample_rate_0.astype(np.uint32)
+                                 | (columns.audio_sample_rate_1.astype(np.uint32) << 8)
+                                 | (columns.audio_sample_rate_2.astype(np.uint32) << 16))
+    columns.audio_frame_index = (columns.audio_frame_index_hi_bytes.astype(np.uint64) << 16) | columns.audio_frame_index_lo_bytes
+    return columns
+
+
+def octv_flat_records(columns):
+    """
+    A structured array with one record per flat feature, from the output of octv_flat_columns.
+
+    >>> records = octv_flat_records(octv_decode_flat('test2.octv'))
+    >>> len(records), int(records[2]['audio_frame_index']), int(records[2]['level_3_int16_1'])
+    (3, 131585, 2052)
+    """
+    dtype = np.dtype([(field, columns[field].dtype) for field in octv_flat_columns_fields])
+    records = np.empty(len(columns.type), dtype=dtype)
+    for field in octv_flat_columns_fields:
+        records[field] = columns[field]
+    return records
+
+
+def octv_decode_flat(source, *, mmap=False):
+    """
+    Decode a whole Octv file or buffer into columnar flat features, see octv_flat_columns.
+
+    >>> columns = octv_decode_flat('test2.octv')
+    >>> columns.audio_frame_index, columns.audio_channel, columns.detector_index
+    (array([131585, 131585, 131585], dtype=uint64), array([1, 1, 1], dtype=uint8), array([513, 513, 513], dtype=uint16))
+    >>> columns.audio_sample_rate, columns.num_detectors
+    (array([48000, 48000, 48000], dtype=uint32), array([600, 600, 600], dtype=uint16))
+    >>> columns.level_0_int8_3, columns.level_2_int16_0, columns.level_3_int16_0
+    (array([8, 0, 0], dtype=int8), array([   0, 2052,    0], dtype=int16), array([  0,   0, 513], dtype=int16))
+    """
+    return octv_flat_columns(octv_decode(source, mmap=mmap))
+
+
+class OctvPushParser(object):
+    r"""
+    Incremental parser for streams that arrive in chunks of any size, e.g. from non-blocking
+    sockets.  A partial payload at the end of a chunk is kept for the next call to feed(), and the
+    CONFIG, MOMENT, and TICK state is retained, as OctvFlatFeatureState does for octv_parse_flat.
+
+    Each call to feed() returns a batch with the terminals (see octv_split_payloads) and the flat
+    features (see octv_flat_columns) of the complete payloads that are now available.
+
+    The stream ends at its END terminal, after which ended is true and any bytes that followed END
+    are in trailing, e.g. to start a new parser on.
+
+    >>> parser = OctvPushParser()
+    >>> test2 = open('test2.octv', 'rb').read()
+    >>> batches = [parser.feed(test2[offset:offset+13]) for offset in range(0, len(test2), 13)]
+    >>> [len(batch.terminals.payloads) for batch in batches], parser.num_pending
+    ([1, 2, 1, 2, 2], 0)
+    >>> [batch.flat.audio_frame_index.tolist() for batch in batches]
+    [[], [], [], [131585, 131585], [131585]]
+    >>> [int(batch.flat.num_detectors[0]) for batch in batches if len(batch.flat.type)]
+    [600, 600]
+    >>> parser.ended, parser.trailing
+    (True, b'')
+    """
+
+    context_dtypes = dict((terminal_name, octv_numpy_dtype(struct_name)) for terminal_name, struct_name in (
+        ('config', 'OctvConfig'),
+        ('moment', 'OctvMoment'),
+        ('tick', 'OctvTick'),
+        ))
+
+    def __init__(self):
+        # bytes of a partial payload, always fewer than a whole payload
+        self._pending = b''
+        # bytes after the END terminal, None until END is parsed
+        self._trailing = None
+        # the most recent of each context terminal, zeros until one is seen
+        self._context = dict((terminal_name, np.zeros((), dtype=dtype)) for terminal_name, dtype in self.context_dtypes.items())
+
+    @property
+    def num_pending(self):
+        # number of bytes of an incomplete payload waiting for the next chunk
+        return len(self._pending)
+
+    @property
+    def context(self):
+        return dict(self._context)
+
+    @property
+    def ended(self):
+        return self._trailing is not None
+
+    @property
+    def trailing(self):
+        return self._trailing
+
+    def feed(self, chunk):
+        if self.ended:
+            raise ValueError(f'{type(self).__name__}.feed: the stream has ended, got {len(chunk)} more bytes')
+
+        # without pending bytes the chunk is viewed, not copied, and batch.terminals.payloads references it
+        data = memoryview(chunk).cast('B') if not self._pending else self._pending + bytes(chunk)
+        size = len(data) - len(data) % octv_payload_dtype.itemsize
+        self._pending = bytes(data[size:])
+
+        payloads = octv_payloads(data[:size])
+        end_index = np.flatnonzero(payloads.view('<u8') == octv_end_u8)
+        if len(end_index) > 0:
+            size = (end_index[0] + 1) * octv_payload_dtype.itemsize
+            self._trailing = bytes(data[size:])
+            self._pending = b''
+            payloads = payloads[:end_index[0] + 1]
+
+        terminals = octv_split_payloads(payloads)
+        flat = octv_flat_columns(terminals, context=self._context)
+
+        for terminal_name in self._context:
+            if len(terminals[terminal_name]) > 0:
+                self._context[terminal_name] = terminals[terminal_name][-1].copy()
+
+        return O(terminals=terminals, flat=flat)
+
+
+def octv_encode_flat(columns, *, num_audio_channels=None, audio_sample_rate=None, num_detectors=None):
+    """
+    Encode columnar flat features, e.g. from octv_flat_columns, as one extent of an Octv stream,
+    returned as an array of octv_payload_dtype, see its tobytes() and tofile().
+
+    The columns are audio_frame_index, audio_channel, audio_sample, type, frame_offset, and
+    detector_index, and optionally the level_* fields, which are encoded for the types that use
+    them.  The CONFIG values default to those of the first feature.  A TICK is inserted before each
+    run of features with the same audio_frame_index and audio_channel, and a MOMENT before each
+    TICK whose audio_frame_index has different high bytes than the previous TICK, all vectorized.
+
+    >>> test2 = open('test2.octv', 'rb').read()
+    >>> octv_encode_flat(octv_decode_flat(test2)).tobytes() == test2
+    True
+    """
+    def config_value(name, value):
+        if value is not None: return value
+        column = columns.get(name)
+        if column is not None and len(column) > 0: return int(column[0])
+        raise ValueError(f'octv_encode_flat: expected a value for {name}, or a non-empty column')
+    num_audio_channels = config_value('num_audio_channels', num_audio_channels)
+    audio_sample_rate = config_value('audio_sample_rate', audio_sample_rate)
+    num_detectors = config_value('num_detectors', num_detectors)
+
+    audio_frame_index = np.asarray(columns['audio_frame_index'], dtype=np.uint64)
+    audio_channel = np.asarray(columns['audio_channel'])
+    types = np.asarray(columns['type'])
+    num_features = len(types)
+
+    if np.any(((types & lib.OCTV_NON_FEATURE_MASK) != 0) | (types == 0)):
+        raise ValueError(f'octv_encode_flat: expected FEATURE types, got {np.unique(types[((types & lib.OCTV_NON_FEATURE_MASK) != 0) | (types == 0)])}')
+    if np.any(audio_frame_index >= (1 << 48)):
+        raise ValueError(f'octv_encode_flat: expected 48-bit audio_frame_index values, got max {audio_frame_index.max()}')
+
+    # a feature starts a new TICK, and perhaps a new MOMENT, when its frame or channel differ from the previous feature
+    hi_bytes = audio_frame_index >> np.uint64(16)
+    new_tick = np.ones(num_features, dtype=bool)
+    new_tick[1:] = (audio_frame_index[1:] != audio_frame_index[:-1]) | (audio_channel[1:] != audio_channel[:-1])
+    new_moment = np.ones(num_features, dtype=bool)
+    new_moment[1:] = hi_bytes[1:] != hi_bytes[:-1]
+
+    # SENTINEL, CONFIG, then each feature follows all the MOMENT and TICK up through its own
+    feature_index = 2 + np.cumsum(new_moment) + np.cumsum(new_tick) + np.arange(num_features)
+    tick_index = feature_index[new_tick] - 1
+    moment_index = feature_index[new_moment] - 2
+
+    num_payloads = 2 + int(new_moment.sum()) + int(new_tick.sum()) + num_features + 1
+    payloads = np.zeros(num_payloads, dtype=octv_payload_dtype)
+    whole = payloads.view('<u8')
+
+    whole[0] = octv_sentinel_u8
+    config = payloads['config']
+    config['type'][1] = lib.OCTV_CONFIG_TYPE
+    config['octv_version'][1] = lib.OCTV_VERSION
+    config['num_audio_channels'][1] = num_audio_channels
+    config['audio_sample_rate_0'][1] = audio_sample_rate & 0xff
+    config['audio_sample_rate_1'][1] = (audio_sample_rate >> 8) & 0xff
+    config['audio_sample_rate_2'][1] = (audio_sample_rate >> 16) & 0xff
+    config['num_detectors'][1] = num_detectors
+    whole[-1] = octv_end_u8
+
+    moment = payloads['moment']
+    moment['type'][moment_index] = lib.OCTV_MOMENT_TYPE
+    moment['audio_frame_index_hi_bytes'][moment_index] = hi_bytes[new_moment]
+
+    tick = payloads['tick']
+    tick['type'][tick_index] = lib.OCTV_TICK_TYPE
+    tick['audio_channel'][tick_index] = audio_channel[new_tick]
+    tick['audio_frame_index_lo_bytes'][tick_index] = audio_frame_index[new_tick] & np.uint64(0xffff)
+    tick['audio_sample'][tick_index] = np.asarray(columns['audio_sample'])[new_tick]
+
+    feature = payloads['feature']
+    feature['type'][feature_index] = types
+    feature['frame_offset'][feature_index] = columns['frame_offset']
+    feature['detector_index'][feature_index] = columns['detector_index']
+    for (lower, upper), fields in octv_flat_level_fields:
+        in_range = (lower <= types) & (types < upper)
+        for field in fields:
+            column = columns.get(field)
+            if column is not None:
+                feature[field][feature_index[in_range]] = np.asarray(column)[in_range]
+
+    return payloads
@@ -0,0 +1,111 @@
+import os
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from octv_cffi import lib
+
+from octv import O
+from octv_numpy import octv_flat_columns, octv_flat_columns_fields, octv_flat_context_fields, octv_flat_derive, octv_payloads, octv_sentinel_u8, octv_split_payloads
+
+# Parallel decode of one large Octv file into columnar flat features
+#
+# The file is split into chunks that start at a MOMENT or a SENTINEL, and each chunk is decoded
+# by a worker process from its own read-only mapping of the file.  A worker cannot know the
+# CONFIG, MOMENT, and TICK in effect at the start of its chunk, so it reports how many of its
+# features precede each kind of context terminal, and the last of each kind; these are carried
+# forward, in stream order, into the leading features of the chunks that follow.
+
+def octv_next_boundary(payloads, start, *, window=4096):
+    """
+    Index of the first MOMENT or SENTINEL in payloads at or after start, or len(payloads), scanning
+    a growing window of the type bytes so that only the neighborhood of start is read.
+
+    >>> payloads = octv_payloads('test2.octv')
+    >>> octv_next_boundary(payloads, 0), octv_next_boundary(payloads, 1), octv_next_boundary(payloads, 3, window=1)
+    (0, 2, 8)
+    """
+    while start < len(payloads):
+        block = payloads[start:start+window]
+        found = np.flatnonzero((block['type'] == lib.OCTV_MOMENT_TYPE) | (block.view('<u8') == octv_sentinel_u8))
+        if len(found): return start + int(found[0])
+        start += window
+        window *= 2
+    return len(payloads)
+
+
+def octv_parallel_chunks(path, num_chunks):
+    """
+    Split the payloads of the Octv file at path into at most num_chunks ranges of about the same
+    size, (start, stop) pairs of payload indices, each after the first starting at a MOMENT or a
+    SENTINEL.
+
+    >>> octv_parallel_chunks('test2.octv', 4)
+    [(0, 2), (2, 8)]
+    """
+    payloads = octv_payloads(path, mmap=True)
+    bounds = [0]
+    for chunk_index in range(1, num_chunks):
+        target = max(len(payloads) * chunk_index // num_chunks, bounds[-1] + 1)
+        boundary = octv_next_boundary(payloads, target)
+        if boundary >= len(payloads): break
+        bounds.append(boundary)
+    bounds.append(len(payloads))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def octv_parallel_decode_chunk(path, start, stop):
+    # worker: the flat columns of one chunk, with what is needed to carry context across chunks
+    terminals = octv_split_payloads(octv_payloads(path, mmap=True)[start:stop])
+    columns = octv_flat_columns(terminals)
+
+    leading = dict()
+    last = dict()
+    for terminal_name, fields in octv_flat_context_fields:
+        terminal_index = terminals[terminal_name + '_index']
+        if len(terminal_index):
+            leading[terminal_name] = int(np.searchsorted(terminals.feature_index, terminal_index[0]))
+            last[terminal_name] = terminals[terminal_name][-1]
+        else:
+            leading[terminal_name] = len(terminals.feature_index)
+            last[terminal_name] = None
+    return dict(columns.items()), leading, last
+
+
+def octv_parallel_batches(path, *, max_workers=None, num_chunks=None):
+    """
+    Generate the columnar flat features of the Octv file at path, one O of columns per chunk, in
+    stream order, decoding the chunks in a pool of max_workers processes.  By default there is a
+    worker per CPU and four chunks per worker.
+
+    The columns are the same as those of octv_numpy.octv_decode_flat for the whole file.
+    """
+    max_workers = max_workers if max_workers is not None else os.cpu_count()
+    num_chunks = num_chunks if num_chunks is not None else 4 * max_workers
+    starts, stops = zip(*octv_parallel_chunks(path, num_chunks))
+
+    context = dict((terminal_name, None) for terminal_name, fields in octv_flat_context_fields)
+    with ProcessPoolExecutor(max_workers) as executor:
+        for columns, leading, last in executor.map(octv_parallel_decode_chunk, itertools.repeat(path), starts, stops):
+            columns = O(columns)
+            for terminal_name, fields in octv_flat_context_fields:
+                if context[terminal_name] is not None and leading[terminal_name]:
+                    for field in fields:
+                        columns[field][:leading[terminal_name]] = context[terminal_name][field]
+                if last[terminal_name] is not None:
+                    context[terminal_name] = last[terminal_name]
+            yield octv_flat_derive(columns)
+
+
+def octv_parallel_decode_flat(path, **kwargs):
+    """
+    Decode the Octv file at path into columnar flat features, concatenating the batches of
+    octv_parallel_batches.
+
+    >>> columns = octv_parallel_decode_flat('test2.octv', max_workers=2)
+    >>> columns.audio_frame_index, columns.level_3_int16_1
+    (array([131585, 131585, 131585], dtype=uint64), array([   0,    0, 2052], dtype=int16))
+    """
+    batches = list(octv_parallel_batches(path, **kwargs))
+    return O((field, np.concatenate([batch[field] for batch in batches])) for field in octv_flat_columns_fields)
@@ -0,0 +1,165 @@
+import numpy as np
+
+try:
+    import scipy.sparse
+except ImportError:
+    # optional, only needed for coo() and csr()
+    scipy = None
+
+from octv_cffi import lib
+
+from octv import default_chunk_size, iter_payload_blocks
+from octv_numpy import OctvPushParser, octv_flat_level_fields
+
+# Sparse matrices of flat features, e.g. for ML training
+#
+# Rows are frames, or windows of window_frames frames, counted from start_frame.  Columns are
+# (type, detector_index, level slot): each of the FEATURE types has num_detectors detectors, from
+# CONFIG, and each detector has a column for each of the up to four level_* fields of the type.
+# Values from features that share a row and column, e.g. from several audio channels or from the
+# frames of a window, are summed by csr(), or when the (indices, values) are densified.
+
+octv_sparse_num_types = lib.OCTV_FEATURE_3_UPPER - lib.OCTV_FEATURE_0_LOWER
+octv_sparse_num_slots = max(len(fields) for types, fields in octv_flat_level_fields)
+
+
+def octv_sparse_column(feature_type, detector_index, slot, num_detectors):
+    """
+    The column of a level slot of a detector of a FEATURE type.
+
+    >>> octv_sparse_column(0x01, 0, 0, 600), octv_sparse_column(0x01, 1, 0, 600), octv_sparse_column(0x02, 0, 3, 600)
+    (0, 4, 2403)
+    """
+    return ((feature_type - lib.OCTV_FEATURE_0_LOWER) * num_detectors + detector_index) * octv_sparse_num_slots + slot
+
+
+class OctvSparseBuilder(object):
+    """
+    Incremental, vectorized builder of a sparse matrix from batches of columnar flat features,
+    e.g. from octv_numpy.octv_decode_flat or OctvPushParser.feed().flat.  The entries are appended
+    to preallocated arrays that grow by doubling.
+
+    Features before start_frame, or at or after stop_frame when it is given, are skipped.  Without
+    stop_frame, the number of rows is that needed for the last frame seen.  The num_detectors of
+    the columns defaults to that of the first feature appended.
+
+    >>> from octv_numpy import octv_decode_flat
+    >>> builder = OctvSparseBuilder(start_frame=131072, window_frames=256)
+    >>> builder.append(octv_decode_flat('test2.octv'))
+    >>> indices, values, shape = builder.indices_values()
+    >>> shape, indices[0].tolist(), values.tolist()
+    ((3, 151200), [2, 2, 2, 2, 2, 2, 2, 2, 2], [1, 2, 4, 8, 1, 2, 2052, 513, 2052])
+    >>> indices[1].tolist()[:4], indices[1].tolist()[-2:] == [octv_sparse_column(0x33, 513, 0, 600), octv_sparse_column(0x33, 513, 1, 600)]
+    ([6852, 6853, 6854, 6855], True)
+    """
+    def __init__(self, *, num_detectors=None, start_frame=0, stop_frame=None, window_frames=1, capacity=1 << 16):
+        if window_frames < 1:
+            raise ValueError(f'{type(self).__name__}: expected window_frames of at least 1, got {window_frames}')
+        if stop_frame is not None and stop_frame < start_frame:
+            raise ValueError(f'{type(self).__name__}: expected stop_frame of at least start_frame {start_frame}, got {stop_frame}')
+        self.num_detectors = num_detectors
+        self.start_frame = start_frame
+        self.stop_frame = stop_frame
+        self.window_frames = window_frames
+        self.num_rows = 0 if stop_frame is None else -(-(stop_frame - start_frame) // window_frames)
+
+        self._size = 0
+        self._rows = np.zeros(capacity, dtype=np.int64)
+        self._columns = np.zeros(capacity, dtype=np.int64)
+        self._values = np.zeros(capacity, dtype=np.int32)
+
+    def __len__(self):
+        # number of entries
+        return self._size
+
+    @property
+    def shape(self):
+        num_detectors = self.num_detectors if self.num_detectors is not None else 0
+        return self.num_rows, octv_sparse_num_types * num_detectors * octv_sparse_num_slots
+
+    def _reserve(self, num_entries):
+        needed = self._size + num_entries
+        if needed <= len(self._rows): return
+        capacity = max(needed, 2 * len(self._rows))
+        for name in ('_rows', '_columns', '_values'):
+            grown = np.zeros(capacity, dtype=getattr(self, name).dtype)
+            grown[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, grown)
+
+    def append(self, columns):
+        # add the level values of the features in columns
+        if len(columns.type) == 0: return
+        if self.num_detectors is None:
+            self.num_detectors = int(columns.num_detectors[0])
+
+        audio_frame_index = columns.audio_frame_index.astype(np.int64)
+        in_range = audio_frame_index >= self.start_frame
+        if self.stop_frame is not None:
+            in_range &= audio_frame_index < self.stop_frame
+        if (columns.detector_index[in_range] >= self.num_detectors).any():
+            raise ValueError(f'{type(self).__name__}: expected detector_index less than num_detectors {self.num_detectors}, got {int(columns.detector_index[in_range].max())}')
+
+        rows = (audio_frame_index - self.start_frame) // self.window_frames
+        base_columns = (columns.type.astype(np.int64) - lib.OCTV_FEATURE_0_LOWER) * self.num_detectors + columns.detector_index
+        base_columns *= octv_sparse_num_slots
+
+        for (lower, upper), fields in octv_flat_level_fields:
+            selected = np.flatnonzero(in_range & (lower <= columns.type) & (columns.type < upper))
+            if len(selected) == 0: continue
+            self._reserve(len(selected) * len(fields))
+            for slot, field in enumerate(fields):
+                # one slot of every selected feature, interleaved so each feature's slots are adjacent
+                entries = slice(self._size + slot, self._size + len(selected) * len(fields), len(fields))
+                self._rows[entries] = rows[selected]
+                self._columns[entries] = base_columns[selected] + slot
+                self._values[entries] = columns[field][selected]
+            self._size += len(selected) * len(fields)
+            if self.stop_frame is None:
+                self.num_rows = max(self.num_rows, int(rows[selected].max()) + 1)
+
+    def indices_values(self):
+        # the entries as a (2, n) array of row and column indices, the values, and the shape
+        return np.stack((self._rows[:self._size], self._columns[:self._size])), self._values[:self._size].copy(), self.shape
+
+    def coo(self):
+        # a scipy.sparse.coo_matrix, duplicate entries are kept
+        if scipy is None:
+            raise ImportError(f'{type(self).__name__}.coo: scipy is not installed, see indices_values()')
+        return scipy.sparse.coo_matrix((self._values[:self._size], (self._rows[:self._size], self._columns[:self._size])), shape=self.shape)
+
+    def csr(self):
+        # a scipy.sparse.csr_matrix, duplicate entries are summed
+        return self.coo().tocsr()
+
+
+def octv_sparse_builder(path_or_file, *, chunk_size=default_chunk_size, **kwargs):
+    """
+    An OctvSparseBuilder with the flat features of an Octv file, path_or_file is a filename or a
+    binary file object, read in blocks of chunk_size bytes, up to END.  The keyword arguments are
+    those of OctvSparseBuilder.
+    """
+    builder = OctvSparseBuilder(**kwargs)
+    parser = OctvPushParser()
+    for block in iter_payload_blocks(path_or_file, chunk_size=chunk_size):
+        builder.append(parser.feed(block).flat)
+        if parser.ended: break
+    return builder
+
+
+def octv_sparse_seconds(reader, start, stop, **kwargs):
+    """
+    An OctvSparseBuilder with the flat features of the time range, in seconds, from start up to
+    stop, read with an octv_index.OctvSeekReader; the rows cover the whole range.  The keyword
+    arguments are those of OctvSparseBuilder, other than start_frame and stop_frame.
+
+    >>> from octv_index import OctvSeekReader, octv_build_index
+    >>> reader = OctvSeekReader('test2.octv', index=octv_build_index('test2.octv'))
+    >>> builder = octv_sparse_seconds(reader, 2.7, 2.8, window_frames=480)
+    >>> builder.shape, len(builder), sorted(set(builder.indices_values()[0][0].tolist()))
+    ((10, 151200), 9, [4])
+    """
+    start_frame = reader.frame_index_at(start)
+    stop_frame = reader.frame_index_at(stop)
+    builder = OctvSparseBuilder(start_frame=start_frame, stop_frame=stop_frame, **kwargs)
+    builder.append(reader.read_frames(start_frame, stop_frame))
+    return builder
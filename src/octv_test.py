@@ -1,8 +1,28 @@
 print()
 
 import sys, os
+import io
+import json
+import struct
+import itertools
+import collections
+import asyncio
+import tempfile
+import gc
+import subprocess
+
+import numpy as np
 
 import octv
+import octv_numpy
+import octv_asyncio
+import octv_index
+import octv_parallel
+import octv_aggregate
+import octv_sparse
+import octv_export
+import octv_block
+import octv_bench
 from octv import ffi, lib
 
 
@@ -147,6 +167,853 @@ def octv_test(args):
     log(f'octv_test: octv_parse_flat: res: {res}')
     print()
 
+    # Exercise octv_numpy whole-file decode
+
+    terminals = octv_numpy.octv_decode('test2.octv')
+    log(f'octv_test: octv_decode: feature: {terminals.feature}')
+    assert len(terminals.payloads) == 8, str((len(terminals.payloads),))
+    assert tuple(terminals.feature['type']) == (0x03, 0x23, 0x33), str((terminals.feature['type'],))
+    assert tuple(terminals.feature['detector_index']) == (513, 513, 513), str((terminals.feature['detector_index'],))
+    assert len(terminals.error) == 0, str((terminals.error,))
+
+    terminals = octv_numpy.octv_decode('test1.octv')
+    assert len(terminals.feature) == lib.OCTV_FEATURE_3_UPPER - lib.OCTV_FEATURE_0_LOWER, str((len(terminals.feature),))
+    print()
+
+    # columnar flat features agree with octv_parse_flat()
+
+    flat_features = list()
+    def append_flat_feature(flat_feature):
+        flat_features.append(flat_feature)
+        return 0
+    with octv.open_file_c('test2.octv') as file_c:
+        res = octv.octv_parse_flat(file_c, append_flat_feature)
+    assert res == 0, str((res,))
+    columns = octv_numpy.octv_decode_flat('test2.octv')
+    log(f'octv_test: octv_decode_flat: audio_frame_index: {columns.audio_frame_index}')
+    assert len(columns.type) == len(flat_features) == 3, str((len(columns.type), len(flat_features)))
+    for index, flat_feature in enumerate(flat_features):
+        for field in octv.OctvFlatFeature.fields:
+            assert columns[field][index] == getattr(flat_feature, field), str((index, field, columns[field][index], getattr(flat_feature, field)))
+    print()
+
+    # Exercise the benchmark harness on a small stream, every case sees the whole stream, results survive JSON
+
+    bench_stream = octv.O(name='small', num_audio_channels=3, num_detectors=1440, features_per_tick=20, num_frames=8, start_frame=(1 << 16) - 4)
+    bench_num_features = 3 * 20 * 8
+    # SENTINEL, CONFIG, two MOMENTs, a TICK per frame and channel, the features, END
+    bench_num_payloads = 2 + 2 + 3 * 8 + bench_num_features + 1
+    bench = octv_bench.octv_bench(streams=(bench_stream,), repeat=2, batch_deliveries=64, in_process=True)
+    bench = json.loads(json.dumps(bench))
+    assert bench['streams'][0]['num_payloads'] == bench_num_payloads, str(bench['streams'])
+    assert [result['case'] for result in bench['results']] == list(octv_bench.octv_bench_cases), str(bench['results'])
+    for result in bench['results']:
+        expected_deliveries = bench_num_features if result['case'] in ('octv_parse_flat', 'octv_struct') else bench_num_payloads
+        assert result['num_terminals'] == bench_num_payloads and result['num_deliveries'] == expected_deliveries, str(result)
+        assert result['num_batches'] == expected_deliveries // 64 and result['terminals_per_second'] > 0 and result['peak_rss_kib'] > 0, str(result)
+        assert 0 < result['batch_ms_p50'] <= result['batch_ms_max'] and result['seconds'] <= result['seconds_median'], str(result)
+        log(f"octv_test: octv_bench: {result['case']}: terminals_per_second: {result['terminals_per_second']:.0f}, batch_ms_p99: {result['batch_ms_p99']:.3f}")
+    comparisons = octv_bench.octv_bench_compare(bench, bench)
+    assert len(comparisons) == len(bench['results']) and not any(item.regressed for item in comparisons), str(comparisons)
+    print()
+
+    # Exercise import of octv in a fresh interpreter, without OCTV_DEBUG it prints nothing and its tables are built lazily, within a time budget
+
+    import_budget_us = 250000
+    import_dir = os.path.dirname(os.path.abspath(__file__))
+    import_run = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import octv; assert octv.octv_fields_of_type.cache_info().currsize == 0'],
+        cwd=import_dir, capture_output=True, text=True, env=dict((name, value) for name, value in os.environ.items() if name != 'OCTV_DEBUG'))
+    assert import_run.returncode == 0, str((import_run.returncode, import_run.stderr))
+    assert import_run.stdout == '', str((import_run.stdout,))
+    # importtime lines are 'import time: self | cumulative | module', in microseconds
+    import_us, = (int(line.split('|')[1]) for line in import_run.stderr.splitlines() if line.split('|')[-1].strip() == 'octv')
+    debug and log(f'import octv: {import_us} us, budget: {import_budget_us} us')
+    assert import_us < import_budget_us, str((import_us, import_budget_us))
+
+    fields = octv.octv_fields_of_type(lib.OCTV_CONFIG_TYPE)
+    assert (fields.terminal_name, fields.struct_name) == ('config', 'OctvConfig'), str(fields)
+    assert octv.octv_fields_of_type(lib.OCTV_FEATURE_0_LOWER).fields == tuple(field for field, field_type in ffi.typeof('OctvFeature').fields), str(octv.octv_fields_of_type(lib.OCTV_FEATURE_0_LOWER))
+
+    print()
+
+    # Exercise parse statistics, counts match a numpy decode, timing splits add up
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        stats_path = os.path.join(temp_dir, 'stats.octv')
+        with octv.OctvWriter(stats_path) as writer:
+            writer.start_extent(2, 48000, 600)
+            for audio_frame_index in range(0, 100000, 1000):
+                writer.tick(audio_frame_index, audio_frame_index % 2, 0.0)
+                writer.feature(0x03, 0, 7, 1, 2, 3, 4)
+                writer.feature(0x33, 0, 9, 5, 6)
+            writer.end()
+        stats_data = open(stats_path, 'rb').read()
+        expected = collections.Counter(stats_data[offset] for offset in range(0, len(stats_data), 8))
+
+        for parse_name in ('octv_parse_class', 'octv_parse_flat', 'octv_parse_class0', 'octv_parse_cursor', 'octv_parse_batch'):
+            with octv.OctvParseStats() as stats:
+                with octv.open_file_c(stats_path) as file_c:
+                    res = getattr(octv, parse_name)(file_c, lambda *args: 0)
+            # class0, cursor, and batch do not stop at END, the others do
+            assert stats.terminals == expected and stats.bytes_consumed == len(stats_data), str((parse_name, stats.terminals, expected))
+            assert stats.num_calls == 1 and stats.results == collections.Counter([octv.octv_code_name(res)]), str((parse_name, res, stats.results))
+            assert stats.send_ns <= stats.callback_ns <= stats.parse_ns and stats.c_ns + stats.callback_ns == stats.parse_ns, str((parse_name, stats.as_dict()))
+            assert stats.terminals_per_second > 0, str((parse_name, stats.as_dict()))
+            log(f'octv_test: OctvParseStats: {parse_name}: res: {res}, terminals: {stats.num_terminals}, terminals_per_second: {stats.terminals_per_second:.0f}, c_ns: {stats.c_ns}, crossing_ns: {stats.crossing_ns}, send_ns: {stats.send_ns}')
+
+        # errors passed to error_cb, and results of several calls, while nothing is recorded once detached
+        with octv.OctvParseStats() as stats:
+            octv.octv_parse_class_buffer(stats_data[:8] + b'\xc1' * 8 + stats_data[8:24], lambda terminal: 0)
+            octv.octv_parse_flat_buffer(stats_data[:20], lambda flat_feature: 0)
+            with octv.OctvParseStats() as inner_stats:
+                octv.octv_parse_class0_buffer(stats_data[:16], lambda payload: 0)
+            octv.octv_parse_class0_buffer(stats_data[:16], lambda payload: 0)
+        octv.octv_parse_class0_buffer(stats_data, lambda payload: 0)
+        metrics = stats.as_dict()
+        assert inner_stats.num_terminals == 2 and inner_stats.num_calls == 1, str(inner_stats.as_dict())
+        assert stats.num_calls == 3 and stats.num_terminals == 2 + 2 + 2, str(metrics)
+        assert stats.errors == collections.Counter(OCTV_ERROR_TYPE=1), str(stats.errors)
+        assert stats.results == collections.Counter(OCTV_ERROR_TYPE=1, OCTV_ERROR_EOF=2), str(stats.results)
+        assert metrics['terminals.0xc1'] == 1 and metrics['errors.OCTV_ERROR_TYPE'] == 1 and metrics['results.OCTV_ERROR_EOF'] == 2, str(metrics)
+        log(f'octv_test: OctvParseStats: metrics: {metrics}')
+
+        # only the client's callbacks are timed, not the flat assembly or filtering in C
+        # the filter rejects every feature, so no flat feature reaches the client, while the class
+        # parser still sends it the delimiters, CONFIG, MOMENTs, and TICKs
+        for parse_name, is_timed in (('octv_parse_flat_filter', False), ('octv_parse_class_filter', True)):
+            with octv.OctvParseStats() as stats:
+                with octv.open_file_c(stats_path) as file_c:
+                    getattr(octv, parse_name)(file_c, lambda *args: 0, octv.make_octv_filter(detector_index=(100, 200)))
+            assert stats.terminals == expected, str((parse_name, stats.terminals, expected))
+            assert (stats.callback_ns > 0) == is_timed and stats.c_ns + stats.callback_ns == stats.parse_ns, str((parse_name, stats.as_dict()))
+    print()
+
+    # Exercise tracing, the sink gets the log lines and the C trace events, if compiled in
+
+    trace_lines = list()
+    previous_sink = octv.set_trace_sink(None)
+    try:
+        # discard the events of the sections above
+        octv.octv_trace_drain()
+        octv.set_trace_sink(lambda level, line: trace_lines.append((level, line)))
+        with octv.open_file_c('test2.octv') as file_c:
+            octv.octv_parse_class(file_c, lambda terminal: 0)
+        octv.octv_parse_class0_buffer(b'\xff' * 8, lambda payload: lib.OCTV_ERROR_VALUE)
+        octv.log('octv_test: tracing', level=lib.OCTV_TRACE_ERROR)
+        events = octv.octv_trace_drain()
+    finally:
+        octv.set_trace_sink(previous_sink)
+
+    assert (lib.OCTV_TRACE_ERROR, 'octv.py: octv_test: tracing') in trace_lines, str(trace_lines)
+    if lib.octv_trace_compiled():
+        assert [event.name for event in events] == ['octv_parse_class', 'octv_parse_class0_buffer'], str(events)
+        assert events[1].sequence == events[0].sequence + 1 and events[1].arg1 == 8, str(events)
+        assert sum(line.startswith('octv.c: ') for level, line in trace_lines) == len(events), str(trace_lines)
+        # below the level nothing is recorded
+        previous_level = octv.set_trace_level(lib.OCTV_TRACE_ERROR)
+        octv.octv_parse_class0_buffer(b'', lambda payload: 0)
+        octv.set_trace_level(previous_level)
+        assert octv.octv_trace_drain() == [], 'expected no events below the trace level'
+    else:
+        assert events == [] and lib.octv_trace_next_sequence() == 0, str(events)
+
+    # one level for the log lines and the C trace ring
+    previous_level = octv.set_trace_level(lib.OCTV_TRACE_ERROR)
+    assert lib.octv_trace_set_level(lib.OCTV_TRACE_ERROR) == lib.OCTV_TRACE_ERROR and octv.trace_level == lib.OCTV_TRACE_ERROR
+    octv.set_trace_level(previous_level)
+    assert lib.octv_trace_set_level(previous_level) == previous_level
+
+    # the per-terminal lines of the octv_*X_cb callbacks are not formatted unless they reach a sink
+    formatted = list()
+    struct_str = octv.octv_struct_str
+    octv.octv_struct_str = lambda terminal: formatted.append(terminal.type) or struct_str(terminal)
+    try:
+        # tracing is off unless OCTV_DEBUG is set
+        with octv.open_file_c('test2.octv') as file_c:
+            octv.octv_parse_full(file_c, octv.new_parser())
+        assert len(formatted) == (8 if octv.debug else 0) and (octv.trace_sink is None) != octv.debug, str(formatted)
+        for sink, level, expected_formatted in ((None, lib.OCTV_TRACE_DEBUG, 0), (lambda level, line: None, lib.OCTV_TRACE_ERROR, 0), (lambda level, line: None, lib.OCTV_TRACE_DEBUG, 8)):
+            previous_sink = octv.set_trace_sink(sink)
+            previous_level = octv.set_trace_level(level)
+            try:
+                del formatted[:]
+                with octv.open_file_c('test2.octv') as file_c:
+                    octv.octv_parse_full(file_c, octv.new_parser())
+            finally:
+                octv.set_trace_level(previous_level)
+                octv.set_trace_sink(previous_sink)
+            assert len(formatted) == expected_formatted, str((sink, level, formatted))
+    finally:
+        octv.octv_struct_str = struct_str
+    log(f'octv_test: tracing: compiled: {lib.octv_trace_compiled()}, events: {len(events)}, lines: {len(trace_lines)}')
+    print()
+
+    # Exercise the block-compressed container, lossless and seekable at any block size
+
+    block_file = io.BytesIO()
+    with octv.OctvWriter(block_file) as writer:
+        for extent in range(2):
+            writer.start_extent(2, 48000, 1440)
+            for audio_frame_index in range(extent * (3 << 16) + 1000, extent * (3 << 16) + (2 << 16) + 1000, 97):
+                for audio_channel in range(2):
+                    writer.tick(audio_frame_index, audio_channel, audio_channel * 0.5)
+                    for detector_index in range(audio_frame_index % 7, 1440, 181):
+                        writer.feature(0x05 + detector_index % 3, 0, detector_index, detector_index % 16, 1, 0, 0)
+            writer.end()
+    block_data = block_file.getvalue()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        block_path = os.path.join(temp_dir, 'blocks.octvb')
+        for method, block_payloads, chunk_size in (('zlib', 1 << 16, 1 << 20), ('lzma', 1000, 4000), ('zlib', 1, 20)):
+            block_file.seek(0)
+            octv_block.octv_block_compress(block_file, block_path, method=method, block_payloads=block_payloads, chunk_size=chunk_size)
+            reader = octv_block.OctvBlockReader(block_path)
+            assert reader.method == method and int(reader.index['num_payloads'].sum()) == len(block_data) // 8, str((method, block_payloads))
+
+            decompressed = io.BytesIO()
+            octv_block.octv_block_decompress(block_path, decompressed)
+            assert decompressed.getvalue() == block_data, str((method, block_payloads))
+
+            # blocks decode on their own, with the context from the index
+            flat = octv_block.octv_block_concatenate([reader.read_flat(block_index) for block_index in range(len(reader))])
+            expected = octv_numpy.octv_decode_flat(block_data)
+            for field in octv_numpy.octv_flat_columns_fields:
+                assert np.array_equal(flat[field], expected[field]), str((method, block_payloads, field))
+
+            for start, stop in ((0, 1 << 20), (70000, 70001), (65000, 140000), ((3 << 16) + 5000, (3 << 16) + 9000)):
+                got = reader.read_frames(start, stop)
+                in_range = (start <= expected.audio_frame_index) & (expected.audio_frame_index < stop)
+                assert np.array_equal(got.audio_frame_index, expected.audio_frame_index[in_range]), str((method, block_payloads, start, stop))
+                assert np.array_equal(got.detector_index, expected.detector_index[in_range]), str((method, block_payloads, start, stop))
+            log(f'octv_test: octv_block: method: {method}, block_payloads: {block_payloads}, blocks: {len(reader)}, size: {len(block_data)} -> {os.path.getsize(block_path)}')
+
+        columns = octv_block.octv_block_decode_flat(block_path, max_workers=2)
+        assert np.array_equal(columns.level_0_int8_0, expected.level_0_int8_0)
+
+        # the container is the same whatever the sizes of the writes
+        containers = set()
+        for write_size in (len(block_data), 4096, 64, 13):
+            container = io.BytesIO()
+            with octv_block.OctvBlockWriter(container, block_payloads=1000) as writer:
+                for offset in range(0, len(block_data), write_size):
+                    writer.write(memoryview(block_data)[offset:offset + write_size])
+            containers.add(container.getvalue())
+        assert len(containers) == 1, str(len(containers))
+
+        # the features of a tick span several blocks, a range that starts exactly at the tick gets all of them
+        split_file = io.BytesIO()
+        with octv.OctvWriter(split_file) as writer:
+            writer.start_extent(1, 48000, 600)
+            for audio_frame_index in range(1000, 1100, 10):
+                writer.tick(audio_frame_index, 0, 0.0)
+                for detector_index in range(20):
+                    writer.feature(0x33, 0, detector_index, audio_frame_index, detector_index)
+            writer.end()
+        split_file.seek(0)
+        octv_block.octv_block_compress(split_file, block_path, block_payloads=5)
+        reader = octv_block.OctvBlockReader(block_path)
+        assert len(reader) > 20 and int(np.sum(reader.index['audio_frame_index'] == 1020)) > 1, str(reader.index['audio_frame_index'])
+        expected = octv_numpy.octv_decode_flat(split_file.getvalue())
+        for start, stop, num_features in ((1020, 1021, 20), (1000, 1001, 20), (1020, 1040, 40), (1005, 1011, 20), (1090, 2000, 20)):
+            got = reader.read_frames(start, stop)
+            in_range = (start <= expected.audio_frame_index) & (expected.audio_frame_index < stop)
+            assert len(got.type) == num_features and np.array_equal(got.detector_index, expected.detector_index[in_range]), str((start, stop, len(got.type)))
+    print()
+
+    # Exercise columnar export in row groups, round trip of the .npz format
+
+    export_file = io.BytesIO()
+    with octv.OctvWriter(export_file) as writer:
+        for extent in range(2):
+            writer.start_extent(2, 48000 + extent * 48000, 600)
+            for audio_frame_index in range((1 << 16) - 500, (1 << 16) + 500, 7):
+                writer.tick(audio_frame_index, audio_frame_index % 2, 0.0)
+                writer.feature(0x03, 0, audio_frame_index % 600, 1, 2, 3, audio_frame_index % 100)
+                writer.feature(0x33, 0, 17, extent, -audio_frame_index % 30000)
+            writer.end()
+    columns = octv_numpy.octv_decode_flat(export_file.getvalue())
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        export_path = os.path.join(temp_dir, 'export.npz')
+        for row_group_size, chunk_size in ((1 << 20, 1 << 20), (100, 256), (1, 24), (7, 1 << 20)):
+            export_file.seek(0)
+            num_features = octv_export.octv_export(export_file, export_path, row_group_size=row_group_size, chunk_size=chunk_size)
+            groups = list(octv_export.octv_iter_npz(export_path))
+            # only the first extent, the stream ends at its END
+            assert num_features == len(columns.type) // 2, str((num_features, len(columns.type)))
+            assert [len(group.type) for group in groups[:-1]] == [row_group_size] * (len(groups) - 1), str((row_group_size, [len(group.type) for group in groups]))
+            for field, dtype in octv_export.octv_export_dtypes:
+                exported = np.concatenate([group[field] for group in groups])
+                assert exported.dtype == dtype and np.array_equal(exported, columns[field][:num_features]), str((row_group_size, field))
+            log(f'octv_test: octv_export: row_group_size: {row_group_size}, chunk_size: {chunk_size}, row groups: {len(groups)}, features: {num_features}, size: {os.path.getsize(export_path)}')
+
+        if octv_export.pyarrow is not None:
+            for suffix in ('.arrow', '.parquet'):
+                export_file.seek(0)
+                octv_export.octv_export(export_file, export_path + suffix, row_group_size=100)
+                table = octv_export.pyarrow.ipc.open_file(export_path + suffix).read_all() if suffix == '.arrow' else octv_export.pyarrow.parquet.read_table(export_path + suffix)
+                assert np.array_equal(table.column('audio_frame_index').to_numpy(), columns.audio_frame_index[:table.num_rows]), suffix
+        else:
+            try:
+                octv_export.octv_export(export_file, export_path + '.parquet')
+            except ImportError:
+                pass
+            else:
+                assert False, 'expected ImportError without pyarrow'
+
+        try:
+            octv_export.octv_export(export_file, export_path + '.csv')
+        except ValueError:
+            pass
+        else:
+            assert False, 'expected ValueError for an unknown suffix'
+    print()
+
+    # Exercise sparse matrices, dense reference built one feature at a time
+
+    sparse_file = io.BytesIO()
+    with octv.OctvWriter(sparse_file) as writer:
+        writer.start_extent(2, 48000, 12)
+        for audio_frame_index in range((1 << 16) - 2000, (1 << 16) + 2000, 40):
+            for audio_channel in range(2):
+                writer.tick(audio_frame_index, audio_channel, 0.0)
+                writer.feature(0x07, 0, audio_frame_index % 12, audio_frame_index % 100 - 50, 1, 0, -3)
+                writer.feature(0x27, 0, 11, audio_channel, 2, -audio_frame_index % 4000)
+                writer.feature(0x37, 0, 5, audio_frame_index % 30000, -audio_channel)
+        writer.end()
+    columns = octv_numpy.octv_decode_flat(sparse_file.getvalue())
+
+    for start_frame, stop_frame, window_frames, chunk_size in ((0, None, 1, 1 << 20), ((1 << 16) - 1000, None, 100, 200), (1 << 16, (1 << 16) + 1001, 1000, 64)):
+        builder_kwargs = dict(start_frame=start_frame, stop_frame=stop_frame, window_frames=window_frames, capacity=16)
+        sparse_file.seek(0)
+        builder = octv_sparse.octv_sparse_builder(sparse_file, chunk_size=chunk_size, **builder_kwargs)
+        indices, values, shape = builder.indices_values()
+
+        expected = np.zeros(shape, dtype=np.int64)
+        for index in range(len(columns.type)):
+            audio_frame_index = int(columns.audio_frame_index[index])
+            if audio_frame_index < start_frame or (stop_frame is not None and audio_frame_index >= stop_frame): continue
+            feature_type = int(columns.type[index])
+            fields, = (fields for (lower, upper), fields in octv_numpy.octv_flat_level_fields if lower <= feature_type < upper)
+            for slot, field in enumerate(fields):
+                column = octv_sparse.octv_sparse_column(feature_type, int(columns.detector_index[index]), slot, 12)
+                expected[(audio_frame_index - start_frame) // window_frames, column] += int(columns[field][index])
+
+        got = np.zeros(shape, dtype=np.int64)
+        np.add.at(got, (indices[0], indices[1]), values)
+        assert shape[1] == 63 * 12 * 4, str(shape)
+        assert np.array_equal(got, expected), str((start_frame, stop_frame, window_frames, chunk_size))
+        if octv_sparse.scipy is not None:
+            assert np.array_equal(builder.csr().toarray(), expected)
+        else:
+            try:
+                builder.csr()
+            except ImportError:
+                pass
+            else:
+                assert False, 'expected ImportError without scipy'
+        log(f'octv_test: octv_sparse: start_frame: {start_frame}, stop_frame: {stop_frame}, window_frames: {window_frames}, chunk_size: {chunk_size}, shape: {shape}, entries: {len(builder)}')
+    print()
+
+    # Exercise streaming aggregation, windows span the chunks that are read
+
+    aggregate_file = io.BytesIO()
+    with octv.OctvWriter(aggregate_file) as writer:
+        writer.start_extent(2, 48000, 1440)
+        for audio_frame_index in range((1 << 16) - 3000, (1 << 16) + 3000, 50):
+            for audio_channel in range(2):
+                writer.tick(audio_frame_index, audio_channel, 0.0)
+                writer.feature(0x07, 0, audio_frame_index % 3, audio_frame_index % 100 - 50, 0, 0, 0)
+                writer.feature(0x37, 0, 5, -audio_frame_index % 4000, audio_channel)
+        writer.end()
+    columns = octv_numpy.octv_decode_flat(aggregate_file.getvalue())
+    levels = octv_aggregate.octv_feature_max_level(columns).tolist()
+
+    for window_frames, chunk_size in ((1 << 16, 1 << 20), (1 << 16, 200), (1000, 64), (1, 4096)):
+        expected = collections.defaultdict(list)
+        for index, level in enumerate(levels):
+            key = (int(columns.audio_frame_index[index]) // window_frames, int(columns.type[index]), int(columns.detector_index[index]), int(columns.audio_channel[index]))
+            expected[key].append(level)
+
+        aggregate_file.seek(0)
+        windows = list()
+        got = dict()
+        for groups in octv_aggregate.octv_aggregate(aggregate_file, chunk_size=chunk_size, window_frames=window_frames):
+            windows.extend(groups.window.tolist())
+            for index, key in enumerate(zip(*(groups[field].tolist() for field in octv_aggregate.octv_aggregate_key_fields))):
+                assert key not in got, str((window_frames, chunk_size, key))
+                got[key] = (groups.count[index], groups.sum[index], groups.min[index], groups.max[index], groups.histogram[index].tolist())
+                assert groups.audio_frame_index[index] == key[0] * window_frames
+        assert windows == sorted(windows), str((window_frames, chunk_size, windows))
+        assert set(got) == set(expected), str((window_frames, chunk_size, sorted(set(got) ^ set(expected))))
+        for key, values in expected.items():
+            histogram = np.histogram(np.clip(values, -32768, 32767), bins=octv_aggregate.octv_default_level_bins)[0].tolist()
+            assert got[key] == (len(values), sum(values), min(values), max(values), histogram), str((window_frames, chunk_size, key, got[key], values))
+        log(f'octv_test: octv_aggregate: window_frames: {window_frames}, chunk_size: {chunk_size}, groups: {len(got)}, windows: {len(set(windows))}')
+    print()
+
+    # Exercise filter pushdown into the C parsers
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        filter_path = os.path.join(temp_dir, 'filter.octv')
+        with octv.OctvWriter(filter_path) as writer:
+            writer.start_extent(2, 48000, 1440)
+            for audio_frame_index in range((1 << 16) - 40, (1 << 16) + 40, 4):
+                for audio_channel in range(2):
+                    writer.tick(audio_frame_index, audio_channel, 0.0)
+                    for feature_type, levels in ((0x05, (audio_frame_index % 7, -1, 2, 3)), (0x25, (1, 2, audio_frame_index % 300)), (0x35, (-3, audio_frame_index % 500))):
+                        writer.feature(feature_type, 0, (audio_frame_index + feature_type) % 1440, *levels)
+            writer.end()
+        columns = octv_numpy.octv_decode_flat(filter_path)
+
+        def level_at_least(threshold):
+            at_least = np.zeros(len(columns.type), dtype=bool)
+            for (lower, upper), fields in octv_numpy.octv_flat_level_fields:
+                in_range = (lower <= columns.type) & (columns.type < upper)
+                for field in fields:
+                    at_least |= in_range & (columns[field] >= threshold)
+            return at_least
+
+        for kwargs, expected in (
+                (dict(), np.ones(len(columns.type), dtype=bool)),
+                (dict(feature_types=(0x05, 0x35)), np.isin(columns.type, (0x05, 0x35))),
+                (dict(detector_index=(700, 740)), (700 <= columns.detector_index) & (columns.detector_index < 740)),
+                (dict(audio_channels=(1,)), columns.audio_channel == 1),
+                (dict(audio_frame_index=range((1 << 16) - 8, (1 << 16) + 8)), ((1 << 16) - 8 <= columns.audio_frame_index) & (columns.audio_frame_index < (1 << 16) + 8)),
+                (dict(level_threshold=250), level_at_least(250)),
+                (dict(feature_types=(0x25,), audio_channels=(0,), level_threshold=100), (columns.type == 0x25) & (columns.audio_channel == 0) & level_at_least(100)),
+                ):
+            octv_filter = octv.make_octv_filter(**kwargs)
+            expected_features = list(zip(columns.type[expected].tolist(), columns.detector_index[expected].tolist()))
+
+            flat_features = list()
+            def send_flat(flat_feature):
+                flat_features.append((flat_feature.type, flat_feature.detector_index))
+                return 0
+            with octv.open_file_c(filter_path) as file_c:
+                res = octv.octv_parse_flat_filter(file_c, send_flat, octv_filter)
+            assert res == 0, str((kwargs, res))
+            assert flat_features == expected_features, str((kwargs, flat_features, expected_features))
+
+            class_terminals = list()
+            def send_class(terminal):
+                class_terminals.append(terminal)
+                return 0
+            with octv.open_file_c(filter_path) as file_c:
+                res = octv.octv_parse_class_filter(file_c, send_class, octv_filter)
+            class_features = [(terminal.type, terminal.detector_index) for terminal in class_terminals if isinstance(terminal, octv.OctvFeatureBase)]
+            assert class_features == expected_features, str((kwargs, class_features, expected_features))
+            assert sum(isinstance(terminal, octv.OctvMoment) for terminal in class_terminals) == 2, str((kwargs, class_terminals))
+            log(f'octv_test: octv_parse_flat_filter: {kwargs}: {len(flat_features)} of {len(columns.type)}')
+
+        try:
+            octv.make_octv_filter(feature_types=(0x40,))
+        except ValueError as error:
+            log(f'octv_test: make_octv_filter: {error}')
+        else:
+            assert False, 'expected ValueError for a type that is not a FEATURE'
+    print()
+
+    # Exercise the OctvX views over a shared buffer, and the batch iter_unpack path
+
+    with open('test2.octv', 'rb') as test_file:
+        test2 = test_file.read()
+    with open('test4.octv', 'rb') as test_file:
+        test4 = test_file.read()
+    for buffer in (test2, test4, memoryview(test2 + test4 + b'Octv')):
+        views = list(octv.OctvX.iter_octv(buffer))
+        unpacked = list(octv.OctvX.iter_unpack(buffer))
+        assert len(views) == len(unpacked) == len(buffer) // 8, str((len(views), len(unpacked)))
+        for offset, (view, (cls, fields)) in enumerate(zip(views, unpacked)):
+            if cls is None:
+                assert bytes(view) == bytes(buffer[offset*8:offset*8+8]), str((offset, view))
+            else:
+                assert type(view) is cls and view.unpacked == fields, str((offset, view, cls, fields))
+                assert view.payload == buffer[offset*8:offset*8+8], str((offset, view))
+                assert str(view) == str(cls(bytes(view.payload))), str((offset, view))
+    feature = octv.OctvXFeature(test2, 6 * 8)
+    assert (feature.type, feature.detector_index, feature.levels) == (0x33, 513, dict(level_3_int16_0=513, level_3_int16_1=2052)), str((feature,))
+    for bad_offset in (-8, 60):
+        try:
+            octv.OctvXFeature(test2, bad_offset)
+        except ValueError as error:
+            log(f'octv_test: OctvXFeature: {error}')
+        else:
+            assert False, str((bad_offset,))
+    print()
+
+    # Exercise the flyweight cursor, and that parse calls do not hold onto their cdata
+
+    with open('test2.octv', 'rb') as test_file:
+        test2 = test_file.read()
+    cursor_terminals = list()
+    def send_cursor(cursor):
+        cursor_terminals.append((cursor.terminal_name, cursor.type, cursor.detector_index if cursor.terminal_name == 'feature' else None))
+        return 0
+    cursor = octv.OctvCursor()
+    res, consumed = octv.octv_parse_cursor_buffer(test2, send_cursor, cursor=cursor)
+    assert (res, consumed) == (lib.OCTV_ERROR_EOF, 64), str((res, consumed))
+    assert cursor.payload_c == ffi.NULL and cursor.terminal_name is None, str((cursor.payload_c,))
+    expected = [(terminal_name, payload[0], struct.unpack_from('<H', payload, 2)[0] if terminal_name == 'feature' else None)
+                for payload in (test2[offset:offset+8] for offset in range(0, 64, 8))
+                for terminal_name in (octv.octv_struct_name_by_type[payload[0]][1],)]
+    assert cursor_terminals == expected, str((cursor_terminals, expected))
+    with octv.open_file_c('test2.octv') as file_c:
+        cursor_terminals.clear()
+        res = octv.octv_parse_cursor(file_c, send_cursor)
+    assert (res, cursor_terminals) == (lib.OCTV_ERROR_EOF, expected), str((res, cursor_terminals))
+
+    for repeat in range(100):
+        octv.octv_parse_class_buffer(test2, lambda terminal: 0)
+        octv.octv_parse_flat_buffer(test2, lambda flat_feature: 0)
+    gc.collect()
+    assert len(octv.referents) == 0, str((len(octv.referents),))
+    print()
+
+    # Exercise the seek index, frame ranges that span MOMENTs and extents
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        seek_path = os.path.join(temp_dir, 'seek.octv')
+        with octv.OctvWriter(seek_path) as writer:
+            for first_frame in (0, 3 << 16):
+                writer.start_extent(1, 48000, 1440)
+                for audio_frame_index in range(first_frame, first_frame + (5 << 16), 5000):
+                    writer.tick(audio_frame_index, 0, 0.0)
+                    writer.feature(0x30, 0, audio_frame_index % 1440, -1, -2)
+            writer.end()
+
+        index = octv_index.octv_load_index(seek_path)
+        assert os.path.exists(octv_index.octv_index_path(seek_path))
+        assert index.extents['offset'].tolist() == [0, index.extents['offset'][1]], str((index.extents,))
+        assert len(index.moments) == 10, str((index.moments,))
+        loaded = octv_index.octv_load_index(seek_path, build=False)
+        assert np.array_equal(loaded.moments, index.moments), str((loaded.moments, index.moments))
+
+        columns = octv_numpy.octv_decode_flat(seek_path)
+        reader = octv_index.OctvSeekReader(seek_path)
+        for start, stop in ((0, 1), (70000, 200000), (3 << 16, (3 << 16) + 1), (250000, 400000), (1 << 30, 1 << 31)):
+            in_range = (start <= columns.audio_frame_index) & (columns.audio_frame_index < stop)
+            seeked = reader.read_frames(start, stop)
+            for field in octv_numpy.octv_flat_columns_fields:
+                assert np.array_equal(seeked[field], columns[field][in_range]), str((start, stop, field, seeked[field], columns[field][in_range]))
+        seeked = reader.read_seconds(2.0, 3.0)
+        assert seeked.audio_frame_index.tolist() == [audio_frame_index for audio_frame_index in columns.audio_frame_index.tolist() if 96000 <= audio_frame_index < 144000], str((seeked,))
+
+        # the index is the same whatever the chunks of the scan
+        for chunk_payloads in (1, 3, 1000):
+            chunked = octv_index.octv_build_index(seek_path, chunk_payloads=chunk_payloads)
+            assert np.array_equal(chunked.extents, index.extents) and np.array_equal(chunked.moments, index.moments), str(chunk_payloads)
+
+        # extents with different sample rates, seconds are converted with the CONFIG in effect
+        rates_path = os.path.join(temp_dir, 'rates.octv')
+        with octv.OctvWriter(rates_path) as writer:
+            for first_frame, audio_sample_rate in ((0, 48000), (1 << 20, 96000)):
+                writer.start_extent(1, audio_sample_rate, 600)
+                for audio_frame_index in range(first_frame, first_frame + (5 << 16), 4000):
+                    writer.tick(audio_frame_index, 0, 0.0)
+                    writer.feature(0x30, 0, audio_frame_index % 600, -1, -2)
+            writer.end()
+        rates_columns = octv_numpy.octv_decode_flat(rates_path)
+        rates_reader = octv_index.OctvSeekReader(rates_path)
+        for start, stop, start_frame, stop_frame in ((1.0, 2.0, 48000, 96000), (11.0, 12.0, 11 * 96000, 12 * 96000)):
+            seeked = rates_reader.read_seconds(start, stop)
+            expected = [audio_frame_index for audio_frame_index in rates_columns.audio_frame_index.tolist() if start_frame <= audio_frame_index < stop_frame]
+            assert len(expected) > 0 and seeked.audio_frame_index.tolist() == expected, str((start, stop, seeked.audio_frame_index))
+
+        # parallel decode, chunks split at MOMENTs and SENTINELs with context carried across them
+        for num_chunks in (1, 3, 7, 64):
+            chunks = octv_parallel.octv_parallel_chunks(seek_path, num_chunks)
+            assert chunks[0][0] == 0 and chunks[-1][1] == len(octv_numpy.octv_payloads(seek_path)), str((chunks,))
+            assert all(stop == start for (_, stop), (start, _) in zip(chunks[:-1], chunks[1:])), str((chunks,))
+            batches = list(octv_parallel.octv_parallel_batches(seek_path, max_workers=4, num_chunks=num_chunks))
+            assert len(batches) == len(chunks), str((len(batches), chunks))
+            parallel = octv_parallel.octv_parallel_decode_flat(seek_path, max_workers=4, num_chunks=num_chunks)
+            for field in octv_numpy.octv_flat_columns_fields:
+                assert np.array_equal(parallel[field], columns[field]), str((num_chunks, field, parallel[field], columns[field]))
+        log(f'octv_test: octv_parallel_chunks: {chunks}')
+
+        # a stale index is rebuilt, or refused
+        with open(seek_path, 'ab') as seek_file:
+            seek_file.write(b'Octv\xa4\x6d\xae\xb6')
+        try:
+            octv_index.octv_load_index(seek_path, build=False)
+        except ValueError as error:
+            log(f'octv_test: octv_load_index: stale: {error}')
+        else:
+            assert False, 'expected ValueError for a stale index'
+        assert len(octv_index.octv_load_index(seek_path).extents) == 3
+
+        # a truncated, empty, or incomplete sidecar is rebuilt, or refused
+        index_path = octv_index.octv_index_path(seek_path)
+        sidecar = open(index_path, 'rb').read()
+        for damaged in (sidecar[:len(sidecar) // 2], b'', None):
+            if damaged is None:
+                with np.load(index_path) as index_npz, open(index_path + '.tmp', 'wb') as index_file:
+                    np.savez(index_file, extents=index_npz['extents'], source_stat=index_npz['source_stat'])
+                os.replace(index_path + '.tmp', index_path)
+            else:
+                with open(index_path, 'wb') as index_file:
+                    index_file.write(damaged)
+            try:
+                octv_index.octv_load_index(seek_path, build=False)
+            except Exception as error:
+                log(f'octv_test: octv_load_index: damaged: {type(error).__name__}: {error}')
+            else:
+                assert False, 'expected an error for a damaged index'
+            assert len(octv_index.OctvSeekReader(seek_path).index.extents) == 3
+            assert np.array_equal(octv_index.octv_load_index(seek_path, build=False).moments, index.moments)
+    print()
+
+    # Exercise resynchronization at a SENTINEL after damage that shifts the alignment
+
+    writer_file = io.BytesIO()
+    with octv.OctvWriter(writer_file) as writer:
+        for first_frame in (100, 110):
+            writer.start_extent(1, 48000, 1440)
+            for audio_frame_index in range(first_frame, first_frame + 4):
+                writer.tick(audio_frame_index, 0, 0.0)
+                writer.feature(0x30, 0, 7, -1, -2)
+        writer.end()
+    clean = writer_file.getvalue()
+    second_sentinel = octv.octv_find_sentinel(clean, 1)
+    assert second_sentinel == 11 * 8, str((second_sentinel,))
+    assert octv.octv_find_sentinel(clean, second_sentinel + 1) == len(clean)
+
+    # drop 3 bytes from the middle of the first extent
+    damaged = clean[:6 * 8 + 2] + clean[6 * 8 + 5:]
+    sent = list()
+    def send_sent(obj):
+        sent.append(str(obj))
+        return 0
+    res, consumed, damages = octv.octv_parse_class_resync(damaged, send_sent)
+    log(f'octv_test: octv_parse_class_resync: res: {res}, consumed: {consumed}, damages: {damages}')
+    assert (res, consumed) == (0, len(damaged)), str((res, consumed))
+    assert len(damages) == 1, str((damages,))
+    assert damages[0].stop == second_sentinel - 3, str((damages,))
+    assert damages[0].audio_frame_index_after == 110, str((damages,))
+    assert damages[0].frames_lost == 110 - damages[0].audio_frame_index_before - 1, str((damages,))
+    recovered = sent[-12:]
+    sent.clear()
+    octv.octv_parse_class_buffer(clean[second_sentinel:], send_sent)
+    assert recovered == sent, str((recovered, sent))
+
+    # no SENTINEL after the damage, the rest of the buffer is lost
+    res, consumed, damages = octv.octv_parse_class_resync(b'\x7f' * 16 + clean[8:second_sentinel], send_obj)
+    assert (res, consumed) == (lib.OCTV_ERROR_EOF, 8 + second_sentinel), str((res, consumed))
+    assert [(damage.start, damage.stop) for damage in damages] == [(0, 8 + second_sentinel)], str((damages,))
+    print()
+
+    # Exercise the buffer parsers, with bytes, bytearray, and memoryview
+
+    with open('test2.octv', 'rb') as test_file:
+        test2 = test_file.read()
+
+    sent = list()
+    def send_sent(obj):
+        sent.append(str(obj))
+        return 0
+    for buffer in (test2, bytearray(test2), memoryview(test2), test2 + b'Octv'):
+        sent.clear()
+        res, consumed = octv.octv_parse_class_buffer(buffer, send_sent)
+        log(f'octv_test: octv_parse_class_buffer: {type(buffer).__name__}: res: {res}, consumed: {consumed}')
+        assert (res, consumed) == (0, 64), str((res, consumed))
+        assert len(sent) == 8, str((sent,))
+
+    # truncated, resume parsing once the remainder is available
+    res, consumed = octv.octv_parse_class_buffer(test2[:29], send_obj)
+    assert (res, consumed) == (lib.OCTV_ERROR_EOF, 24), str((res, consumed))
+    res, consumed = octv.octv_parse_class_buffer(test2[consumed:], send_obj)
+    assert (res, consumed) == (0, 40), str((res, consumed))
+
+    # the type just past the FEATURE types is invalid
+    res, consumed = octv.octv_parse_class_buffer(bytes([lib.OCTV_FEATURE_3_UPPER]) + test2[1:8], send_obj)
+    assert (res, consumed) == (lib.OCTV_ERROR_TYPE, 8), str((res, consumed))
+
+    # invalid type, consumed includes the bad payload
+    with open('test1.octv', 'rb') as test_file:
+        res, consumed = octv.octv_parse_class_buffer(test_file.read(), send_obj)
+    assert (res, consumed) == (lib.OCTV_ERROR_TYPE, 8), str((res, consumed))
+
+    sent.clear()
+    res, consumed = octv.octv_parse_flat_buffer(memoryview(test2), send_sent)
+    log(f'octv_test: octv_parse_flat_buffer: res: {res}, consumed: {consumed}, sent: {sent}')
+    assert (res, consumed, len(sent)) == (0, 64, 3), str((res, consumed, sent))
+
+    # resuming in a later call keeps the CONFIG, MOMENT, and TICK context of the features
+    expected = list(sent)
+    sent.clear()
+    flat_parser = octv.make_octv_flat_parser()
+    res, consumed = octv.octv_parse_flat_buffer(test2[:40], send_sent, flat_parser)
+    assert (res, consumed, len(sent)) == (lib.OCTV_ERROR_EOF, 40, 1), str((res, consumed, sent))
+    res, consumed = octv.octv_parse_flat_buffer(test2[consumed:], send_sent, flat_parser)
+    assert (res, consumed) == (0, 24) and sent == expected, str((res, consumed, sent, expected))
+
+    # without the context, a FEATURE is an error rather than a flat feature of stale fields
+    sent.clear()
+    res, consumed = octv.octv_parse_flat_buffer(test2[40:], send_sent)
+    assert (res, consumed, len(sent)) == (lib.OCTV_ERROR_VALUE, 8, 0), str((res, consumed, sent))
+
+    sent.clear()
+    res, consumed = octv.octv_parse_class0_buffer(bytearray(test2), send_sent)
+    assert (res, consumed, len(sent)) == (lib.OCTV_ERROR_EOF, 64, 8), str((res, consumed, sent))
+
+    res, consumed = octv.octv_parse_full_buffer(test2, parser)
+    assert (res, consumed) == (0, 64), str((res, consumed))
+    print()
+
+    # Exercise the pull-style generators, early stop and file objects
+
+    first_two = list(itertools.islice(octv.iter_terminals('test2.octv', chunk_size=3), 2))
+    assert [type(terminal).__name__ for terminal in first_two] == ['OctvXSentinel', 'OctvXConfig'], str((first_two,))
+    with open('test2.octv', 'rb') as test_file:
+        flat_features = list(octv.iter_flat_features(test_file, chunk_size=7))
+    columns = octv_numpy.octv_decode_flat(test2)
+    for field in ('audio_frame_index', 'audio_sample_rate', 'num_detectors', 'audio_channel', 'audio_sample', 'type', 'frame_offset', 'detector_index'):
+        assert [flat_feature[field] for flat_feature in flat_features] == columns[field].tolist(), str((field, flat_features, columns[field]))
+    # bad version value, not a CONFIG, the payload itself is generated
+    terminals = [type(terminal).__name__ for terminal in octv.iter_terminals('test4.octv')]
+    assert terminals[:3] == ['OctvXSentinel', 'memoryview', 'OctvXMoment'], str((terminals,))
+    log(f'octv_test: iter_flat_features: {flat_features}')
+    print()
+
+    # Exercise OctvWriter, MOMENT is emitted when the low 16 bits of the frame index roll over
+
+    with open('test2.octv', 'rb') as test_file:
+        expected = test_file.read()
+    writer_file = io.BytesIO()
+    with octv.OctvWriter(writer_file, buffer_size=16) as writer:
+        writer.start_extent(2, 48000, 600)
+        writer.tick((2 << 16) | 513, 1, 0.75)
+        writer.feature(0x03, 15, 513, 1, 2, 4, 8)
+        writer.feature(0x23, 15, 513, 1, 2, 2052)
+        writer.feature(0x33, 15, 513, 513, 2052)
+        writer.end()
+    assert writer_file.getvalue() == expected, str((writer_file.getvalue(), expected))
+
+    writer_file = io.BytesIO()
+    with octv.OctvWriter(writer_file) as writer:
+        writer.start_extent(1, 48000, 1440)
+        for audio_frame_index in range((1 << 16) - 2, (1 << 16) + 2):
+            writer.tick(audio_frame_index, 0, 0.0)
+            writer.feature(0x30, 0, audio_frame_index % 1440, -1, -2)
+        writer.end()
+    terminals = octv_numpy.octv_decode(writer_file.getvalue())
+    assert terminals.moment['audio_frame_index_hi_bytes'].tolist() == [0, 1], str((terminals.moment,))
+    assert terminals.moment_index.tolist() == [2, 7], str((terminals.moment_index,))
+    columns = octv_numpy.octv_decode_flat(writer_file.getvalue())
+    assert columns.audio_frame_index.tolist() == list(range((1 << 16) - 2, (1 << 16) + 2)), str((columns.audio_frame_index,))
+    assert columns.level_3_int16_1.tolist() == [-2] * 4, str((columns.level_3_int16_1,))
+
+    # the vectorized encoder gives the same stream as OctvWriter
+    encoded = octv_numpy.octv_encode_flat(columns)
+    assert encoded.tobytes() == writer_file.getvalue(), str((encoded.tobytes(), writer_file.getvalue()))
+
+    # multiple channels per frame, a TICK for each, and a MOMENT for each change of the high bytes
+    columns = dict(
+        audio_frame_index = [5, 5, 5, 5, 1 << 16, 3 << 16],
+        audio_channel = [0, 0, 1, 1, 0, 0],
+        audio_sample = [0.5, 0.5, -0.5, -0.5, 0.25, 0.125],
+        type = [0x01, 0x21, 0x01, 0x31, 0x01, 0x01],
+        frame_offset = [0, 1, 2, 3, 4, 5],
+        detector_index = [10, 11, 12, 13, 14, 15],
+        level_0_int8_0 = [-1, 9, -3, 9, -5, -6],
+        level_2_int16_0 = [0, -300, 0, 0, 0, 0],
+        level_3_int16_1 = [0, 0, 0, 400, 0, 0],
+        )
+    encoded = octv_numpy.octv_encode_flat(columns, num_audio_channels=2, audio_sample_rate=96000, num_detectors=16)
+    terminals = octv_numpy.octv_decode(encoded.tobytes())
+    assert len(terminals.error) == 0 and len(terminals.end) == 1, str((terminals.error, terminals.end))
+    assert terminals.moment['audio_frame_index_hi_bytes'].tolist() == [0, 1, 3], str((terminals.moment,))
+    assert len(terminals.tick) == 4, str((terminals.tick,))
+    decoded = octv_numpy.octv_decode_flat(encoded.tobytes())
+    # level_* values that do not apply to the type are not encoded
+    for field, values in dict(columns, level_0_int8_0=[-1, 0, -3, 0, -5, -6]).items():
+        assert decoded[field].tolist() == values, str((field, decoded[field], values))
+    assert decoded.audio_sample_rate.tolist() == [96000] * 6, str((decoded.audio_sample_rate,))
+
+    for bad_feature in ((0x00, 0, 0), (0x40, 0, 0), (0x03, 0, 0, 1, 2, 3, 4, 5)):
+        try:
+            with octv.OctvWriter(io.BytesIO()) as writer:
+                writer.start_extent(1, 48000, 1440)
+                writer.tick(0, 0, 0.0)
+                writer.feature(*bad_feature)
+        except ValueError as error:
+            log(f'octv_test: OctvWriter: expected error: {error}')
+        else:
+            raise AssertionError(f'expected ValueError from OctvWriter.feature{bad_feature}')
+    print()
+
+    # Exercise OctvPushParser, byte-at-a-time chunks give the same flat features as whole-file decode
+
+    push_parser = octv_numpy.OctvPushParser()
+    batches = [push_parser.feed(test2[offset:offset+1]) for offset in range(len(test2))]
+    assert push_parser.num_pending == 0, str((push_parser.num_pending,))
+    assert sum(len(batch.terminals.payloads) for batch in batches) == 8, str((batches,))
+    columns = octv_numpy.octv_decode_flat(test2)
+    for field in octv_numpy.octv_flat_columns_fields:
+        pushed = [value for batch in batches for value in batch.flat[field].tolist()]
+        assert pushed == columns[field].tolist(), str((field, pushed, columns[field]))
+    print()
+
+    # Exercise octv_asyncio, one event loop reading several streams concurrently
+
+    async def read_streams(num_streams):
+        readers = [asyncio.StreamReader() for _ in range(num_streams)]
+        async def count_features(reader):
+            return len([feature async for feature in octv_asyncio.octv_aiter_flat_features(reader, chunk_size=24)])
+        tasks = [asyncio.create_task(count_features(reader)) for reader in readers]
+        for offset in range(0, len(test2), 5):
+            for reader in readers:
+                reader.feed_data(test2[offset:offset+5])
+            await asyncio.sleep(0)
+        for reader in readers:
+            reader.feed_eof()
+        return await asyncio.gather(*tasks)
+    counts = asyncio.run(read_streams(4))
+    log(f'octv_test: octv_asyncio: counts: {counts}')
+    assert counts == [3, 3, 3, 3], str((counts,))
+    print()
+
+    # Exercise octv_parse_batch(), one callback per batch of payloads
+
+    batches = list()
+    def send_batch(payloads_view):
+        batches.append([str(octv_x) for octv_x in octv.OctvX.iter_octv(payloads_view)])
+        return 0
+    with octv.open_file_c('test2.octv') as file_c:
+        res = octv.octv_parse_batch(file_c, send_batch, batch_size=3)
+    log(f'octv_test: octv_parse_batch: res: {res}, batches: {batches}')
+    assert res == lib.OCTV_ERROR_EOF, str((res,))
+    assert list(map(len, batches)) == [3, 3, 2], str((batches,))
+
+    def send_batch_numpy(payloads_view):
+        batches.append(octv_numpy.octv_payloads(payloads_view)['type'].tolist())
+        return lib.OCTV_ERROR_CLIENT if lib.OCTV_END_TYPE in batches[-1] else 0
+    batches = list()
+    with octv.open_file_c('test2.octv') as file_c:
+        res = octv.octv_parse_batch(file_c, send_batch_numpy, batch_size=5)
+    assert res == lib.OCTV_ERROR_CLIENT, str((res,))
+    assert batches == [[0x4f, 0x50, 0x60, 0x70, 0x03], [0x23, 0x33, 0x45]], str((batches,))
+    print()
+
+    # Exercise open_file_mmap, OctvX objects reference slices of the mapping
+
+    with open('test2.octv', 'rb') as test_file:
+        expected = [str(octv.OctvX.new_octv_bytes(payload)) for payload, in struct.iter_unpack('8s', test_file.read())]
+    with octv.open_file_mmap('test2.octv') as file_view:
+        octvs = list(octv.OctvX.iter_octv(file_view))
+        assert all(isinstance(octv_x.payload, memoryview) for octv_x in octvs), str((octvs,))
+        assert [str(octv_x) for octv_x in octvs] == expected, str((octvs, expected))
+        columns = octv_numpy.octv_flat_columns(octv_numpy.octv_decode(file_view))
+        del octvs, columns
+    log(f'octv_test: open_file_mmap: {expected}')
+
+    columns = octv_numpy.octv_decode_flat('test2.octv', mmap=True)
+    assert tuple(columns.audio_frame_index) == (131585, 131585, 131585), str((columns.audio_frame_index,))
+
+    print()
+
     print('OK')
 
 if main: